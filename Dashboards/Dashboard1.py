@@ -1,59 +1,37 @@
 import streamlit as st
 import pandas as pd
-import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-from sklearn.metrics import mean_squared_error, mean_absolute_error
-from statsmodels.tsa.arima.model import ARIMA
-import os
-
-# Optional libraries
-try:
-    from prophet import Prophet
-    PROPHET_AVAILABLE = True
-except Exception:
-    PROPHET_AVAILABLE = False
-
-try:
-    from keras.models import Sequential
-    from keras.layers import LSTM, Dense
-    TF_AVAILABLE = True
-except Exception:
-    TF_AVAILABLE = False
+from downsample import downsample
+from stats_cube import StatsCube
+from cleaning import valid_mask
+from instrument import stage
+from shared import (BACKEND, cached, cached_figure, current, dataset, end_rerun, get_cube, get_index,
+                    get_sql_store, plotly_chart, quality_counters, start_rerun)
 
 
 # ===============================================================
 # 🎨 Page Setup
 # ===============================================================
 st.set_page_config(page_title="Milestone 1 — Air Quality Dashboards", layout="wide")
+start_rerun("Dashboard1")
 st.title("🌍 Air Quality Monitoring & Forecasting Dashboard")
 
 
 
 # ===============================================================
-# 📂 Load Data (from either dataset)
+# 📂 Load Data (shared columnar store, see data_store.py)
 # ===============================================================
-@st.cache_data
-def load_data():
-    if os.path.exists("cleaned_air_quality_data.csv"):
-        df = pd.read_csv("cleaned_air_quality_data.csv")
-    elif os.path.exists("air_quality_data.csv"):
-        df = pd.read_csv("air_quality_data.csv")
-    else:
-        st.error("❌ No dataset found. Please upload your air quality CSV file.")
-        st.stop()
-
-    # Clean and normalize columns
-    df.columns = [c.strip().replace(" ", "_") for c in df.columns]
-    datetime_col = [c for c in df.columns if "date" in c.lower() or "time" in c.lower()]
-    if datetime_col:
-        df["Datetime"] = pd.to_datetime(df[datetime_col[0]], errors="coerce")
-    else:
-        df["Datetime"] = pd.date_range("2025-01-01", periods=len(df), freq="H")
-
-    return df
-
-df = load_data()
+# Process-wide singletons keyed on the data version (see shared.py)
+if BACKEND == "sqlite":
+    # Rows and aggregates are fetched per query from SQLite (see sql_store.py)
+    with stage("load") as s:
+        name, version = current()
+        index = get_sql_store(name, version)
+        df = s.record(index.frame())
+else:
+    name, version, df = dataset()
+    index = get_index(name, version)
 
 # ===============================================================
 # 🟢 M1: Air Quality Data Explorer
@@ -66,33 +44,63 @@ location_cols = [c for c in df.columns if c.lower() in ["location", "station", "
 has_location = len(location_cols) > 0
 pollutants = [c for c in df.columns if any(p in c for p in ["PM2.5", "PM10", "NO2", "O3", "SO2", "CO"])]
 
+# Per (city, day/month) partial aggregates; sync() folds in newly ingested partitions only
+with stage("aggregate:sync"):
+    if BACKEND == "sqlite":
+        cube = index.cube(pollutants)
+    else:
+        cube = get_cube(name, tuple(pollutants)).sync(name) if index is not None else None
+
     # Filter controls
 st.subheader("🎛️ Data Controls")
 col1, col2, col3 = st.columns(3)
 
 with col1:
         if has_location:
-            location = st.selectbox("📍 Select Location", df[location_cols[0]].dropna().unique())
+            cities = index.cities if index is not None else df[location_cols[0]].dropna().unique()
+            location = st.selectbox("📍 Select Location", cities)
         else:
             location = None
 with col2:
-        time_range = st.selectbox("⏱️ Time Range", ["Last 24 Hours", "Last 3 Days", "Last 7 Days"])
+        time_range = st.selectbox("⏱️ Time Range", ["Last 24 Hours", "Last 3 Days", "Last 7 Days", "All Time"])
 with col3:
         pollutant = st.selectbox("💨 Pollutant", pollutants)
 
     # Apply filter
 if st.button("✅ Apply Filters"):
-        filtered = df.copy()
-        if has_location and location:
-            filtered = filtered[filtered[location_cols[0]] == location]
-
-        pollutant_data = filtered[["Datetime", pollutant]].dropna()
+        with stage("filter") as s:
+            if index is not None and location:
+                # Zero-copy slice of the (City, Date) sorted frame
+                start, end = index.window(location, time_range)
+                filtered = index.query(location, start, end)
+            elif has_location and location:
+                filtered = df[df[location_cols[0]] == location]
+            else:
+                filtered = df
+            pollutant_data = filtered[["Date", pollutant]].dropna()
+            s.record(filtered)
+
+        with stage("aggregate:stats"):
+            if cube is not None and location:
+                stats = cached(("stats", name, version, location, time_range),
+                               lambda: cube.query(location, start, end))
+            else:
+                stats = StatsCube(filtered, pollutants, city_col=None).query()
 
         st.success("Filters Applied Successfully!")
 
-        # Data Quality
-        completeness = (len(pollutant_data) / len(filtered)) * 100 if len(filtered) > 0 else 0
-        validity = np.random.uniform(85, 99)
+        # Data Quality: precomputed counters over the raw readings (see cleaning.py)
+        quality = quality_counters() if index is not None and location else None
+        report = {}
+        if quality is not None and pollutant in quality.columns:
+            report = quality.query(location, start, end, pollutant)
+        completeness = report.get("completeness")
+        if completeness is None:
+            completeness = (len(pollutant_data) / len(filtered)) * 100 if len(filtered) > 0 else 0
+        validity = report.get("validity")
+        if validity is None:
+            values = pollutant_data[[pollutant]].to_numpy(dtype="float64")
+            validity = valid_mask(values, [pollutant]).mean() * 100 if len(values) else 0
 
         st.markdown("### 📊 Data Quality")
         c1, c2 = st.columns(2)
@@ -103,31 +111,46 @@ if st.button("✅ Apply Filters"):
 
         # 1️⃣ Time Series
         st.markdown("#### ⏱️ Time Series")
-        fig1 = px.line(pollutant_data, x="Datetime", y=pollutant,
-                       title=f"{pollutant} Concentration Over Time",
-                       markers=True, color_discrete_sequence=["#2ca02c"])
-        st.plotly_chart(fig1, use_container_width=True)
+        # LTTB keeps the shape within a fixed point budget; markers only for short series
+        with stage("aggregate:downsample") as s:
+            trace = s.record(cached(("trace", name, version, location, time_range, pollutant),
+                                    lambda: downsample(pollutant_data, "Date", [pollutant])))
+        # Figures are cached per query and data version (see figure_cache.py)
+        query = (name, version, location, time_range, pollutant)
+
+        def time_series_figure():
+            fig = px.line(trace, x="Date", y="Concentration",
+                          title=f"{pollutant} Concentration Over Time",
+                          markers=len(trace) <= 200, color_discrete_sequence=["#2ca02c"])
+            fig.update_layout(yaxis_title=pollutant)
+            return fig
+        fig1 = cached_figure(("time_series",) + query, time_series_figure)
+        plotly_chart(fig1, "time_series")
 
         # 2️⃣ Statistical Summary
         st.markdown("#### 📈 Statistical Summary")
-        summary = {
-            "Mean": pollutant_data[pollutant].mean(),
-            "Median": pollutant_data[pollutant].median(),
-            "Max": pollutant_data[pollutant].max(),
-            "Min": pollutant_data[pollutant].min(),
-            "Std Dev": pollutant_data[pollutant].std(),
-            "Data Points": len(pollutant_data)
-        }
+        # Merged from the cube's partials; the median is a sketch estimate (~1%)
+        summary = stats.describe(pollutant)
         st.dataframe(pd.DataFrame(summary, index=["Value"]).T)
 
         # 3️⃣ Pollutant Correlations
         st.markdown("#### 🔗 Pollutant Correlations")
-        corr_df = filtered[pollutants].corr()
-        fig_corr = px.imshow(corr_df, text_auto=True, title="Pollutant Correlation Heatmap",
-                             color_continuous_scale="Greens")
-        st.plotly_chart(fig_corr, use_container_width=True)
+        corr_df = stats.corr
+        fig_corr = cached_figure(("correlation",) + query[:4],
+                                 lambda: px.imshow(corr_df, text_auto=True, title="Pollutant Correlation Heatmap",
+                                                   color_continuous_scale="Greens"))
+        plotly_chart(fig_corr, "correlation")
 
         # 4️⃣ Distribution Analysis
         st.markdown("#### 📊 Distribution Analysis")
-        fig_dist = px.histogram(pollutant_data, x=pollutant, nbins=20, color_discrete_sequence=["#2ca02c"])
-        st.plotly_chart(fig_dist, use_container_width=True)
+        def distribution_figure():
+            hist = stats.histogram(pollutant, nbins=20)
+            fig = px.bar(hist, x=(hist["Start"] + hist["End"]) / 2, y="Count",
+                         color_discrete_sequence=["#2ca02c"])
+            fig.update_traces(width=(hist["End"] - hist["Start"]).to_numpy())
+            fig.update_layout(xaxis_title=pollutant, yaxis_title="count", bargap=0)
+            return fig
+        fig_dist = cached_figure(("distribution",) + query, distribution_figure)
+        plotly_chart(fig_dist, "distribution")
+
+end_rerun()
@@ -3,57 +3,29 @@ import pandas as pd
 import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
-from sklearn.metrics import mean_squared_error, mean_absolute_error
-from statsmodels.tsa.arima.model import ARIMA
-import os
-
-# Optional libraries
-try:
-    from prophet import Prophet
-    PROPHET_AVAILABLE = True
-except Exception:
-    PROPHET_AVAILABLE = False
-
-try:
-    from keras.models import Sequential
-    from keras.layers import LSTM, Dense
-    TF_AVAILABLE = True
-except Exception:
-    TF_AVAILABLE = False
+from forecasting import GLOBAL, get_forecast, city_series, performance_table, best_models
+from backtest import KIND as BACKTEST, accuracy_frame
+from backends import available
+from instrument import stage
+from shared import cached, dataset, end_rerun, get_index, get_registry, plotly_chart, start_rerun
 
 
 # ===============================================================
 # 🎨 Page Setup
 # ===============================================================
 st.set_page_config(page_title="Milestone 2 — Air Quality Dashboards", layout="wide")
+start_rerun("Dashboard2")
 st.title("🌍 Air Quality Monitoring & Forecasting Dashboard")
 
 
 
 # ===============================================================
-# 📂 Load Data (from either dataset)
+# 📂 Load Data (shared columnar store, see data_store.py)
 # ===============================================================
-@st.cache_data
-def load_data():
-    if os.path.exists("cleaned_air_quality_data.csv"):
-        df = pd.read_csv("cleaned_air_quality_data.csv")
-    elif os.path.exists("air_quality_data.csv"):
-        df = pd.read_csv("air_quality_data.csv")
-    else:
-        st.error("❌ No dataset found. Please upload your air quality CSV file.")
-        st.stop()
-
-    # Clean and normalize columns
-    df.columns = [c.strip().replace(" ", "_") for c in df.columns]
-    datetime_col = [c for c in df.columns if "date" in c.lower() or "time" in c.lower()]
-    if datetime_col:
-        df["Datetime"] = pd.to_datetime(df[datetime_col[0]], errors="coerce")
-    else:
-        df["Datetime"] = pd.date_range("2025-01-01", periods=len(df), freq="H")
-
-    return df
-
-df = load_data()
+# Process-wide singletons keyed on the data version (see shared.py)
+name, version, df = dataset()
+index = get_index(name, version)
+registry = get_registry()
 
 # ===============================================================
 # 🔵 M2: Air Quality Forecast Engine
@@ -62,13 +34,18 @@ df = load_data()
 st.header("🔵 Air Quality Forecast Engine")
 
 metric_choice = st.radio("📏 Choose Evaluation Metric", ["RMSE", "MAE"], horizontal=True)
+city_select = st.selectbox("📍 Select City", index.cities)
 
 pollutants = ["PM2.5", "PM10", "NO2", "O3", "SO2"]
-models = ["ARIMA", "Prophet", "LSTM"]
+models = ["ARIMA", "Prophet", "LSTM", GLOBAL]  # Global: one cross-city model (global_model.py)
 
-np.random.seed(42)
-performance_data = {m: np.random.uniform(2, 8, len(pollutants)) for m in models}
-df_perf = pd.DataFrame(performance_data, index=pollutants)
+# Holdout metrics written by train_models.py into the model registry
+with stage("aggregate:performance") as s:
+    perf = s.record(cached(("performance", version, city_select),
+                           lambda: performance_table(city_select, pollutants, models, registry=registry)))
+df_perf = perf.pivot(index="Pollutant", columns="Model", values=metric_choice).reindex(index=pollutants, columns=models)
+if perf[metric_choice].isna().all():
+        st.info(f"No trained models for {city_select} yet. Run `python train_models.py` to train them.")
 
     # 1️⃣ Model Performance
 st.markdown("#### 📊 Model Performance Comparison")
@@ -77,7 +54,7 @@ for model in models:
         fig_perf.add_trace(go.Bar(name=model, x=pollutants, y=df_perf[model]))
 fig_perf.update_layout(barmode='group', yaxis_title=metric_choice,
                            title=f"{metric_choice} by Model and Pollutant")
-st.plotly_chart(fig_perf, use_container_width=True)
+plotly_chart(fig_perf, "performance")
 
     # 2️⃣ PM2.5 Forecast
 st.markdown("#### 🔮 PM2.5 Forecast")
@@ -87,34 +64,46 @@ with colA:
 with colB:
         horizon = st.selectbox("Forecast Horizon", ["12h", "24h", "48h"])
 
-x = pd.date_range("2025-11-06", periods=10, freq="3H")
-actual = np.random.uniform(30, 50, len(x))
-forecast = actual + np.random.normal(0, 2, len(x))
-fig_forecast = go.Figure()
-fig_forecast.add_trace(go.Scatter(x=x, y=actual, mode='lines+markers', name='Actual', line=dict(color='blue')))
-fig_forecast.add_trace(go.Scatter(x=x, y=forecast, mode='lines+markers', name='Forecast', line=dict(color='orange')))
-fig_forecast.add_trace(go.Scatter(x=x, y=forecast + 3, mode='lines', name='Upper CI', line=dict(dash='dot')))
-fig_forecast.add_trace(go.Scatter(x=x, y=forecast - 3, mode='lines', name='Lower CI', line=dict(dash='dot')))
-fig_forecast.update_layout(title=f"PM2.5 Forecast ({model_select}, Horizon: {horizon})")
-st.plotly_chart(fig_forecast, use_container_width=True)
+# Served from the model registry; a page view never fits a model
+with stage("model:forecast") as s:
+    forecast = s.record(cached(("forecast", name, version, city_select, model_select, horizon),
+                               lambda: get_forecast(df, city_select, "PM2.5", model_select, horizon,
+                                                    index=index, registry=registry)))
+if forecast is None:
+        # The global model falls back to scikit-learn when XGBoost is missing
+        missing = "" if model_select == GLOBAL or available(model_select) else \
+            f" ({model_select}'s library is not installed on this server.)"
+        st.info(f"No trained {model_select} model for PM2.5 in {city_select} yet.{missing}")
+else:
+        actual = city_series(df, city_select, "PM2.5", index=index).tail(30)
+        fig_forecast = go.Figure()
+        fig_forecast.add_trace(go.Scatter(x=actual.index, y=actual.values, mode='lines+markers', name='Actual', line=dict(color='blue')))
+        fig_forecast.add_trace(go.Scatter(x=forecast["Date"], y=forecast["Forecast"], mode='lines+markers', name='Forecast', line=dict(color='orange')))
+        fig_forecast.add_trace(go.Scatter(x=forecast["Date"], y=forecast["Upper"], mode='lines', name='Upper CI', line=dict(dash='dot')))
+        fig_forecast.add_trace(go.Scatter(x=forecast["Date"], y=forecast["Lower"], mode='lines', name='Lower CI', line=dict(dash='dot')))
+        fig_forecast.update_layout(title=f"PM2.5 Forecast — {city_select} ({model_select}, Horizon: {horizon})")
+        plotly_chart(fig_forecast, "forecast")
 
     # 3️⃣ Best Model by Pollutant
 st.markdown("#### 🏆 Best Model by Pollutant")
-best_models = pd.DataFrame({
-        "Pollutant": pollutants,
-        "Best Model": np.random.choice(models, len(pollutants)),
-        "RMSE": np.round(np.random.uniform(2, 7, len(pollutants)), 2),
-        "Status": ["Active"] * len(pollutants)
-    })
-st.dataframe(best_models)
+st.dataframe(best_models(perf, metric_choice))
 
     # 4️⃣ Forecast Accuracy
 st.markdown("#### 📈 Forecast Accuracy")
-horizons = [1, 3, 6, 12, 24, 48]
-acc = {m: 100 - np.array(horizons) * np.random.uniform(0.3, 0.8) for m in models}
+# Rolling-origin backtest results cached by backtest.py per data version
+with stage("aggregate:accuracy") as s:
+    acc = s.record(cached(("accuracy", version, city_select),
+                          lambda: accuracy_frame(registry.latest(city_select, "PM2.5", BACKTEST))))
+if acc.empty:
+        st.info(f"No backtest for {city_select} yet. Run `python backtest.py` to compute it.")
+# Horizons are in hours; daily series are scored at whole days
+days = not acc.empty and (acc.index % 24 == 0).all()
 fig_acc = go.Figure()
-for m in models:
-        fig_acc.add_trace(go.Scatter(x=horizons, y=acc[m], mode='lines+markers', name=m))
-fig_acc.update_layout(title="Forecast Accuracy Over Time",
-                          xaxis_title="Forecast Horizon (h)", yaxis_title="Accuracy (%)")
-st.plotly_chart(fig_acc, use_container_width=True)
+for m in acc.columns:
+        fig_acc.add_trace(go.Scatter(x=acc.index // 24 if days else acc.index, y=acc[m],
+                                     mode='lines+markers', name=m))
+fig_acc.update_layout(title=f"PM2.5 Forecast Accuracy Over Time — {city_select}",
+                          xaxis_title=f"Forecast Horizon ({'days' if days else 'h'})", yaxis_title="Accuracy (%)")
+plotly_chart(fig_acc, "accuracy")
+
+end_rerun()
@@ -3,11 +3,20 @@ import pandas as pd
 import numpy as np
 import plotly.express as px
 import datetime
+from data_store import RAW_CSV
+from ingest import ingest_frame
+from snapshots import snapshot_version
+from aqi import AQI_MAX, category_of
+from alerts import forecast_peaks
+from instrument import METRICS, PROFILES, TRACES, prometheus_text, stage
+from shared import (BACKEND, cached, cached_figure, current, dataset, end_rerun, get_alert_engine, get_data,
+                    get_index, get_rollups, get_sql_store, latest_snapshot, plotly_chart, start_rerun)
 
 # -------------------------------------------------
 # Page Configuration
 # -------------------------------------------------
 st.set_page_config(page_title="Streamlit Web Dashboard", layout="wide")
+start_rerun("Dashboard4")
 
 st.title("🌤️ Streamlit Web Dashboard")
 st.subheader("Milestone 4: Working Application (Weeks 7–8)")
@@ -15,25 +24,37 @@ st.subheader("Milestone 4: Working Application (Weeks 7–8)")
 # -------------------------------------------------
 # Load Data
 # -------------------------------------------------
-@st.cache_data
-def load_data():
-    df = pd.read_csv("air_quality_data.csv")
-    # Ensure date column exists
-    if 'Date' in df.columns:
-        df['Date'] = pd.to_datetime(df['Date'])
-    return df
+# Process-wide singletons keyed on the data version (see shared.py), so
+# partitions appended through the admin upload are picked up; "Date" is already parsed
+if BACKEND == "sqlite":
+    # Station/time-range rows and trend aggregates come from SQLite (see sql_store.py)
+    with stage("load") as s:
+        name, version = current(RAW_CSV)
+        index = get_sql_store(name, version)
+        df, latest_rows = s.record(index.frame()), index.tail(2)
+else:
+    name, version, df = dataset(RAW_CSV)
+    index = get_index(name, version)
+    latest_rows = df
 
-df = load_data()
+# Alerts precomputed by scheduler.py, if it is running
+snapshot = latest_snapshot(name, version)
+if snapshot is None:
+    # Shared across sessions and pages; evaluated once per data version and on ingest
+    with stage("model:alerts"):
+        alert_engine = get_alert_engine(name)
+        alert_engine.sync(latest_rows, version, cached(("forecast_peaks", name, version),
+                                                       lambda: forecast_peaks(index.cities)))
 
 # -------------------------------------------------
 # Sidebar Controls
 # -------------------------------------------------
 st.sidebar.header("⚙️ Controls")
 
-stations = df["City"].unique().tolist() if "City" in df.columns else ["Unknown"]
+stations = index.cities
 station = st.sidebar.selectbox("Monitoring Station", stations)
 
-time_range = st.sidebar.selectbox("Time Range", ["Last 24 Hours", "Last 7 Days", "Last 30 Days"])
+time_range = st.sidebar.selectbox("Time Range", ["Last 24 Hours", "Last 7 Days", "Last 30 Days", "All Time"])
 pollutant = st.sidebar.selectbox("Pollutant", ["PM2.5", "PM10", "NO2", "O3"])
 forecast_horizon = st.sidebar.selectbox("Forecast Horizon", ["12 Hours", "24 Hours", "48 Hours"])
 
@@ -44,41 +65,45 @@ admin_mode = st.sidebar.toggle("Admin Mode")
 # -------------------------------------------------
 # Filter Data
 # -------------------------------------------------
-station_data = df[df["City"] == station].copy()
-
-if not station_data.empty and "Date" in station_data.columns:
-    station_data = station_data.sort_values("Date", ascending=False)
+# Rows come back sorted by Date (oldest first) as a view, no copy or re-sort
+with stage("filter") as s:
+    station_data = s.record(index.query_range(station, time_range))
 
 # -------------------------------------------------
 # Current AQI
 # -------------------------------------------------
 st.markdown("### Current Air Quality")
 
-if not station_data.empty and "AQI" in station_data.columns:
-    current_aqi = station_data.iloc[0]["AQI"]
+# Latest reported AQI; the raw dataset has gaps, so skip missing values
+reported_aqi = station_data["AQI"].dropna() if "AQI" in station_data.columns else []
+current_aqi = None
+if len(reported_aqi):
+    current_aqi = reported_aqi.iloc[-1]
+elif snapshot is not None and station in snapshot["stations"].index:
+    current_aqi = snapshot["stations"].at[station, "AQI"]  # latest reading outside the time range
+if current_aqi is not None and pd.isna(current_aqi):
+    current_aqi = None
+
+if current_aqi is None:
+    aqi_status = "Unknown"
+    st.info(f"No AQI reported for {station}.")
 else:
-    current_aqi = np.random.randint(30, 150)
-
-aqi_status = (
-    "Good" if current_aqi <= 50 else
-    "Moderate" if current_aqi <= 100 else
-    "Unhealthy"
-)
-
-# AQI gauge chart
-fig_gauge = px.pie(
-    values=[current_aqi, 150 - current_aqi],
-    names=["AQI", ""],
-    hole=0.7,
-    color_discrete_sequence=["orange" if aqi_status == "Moderate" else "green", "#f0f0f0"]
-)
-fig_gauge.update_layout(
-    annotations=[dict(text=f"<b>{int(current_aqi)}</b><br>{aqi_status}", x=0.5, y=0.5, showarrow=False)],
-    showlegend=False,
-    margin=dict(t=20, b=20)
-)
-
-st.plotly_chart(fig_gauge, use_container_width=True)
+    aqi_status, aqi_color = category_of(current_aqi)
+
+    # AQI gauge chart
+    fig_gauge = px.pie(
+        values=[current_aqi, max(AQI_MAX - current_aqi, 0)],
+        names=["AQI", ""],
+        hole=0.7,
+        color_discrete_sequence=[aqi_color, "#f0f0f0"]
+    )
+    fig_gauge.update_layout(
+        annotations=[dict(text=f"<b>{int(current_aqi)}</b><br>{aqi_status}", x=0.5, y=0.5, showarrow=False)],
+        showlegend=False,
+        margin=dict(t=20, b=20)
+    )
+
+    plotly_chart(fig_gauge, "gauge")
 
 # -------------------------------------------------
 # PM2.5 Forecast
@@ -86,14 +111,14 @@ st.plotly_chart(fig_gauge, use_container_width=True)
 st.markdown("### PM2.5 Forecast")
 
 if not station_data.empty and "PM2.5" in station_data.columns:
-    recent = station_data.head(10)
-    forecast = recent.copy()
-    forecast["Date"] = forecast["Date"] + pd.to_timedelta(np.arange(len(forecast)), "h")
-    forecast["PM2.5"] = forecast["PM2.5"].rolling(3, min_periods=1).mean()
+    # Derived straight from the 10-row view; the station rows are never copied
+    recent = station_data.tail(10)
+    forecast_dates = recent["Date"] + pd.to_timedelta(np.arange(len(recent)), "h")
+    forecast_pm25 = recent["PM2.5"].rolling(3, min_periods=1).mean()
 
     fig_forecast = px.line(recent, x="Date", y="PM2.5", markers=True, title="PM2.5 Historical vs Forecast")
-    fig_forecast.add_scatter(x=forecast["Date"], y=forecast["PM2.5"], mode="lines+markers", name="Forecast", line=dict(dash="dot"))
-    st.plotly_chart(fig_forecast, use_container_width=True)
+    fig_forecast.add_scatter(x=forecast_dates, y=forecast_pm25, mode="lines+markers", name="Forecast", line=dict(dash="dot"))
+    plotly_chart(fig_forecast, "forecast")
 else:
     st.warning("No PM2.5 data available for this station.")
 
@@ -104,19 +129,27 @@ else:
 st.markdown("### Pollutant Trends")
 
 pollutants = [col for col in ["PM2.5", "PM10", "NO2", "O3"] if col in df.columns]
+
 if pollutants:
-    # Melt the dataframe for easier plotting
-    trend_df = df.melt(id_vars=["Date", "City"], value_vars=pollutants,
-                       var_name="Pollutant", value_name="Concentration")
-    
-    fig_trends = px.line(
+    # Daily/weekly/monthly rollups across all stations, reduced to a point
+    # budget; narrowing the zoom window re-queries at a finer resolution
+    first_day, last_day = (d.date() for d in index.date_bounds())
+    zoom = st.slider("Zoom", min_value=first_day, max_value=last_day, value=(first_day, last_day))
+    rollups = index.rollups(pollutants) if BACKEND == "sqlite" else get_rollups(name, version, tuple(pollutants))
+    with stage("aggregate:trends") as s:
+        trend_df, resolution = cached(("trends", name, version, zoom),
+                                      lambda: rollups.query(start=zoom[0], end=zoom[1]))
+        s.record(trend_df)
+
+    # Cached per zoom window and data version (see figure_cache.py)
+    fig_trends = cached_figure(("trends", name, version, zoom), lambda: px.line(
         trend_df,
         x="Date",
         y="Concentration",
         color="Pollutant",
-        title="Pollutant Trends Over Time"
-    )
-    st.plotly_chart(fig_trends, use_container_width=True)
+        title=f"Pollutant Trends Over Time (all stations, {resolution} mean)"
+    ))
+    plotly_chart(fig_trends, "trends")
 else:
     st.warning("No pollutant data available for trends.")
 
@@ -125,16 +158,15 @@ else:
 # -------------------------------------------------
 st.markdown("### 🔔 Alert Notifications")
 
-alerts = []
-if current_aqi > 100:
-    alerts.append(("⚠️ Moderate air quality expected", "Tomorrow, 10:00 AM"))
-elif current_aqi <= 50:
-    alerts.append("Good quality")
-alerts.append(("✅ Good air quality today", "Today, 8:00 AM"))
-alerts.append(("🔄 Model update completed", "Yesterday, 11:30 PM"))
+if snapshot is not None:
+    alerts = [a for a in snapshot["alerts"] if a["city"] == station]
+else:
+    alerts = alert_engine.active_alerts(station)
+if not alerts:
+    st.info(f"**✅ No active alerts for {station}** — *{aqi_status} air quality*")
 
-for alert, time in alerts:
-    st.info(f"**{alert}** — *{time}*")
+for alert in alerts:
+    st.info(f"**⚠️ {alert['message']}** — *{alert['time']:%a, %d %b %Y}*")
 
 # -------------------------------------------------
 # Admin Mode
@@ -147,4 +179,59 @@ if admin_mode:
         new_df = pd.read_csv(uploaded_file)
         st.success(f"✅ Uploaded new dataset with {len(new_df)} rows.")
         st.dataframe(new_df.head())
-        st.info("You can now retrain your model with the new data (simulated).")
+        if st.button("Append to dataset"):
+            try:
+                stats = ingest_frame(new_df, RAW_CSV)
+            except ValueError as exc:
+                st.error(f"❌ {exc}")
+            else:
+                st.success(f"✅ Appended {stats['appended']} rows "
+                           f"({stats['duplicates']} duplicates, {stats['invalid']} invalid skipped).")
+                if snapshot_version(name) is not None:
+                    # scheduler.py cleans the new partitions and updates the models off the request path
+                    st.info("🕒 The background scheduler will clean the new rows and update the forecasting "
+                            "models on its next run.")
+                else:
+                    # No scheduler running: clean the new raw partitions, then bring the trained models
+                    # forward (state update / fine-tune; a full refit only where drift is detected)
+                    from cleaning import sync
+                    from train_models import update_all
+                    with st.spinner("Updating forecasting models with the new data..."), stage("model:update"):
+                        sync(RAW_CSV)
+                        cleaned = get_data(*current())
+                        updates = update_all(cleaned, cities=list(new_df["City"].dropna().unique()),
+                                             verbose=False)
+                    updates = updates[updates["Status"] != "untrained"]
+                    if updates.empty:
+                        st.info("No trained models for the uploaded cities yet. "
+                                "Run `python train_models.py` to train them.")
+                    else:
+                        counts = updates["Status"].value_counts()
+                        st.success("✅ Models refreshed: "
+                                   + ", ".join(f"{n} {status}" for status, n in counts.items()))
+                        st.dataframe(updates.drop(columns="Error"), hide_index=True)
+
+    # Stage timings of every page in this server process (see instrument.py)
+    st.markdown("#### ⏱️ Performance")
+    stage_stats = pd.DataFrame(METRICS.stages())
+    if stage_stats.empty:
+        st.info("No stage timings recorded yet.")
+    else:
+        st.markdown("**Slowest stages** (mean per call, all sessions)")
+        st.dataframe(stage_stats.head(15), hide_index=True)
+    recent_runs = pd.DataFrame([
+        {"page": t.page, "seconds": t.seconds,
+         "slowest stages": ", ".join(f"{s.name} {s.seconds * 1000:.0f} ms" for s in t.slowest(3))}
+        for t in reversed(list(TRACES))
+    ][:10])
+    if not recent_runs.empty:
+        st.markdown("**Recent runs**")
+        st.dataframe(recent_runs, hide_index=True)
+    st.toggle("Profile each rerun (cProfile, or pyinstrument if installed)", key="profile_reruns")
+    if PROFILES:
+        latest = PROFILES[-1]
+        with st.expander(f"Latest profile — {latest['page']}, {datetime.datetime.fromtimestamp(latest['time']):%H:%M:%S}"):
+            st.code(latest["report"])
+    st.download_button("Download metrics (Prometheus text)", prometheus_text(), file_name="metrics.txt")
+
+end_rerun()
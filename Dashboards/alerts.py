@@ -0,0 +1,273 @@
+"""
+Rule-based alert engine for the dashboards.
+
+Rules are evaluated over the latest reading of every city at once: each rule
+turns one column into a NumPy array and compares it with its threshold, so a
+tick over hundreds of stations costs a few vector operations.  Per rule and
+city the engine remembers whether the alert is active; an alert fires only on
+a new crossing, stays active until the value drops below the rule's clear
+level (hysteresis), and cannot re-fire within the rule's cooldown (dedup).
+
+Fired alerts are pushed to subscribers.  Async consumers iterate a
+subscription with ``async for``; Streamlit pages call ``drain()`` on theirs
+or read ``active_alerts()``.
+"""
+
+import asyncio
+import threading
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from aqi import CATEGORY_COLORS
+
+SEVERITY_ORDER = {"critical": 0, "warning": 1, "info": 2}
+
+
+# -------------------------------------------------
+# Rules
+# -------------------------------------------------
+class Rule:
+    """
+    Fires when ``column`` reaches ``threshold`` and clears below ``clear``.
+    Subclasses change which value is compared: the reading itself, its
+    change since the previous reading, or a forecast.
+    """
+
+    source = "reading"
+
+    def __init__(self, name, column, threshold, clear=None, message="",
+                 severity="warning", color="#FF9933", cooldown="1D"):
+        self.name = name
+        self.column = column
+        self.threshold = threshold
+        self.clear = threshold if clear is None else clear
+        self.message = message or f"{column} above {threshold}"
+        self.severity = severity
+        self.color = color
+        self.cooldown = pd.Timedelta(cooldown)
+
+    def values(self, current, previous, forecasts):
+        if self.column not in current.columns:
+            return np.full(len(current), np.nan)
+        return current[self.column].to_numpy(dtype="float64")
+
+
+class ThresholdRule(Rule):
+    pass
+
+
+class RateOfChangeRule(Rule):
+    """Fires when ``column`` rises by at least ``threshold`` since the previous reading."""
+
+    source = "change"
+
+    def values(self, current, previous, forecasts):
+        if self.column not in current.columns:
+            return np.full(len(current), np.nan)
+        prev = previous.reindex(current.index)[self.column] if self.column in previous.columns else np.nan
+        return (current[self.column] - prev).to_numpy(dtype="float64")
+
+
+class ForecastRule(Rule):
+    """Fires when the forecast peak of ``column`` reaches ``threshold``."""
+
+    source = "forecast"
+
+    def values(self, current, previous, forecasts):
+        if forecasts is None or self.column not in forecasts.columns:
+            return np.full(len(current), np.nan)
+        return forecasts.reindex(current.index)[self.column].to_numpy(dtype="float64")
+
+
+DEFAULT_RULES = [
+    ThresholdRule("aqi_very_poor", "AQI", 301, clear=281, severity="critical",
+                  message="Very Poor air quality", color=CATEGORY_COLORS["Very Poor"]),
+    ThresholdRule("aqi_poor", "AQI", 201, clear=181,
+                  message="Poor air quality", color=CATEGORY_COLORS["Poor"]),
+    ThresholdRule("pm25_high", "PM2.5", 90, clear=80,
+                  message="High PM2.5 levels", color=CATEGORY_COLORS["Poor"]),
+    ThresholdRule("o3_high", "O3", 168, clear=150,
+                  message="High Ozone Levels", color="#FF6666"),
+    RateOfChangeRule("aqi_spike", "AQI", 50, clear=25,
+                     message="Sharp rise in AQI", color=CATEGORY_COLORS["Moderate"]),
+    ForecastRule("pm25_forecast", "PM2.5", 90, clear=80,
+                 message="High PM2.5 expected", color=CATEGORY_COLORS["Poor"]),
+]
+
+
+# -------------------------------------------------
+# Subscriptions
+# -------------------------------------------------
+class Subscription:
+    """Bounded alert queue; iterate with ``async for`` or poll with ``drain()``."""
+
+    def __init__(self, engine, maxsize=1000):
+        self._engine = engine
+        self._queue = asyncio.Queue(maxsize)
+        self._loop = None
+
+    def _push(self, alert):
+        loop = self._loop
+        if loop is not None and loop.is_running():
+            loop.call_soon_threadsafe(self._put, alert)
+        else:
+            self._put(alert)
+
+    def _put(self, alert):
+        if self._queue.full():
+            self._queue.get_nowait()  # drop the oldest rather than block the engine
+        self._queue.put_nowait(alert)
+
+    def drain(self):
+        """All alerts received since the last call, without waiting."""
+        out = []
+        while not self._queue.empty():
+            out.append(self._queue.get_nowait())
+        return out
+
+    def close(self):
+        self._engine.unsubscribe(self)
+
+    def __aiter__(self):
+        self._loop = asyncio.get_running_loop()
+        return self
+
+    async def __anext__(self):
+        return await self._queue.get()
+
+
+# -------------------------------------------------
+# Engine
+# -------------------------------------------------
+class AlertEngine:
+    def __init__(self, rules=None, history=200):
+        self.rules = list(DEFAULT_RULES if rules is None else rules)
+        self._active = {r.name: pd.Series(dtype=bool) for r in self.rules}
+        self._last_fired = {r.name: pd.Series(dtype="datetime64[ns]") for r in self.rules}
+        self._alerts = {}  # (rule, city) -> alert dict while active
+        self._last = pd.DataFrame()
+        self.history = deque(maxlen=history)
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self.version = None
+
+    # -- subscriptions ---------------------------------------------------
+    def subscribe(self, maxsize=1000):
+        sub = Subscription(self, maxsize)
+        with self._lock:
+            self._subscribers.append(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+
+    # -- evaluation ------------------------------------------------------
+    def evaluate(self, readings, forecasts=None):
+        """
+        Evaluate all rules on ``readings`` (one or more rows per city with a
+        City and Date column) and return the newly fired alerts.
+        ``forecasts`` is an optional frame indexed by City with the forecast
+        peak per pollutant.
+        """
+        if readings.empty:
+            return []
+        rows = readings.assign(City=readings["City"].astype(str)).sort_values(["City", "Date"], kind="stable")
+        if not self._last.empty:
+            # Readings already evaluated (e.g. a replayed tick) are not re-scored
+            seen = rows["City"].map(self._last["Date"]).to_numpy(dtype="datetime64[ns]")
+            rows = rows[np.isnat(seen) | (rows["Date"].to_numpy(dtype="datetime64[ns]") > seen)]
+            if rows.empty:
+                return []
+        grouped = rows.groupby("City", observed=True, sort=False)
+        current = grouped.tail(1).set_index("City")
+        previous = grouped.nth(-2).set_index("City")
+        if not self._last.empty:
+            previous = previous.combine_first(self._last.reindex(current.index))
+
+        cities = current.index
+        times = current["Date"].to_numpy(dtype="datetime64[ns]")
+        fired = []
+        with self._lock:
+            for rule in self.rules:
+                values = rule.values(current, previous, forecasts)
+                prev_active = self._active[rule.name].reindex(cities, fill_value=False).to_numpy(dtype=bool)
+                on = values >= rule.threshold
+                off = ~(values >= rule.clear)  # NaN clears
+                active = np.where(prev_active, ~off, on)
+                new = active & ~prev_active
+
+                last = self._last_fired[rule.name].reindex(cities).to_numpy(dtype="datetime64[ns]")
+                cooled = np.isnat(last) | (times - last >= rule.cooldown.to_timedelta64())
+                new &= cooled
+
+                for city in cities[~active & prev_active]:
+                    self._alerts.pop((rule.name, city), None)
+                for i in np.flatnonzero(new):
+                    alert = {"rule": rule.name, "city": cities[i], "severity": rule.severity,
+                             "message": rule.message, "value": float(values[i]),
+                             "time": pd.Timestamp(times[i]), "color": rule.color, "source": rule.source}
+                    self._alerts[(rule.name, cities[i])] = alert
+                    fired.append(alert)
+
+                self._active[rule.name] = _merge(self._active[rule.name], pd.Series(active, index=cities))
+                if new.any():
+                    self._last_fired[rule.name] = _merge(
+                        self._last_fired[rule.name], pd.Series(times[new], index=cities[new]))
+
+            self._last = current if self._last.empty else current.combine_first(self._last)
+            self.history.extend(fired)
+            subscribers = list(self._subscribers)
+
+        for alert in fired:
+            for sub in subscribers:
+                sub._push(alert)
+        return fired
+
+    def sync(self, df, version, forecasts=None):
+        """Evaluate ``df`` once per data version (no-op if already synced)."""
+        if version == self.version:
+            return []
+        fired = self.evaluate(df, forecasts)
+        self.version = version
+        return fired
+
+    def active_alerts(self, city=None):
+        """Currently active alerts, most severe and most recent first."""
+        with self._lock:
+            alerts = [a for a in self._alerts.values() if city is None or a["city"] == city]
+        return sorted(alerts, key=lambda a: (SEVERITY_ORDER.get(a["severity"], 9), -a["time"].value))
+
+
+def _merge(old, new):
+    return new if old.empty else new.combine_first(old)
+
+
+def watch_ingest(engine, name=None):
+    """Evaluate ``engine`` on every batch appended by ``ingest.py`` in this process."""
+    from ingest import on_ingest
+
+    @on_ingest
+    def _evaluate(dataset, rows):
+        if name is None or dataset == name:
+            engine.evaluate(rows)
+    return _evaluate
+
+
+def forecast_peaks(cities, pollutants=("PM2.5",), model="ARIMA", registry=None):
+    """Forecast maximum per city and pollutant from the model registry."""
+    from forecasting import ModelRegistry
+
+    registry = registry or ModelRegistry()
+    rows = {}
+    for city in cities:
+        row = {}
+        for pollutant in pollutants:
+            entry = registry.latest(city, pollutant, model)
+            if entry is not None:
+                row[pollutant] = max(entry["forecast"]["Forecast"])
+        rows[city] = row
+    return pd.DataFrame.from_dict(rows, orient="index", columns=list(pollutants))
@@ -0,0 +1,296 @@
+"""
+Headless JSON API over the dashboard queries.
+
+    GET /api/cities
+    GET /api/aqi                          current AQI per city (Dashboard4)
+    GET /api/series/{city}?pollutant=PM2.5&range=Last 7 Days
+    GET /api/stats/{city}?range=All Time  summary and correlations (Dashboard1)
+    GET /api/forecast/{city}?pollutant=PM2.5&model=ARIMA&horizon=24h
+    GET /api/alerts?city=Delhi            active alerts (Dashboard3)
+    GET /metrics                          stage timings, Prometheus text format
+
+Every endpoint takes ``dataset=cleaned|raw``.  Frames are sent column by
+column (``{"columns": [...], "data": {column: [values]}}``).
+
+A response is computed once per (endpoint, parameters, data version) in a
+worker thread, serialized, gzip-compressed and kept in a ``QueryCache``.
+Repeated requests are then a dictionary lookup: the cached bytes carry an
+ETag (data version + body hash) and Last-Modified (last ingest), so clients
+and CDNs revalidate with ``304 Not Modified``.
+
+    uvicorn api:app --port 8000 --workers 4
+    python api.py --port 8000
+"""
+
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import time
+from collections import namedtuple
+from email.utils import formatdate, parsedate_to_datetime
+
+import numpy as np
+import pandas as pd
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.routing import Route
+
+from data_store import CLEANED_CSV, RAW_CSV, data_version, last_modified, load_data, resolve_name
+from station_index import StationIndex, TIME_RANGES
+from query_cache import QueryCache
+from aqi import categorize
+from instrument import prometheus_text, stage
+
+DATASETS = {"cleaned": CLEANED_CSV, "raw": RAW_CSV}
+STATS_POLLUTANTS = ("PM2.5", "PM10", "NO2", "CO", "SO2", "O3")
+CACHE_SECONDS = 60       # TTL of cached responses and the Cache-Control max-age
+VERSION_CHECK_SECONDS = 1.0
+MIN_GZIP_BYTES = 512
+
+Payload = namedtuple("Payload", "body gzipped etag modified")
+
+
+# -------------------------------------------------
+# Serialization
+# -------------------------------------------------
+def columnar(frame):
+    """DataFrame as ``{"columns": [...], "data": {column: [values]}}`` with nulls for NaN."""
+    data = {}
+    for col in frame.columns:
+        s = frame[col]
+        if pd.api.types.is_datetime64_any_dtype(s):
+            values = s.dt.strftime("%Y-%m-%dT%H:%M:%S").astype(object)
+        else:
+            values = s.astype(object)
+        data[str(col)] = values.where(s.notna(), None).tolist()
+    return {"columns": [str(c) for c in frame.columns], "data": data}
+
+
+def _encode(obj):
+    if isinstance(obj, (np.integer, np.floating)):
+        return None if np.isnan(obj) else obj.item()
+    if isinstance(obj, pd.Timestamp):
+        return obj.isoformat()
+    raise TypeError(type(obj).__name__)
+
+
+def build_payload(obj, version, modified):
+    body = json.dumps(obj, separators=(",", ":"), default=_encode, allow_nan=False).encode()
+    gzipped = gzip.compress(body, compresslevel=6) if len(body) >= MIN_GZIP_BYTES else None
+    etag = f'"{version}-{hashlib.sha1(body).hexdigest()[:12]}"'
+    return Payload(body, gzipped, etag, modified)
+
+
+# -------------------------------------------------
+# Data state
+# -------------------------------------------------
+class _Dataset:
+    """Frame, index, cube and alert engine of one dataset at one version."""
+
+    def __init__(self, name, version, previous=None):
+        from stats_cube import StatsCube
+        from alerts import AlertEngine
+        self.name, self.version = name, version
+        self.modified = last_modified(name)
+        self.df = load_data(name)
+        # The index, cube and alert state carry over and only take in the new data
+        self.index = (previous.index if previous else StationIndex()).sync(name)
+        self.cube = previous.cube if previous else StatsCube(pollutants=STATS_POLLUTANTS)
+        self.cube.sync(name)
+        self.alerts = previous.alerts if previous else AlertEngine()
+
+
+class DataState:
+    """Current ``_Dataset`` per name, reloaded when the data version changes."""
+
+    def __init__(self):
+        self._datasets = {}
+        self._checked = {}
+        self._lock = asyncio.Lock()
+
+    async def get(self, dataset):
+        if dataset is not None and dataset not in DATASETS:
+            raise HTTPException(400, f"dataset must be one of {', '.join(DATASETS)}")
+        try:
+            name = resolve_name(DATASETS.get(dataset))
+        except FileNotFoundError:
+            raise HTTPException(404, "dataset not found")
+        current = self._datasets.get(name)
+        now = time.monotonic()
+        if current is not None and now - self._checked.get(name, 0) < VERSION_CHECK_SECONDS:
+            return current
+        async with self._lock:
+            version = await run_in_threadpool(data_version, name)
+            current = self._datasets.get(name)
+            if current is None or current.version != version:
+                current = await run_in_threadpool(_Dataset, name, version, current)
+                self._datasets[name] = current
+            self._checked[name] = time.monotonic()
+        return current
+
+
+# -------------------------------------------------
+# Queries (run in a worker thread on a cache miss)
+# -------------------------------------------------
+def _city(ds, city):
+    if city not in ds.index.cities:
+        raise HTTPException(404, f"unknown city {city!r}")
+    return city
+
+
+def _time_range(params):
+    time_range = params.get("range", "All Time")
+    if time_range not in TIME_RANGES:
+        raise HTTPException(400, f"range must be one of {', '.join(TIME_RANGES)}")
+    return time_range
+
+
+def _pollutant(ds, params, default="PM2.5"):
+    pollutant = params.get("pollutant", default)
+    if pollutant not in ds.df.columns:
+        raise HTTPException(400, f"unknown pollutant {pollutant!r}")
+    return pollutant
+
+
+def _budget(params, default):
+    try:
+        budget = int(params.get("budget", default))
+    except ValueError:
+        raise HTTPException(400, "budget must be an integer") from None
+    return max(budget, 2)  # a line needs both ends
+
+
+def query_cities(ds, params):
+    return {"cities": ds.index.cities}
+
+
+def query_aqi(ds, params):
+    rows = ds.df.loc[ds.df["AQI"].notna(), ["City", "Date", "AQI"]]
+    latest = rows.sort_values("Date", kind="stable").groupby("City", observed=True).tail(1)
+    latest = latest.sort_values("City").reset_index(drop=True)
+    category, color = categorize(latest["AQI"])
+    return columnar(latest.assign(Category=category, Color=color))
+
+
+def query_series(ds, params, city):
+    from downsample import MAX_POINTS, downsample
+    pollutant = _pollutant(ds, params)
+    rows = ds.index.query_range(_city(ds, city), _time_range(params))
+    trace = downsample(rows, "Date", [pollutant], budget=_budget(params, MAX_POINTS))
+    return columnar(trace.rename(columns={"Concentration": pollutant}).drop(columns="Pollutant"))
+
+
+def query_stats(ds, params, city):
+    start, end = ds.index.window(_city(ds, city), _time_range(params))
+    stats = ds.cube.query(city, start, end)
+    summary = pd.DataFrame([stats.describe(p) for p in stats.pollutants], index=stats.pollutants)
+    return {"summary": columnar(summary.rename_axis("Pollutant").reset_index()),
+            "corr": columnar(stats.corr.rename_axis("Pollutant").reset_index())}
+
+
+def query_forecast(ds, params, city):
+    from forecasting import GLOBAL, HORIZONS, MODELS, get_forecast
+    model, horizon = params.get("model", "ARIMA"), params.get("horizon", "24h")
+    if model not in MODELS + [GLOBAL] or horizon not in HORIZONS:
+        raise HTTPException(400, f"model in {MODELS + [GLOBAL]}, horizon in {list(HORIZONS)}")
+    forecast = get_forecast(ds.df, _city(ds, city), _pollutant(ds, params), model, horizon, index=ds.index)
+    if forecast is None:
+        raise HTTPException(404, f"no trained {model} model for {city}")
+    return columnar(forecast)
+
+
+def query_alerts(ds, params):
+    from alerts import forecast_peaks
+    ds.alerts.sync(ds.df, ds.version, forecast_peaks(ds.index.cities))
+    alerts = pd.DataFrame(ds.alerts.active_alerts(params.get("city")),
+                          columns=["rule", "city", "severity", "message", "value", "time", "color", "source"])
+    return columnar(alerts)
+
+
+# -------------------------------------------------
+# HTTP
+# -------------------------------------------------
+STATE = DataState()
+CACHE = QueryCache(max_entries=4096, ttl=CACHE_SECONDS)
+
+
+def _gzip_etag(etag):
+    # Each content encoding is its own representation, so it needs its own tag (RFC 9110)
+    return etag[:-1] + '-gz"'
+
+
+def _not_modified(request, payload):
+    match = request.headers.get("if-none-match")
+    if match is not None:
+        # Either encoding's tag validates: both come from the same body
+        tags = [tag.strip() for tag in match.split(",")]
+        return payload.etag in tags or _gzip_etag(payload.etag) in tags or match.strip() == "*"
+    since = request.headers.get("if-modified-since")
+    if since is not None:
+        try:
+            return int(payload.modified) <= parsedate_to_datetime(since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def endpoint(query):
+    """Wrap ``query(ds, params, *path)`` with version-keyed caching and conditional GET."""
+    async def handle(request):
+        ds = await STATE.get(request.query_params.get("dataset"))
+        params = dict(request.query_params)
+        path = tuple(request.path_params.values())
+        key = (query.__name__, ds.name, ds.version, path, tuple(sorted(params.items())))
+        payload = CACHE.get(key)
+        if payload is None:
+            with stage(query.__name__, page="api"):
+                result = await run_in_threadpool(query, ds, params, *path)
+            with stage("serialize", page="api") as s:
+                payload = CACHE.put(key, build_payload(result, ds.version, ds.modified))
+                s.bytes = len(payload.body)
+
+        gzipped = payload.gzipped is not None and "gzip" in request.headers.get("accept-encoding", "")
+        headers = {"ETag": _gzip_etag(payload.etag) if gzipped else payload.etag,
+                   "Last-Modified": formatdate(payload.modified, usegmt=True),
+                   "Cache-Control": f"public, max-age={CACHE_SECONDS}", "Vary": "Accept-Encoding"}
+        if _not_modified(request, payload):
+            return Response(status_code=304, headers=headers)
+        if gzipped:
+            headers["Content-Encoding"] = "gzip"
+            return Response(payload.gzipped, media_type="application/json", headers=headers)
+        return Response(payload.body, media_type="application/json", headers=headers)
+    return handle
+
+
+async def metrics(request):
+    return Response(prometheus_text(), media_type="text/plain; version=0.0.4")
+
+
+routes = [
+    Route("/api/cities", endpoint(query_cities)),
+    Route("/api/aqi", endpoint(query_aqi)),
+    Route("/api/series/{city}", endpoint(query_series)),
+    Route("/api/stats/{city}", endpoint(query_stats)),
+    Route("/api/forecast/{city}", endpoint(query_forecast)),
+    Route("/api/alerts", endpoint(query_alerts)),
+    Route("/metrics", metrics),
+]
+app = Starlette(routes=routes)
+
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description="Serve the dashboard queries as a JSON API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+    uvicorn.run("api:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
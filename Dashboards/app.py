@@ -0,0 +1,19 @@
+import streamlit as st
+
+# ===============================================================
+# 🌍 Air Quality Dashboards — one multi-page app
+# ===============================================================
+# All pages run in one server process and share the cached dataset, indexes,
+# model registry and query cache from shared.py, so switching pages or adding
+# sessions reuses them instead of loading another copy.
+#
+#     streamlit run app.py
+st.set_page_config(page_title="Air Quality Dashboards", layout="wide")
+
+pages = [
+    st.Page("Dashboard1.py", title="Data Explorer", icon="🟢", default=True),
+    st.Page("Dashboard2.py", title="Forecast Engine", icon="🔵"),
+    st.Page("Dashboard3.py", title="Alert System", icon="🟠"),
+    st.Page("Dashboard4.py", title="Web Dashboard", icon="🌤️"),
+]
+st.navigation(pages).run()
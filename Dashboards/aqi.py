@@ -0,0 +1,97 @@
+"""
+Vectorized AQI computation and categorization (CPCB National AQI).
+
+Sub-indices are piecewise linear in the pollutant concentration between the
+CPCB breakpoints; the AQI is the maximum sub-index, reported only when at
+least three pollutants are present and one of them is PM2.5 or PM10.  The
+category thresholds reproduce the dataset's ``AQI_Bucket`` column exactly;
+sub-indices computed from daily means only approximate its ``AQI`` column,
+which CPCB derives from hourly 24h/8h averages.  Every function works on
+whole arrays through ``np.searchsorted``, so scoring the full history is a
+handful of NumPy operations and all dashboards share one answer.
+"""
+
+import numpy as np
+import pandas as pd
+
+# -------------------------------------------------
+# CPCB breakpoints
+# -------------------------------------------------
+# Lower concentration bound of each band (µg/m³, CO in mg/m³).  The index
+# bounds are the same for all pollutants; above the last breakpoint the
+# previous band's slope continues.
+INDEX_BOUNDS = np.array([0, 50, 100, 200, 300, 400, 500], dtype="float64")
+BREAKPOINTS = {
+    "PM2.5": [0, 30, 60, 90, 120, 250, 380],
+    "PM10": [0, 50, 100, 250, 350, 430, 510],
+    "NO2": [0, 40, 80, 180, 280, 400, 520],
+    "O3": [0, 50, 100, 168, 208, 748, 1288],
+    "CO": [0, 1, 2, 10, 17, 34, 51],
+    "SO2": [0, 40, 80, 380, 800, 1600, 2400],
+    "NH3": [0, 200, 400, 800, 1200, 1800, 2400],
+}
+MIN_POLLUTANTS = 3
+
+CATEGORIES = ["Good", "Satisfactory", "Moderate", "Poor", "Very Poor", "Severe"]
+COLORS = ["#00B050", "#92D050", "#FFDE33", "#FF9933", "#FF0000", "#C00000"]
+CATEGORY_COLORS = dict(zip(CATEGORIES, COLORS))
+AQI_MAX = 500
+
+
+# -------------------------------------------------
+# Sub-indices & AQI
+# -------------------------------------------------
+def sub_index(pollutant, values):
+    """CPCB sub-index for an array of ``pollutant`` concentrations (NaN stays NaN)."""
+    c = np.asarray(values, dtype="float64")
+    bp = np.asarray(BREAKPOINTS[pollutant], dtype="float64")
+    slopes = np.diff(INDEX_BOUNDS) / np.diff(bp)
+    # Band k covers (bp[k], bp[k + 1]]; the top band is open-ended
+    band = np.clip(np.searchsorted(bp[1:-1], c, side="left"), 0, len(slopes) - 1)
+    out = INDEX_BOUNDS[band] + slopes[band] * (c - bp[band])
+    return np.where(np.isnan(c), np.nan, np.maximum(out, 0.0))
+
+
+def sub_indices(df):
+    """DataFrame of sub-indices for every breakpoint pollutant present in ``df``."""
+    cols = [p for p in BREAKPOINTS if p in df.columns]
+    return pd.DataFrame({p: sub_index(p, df[p].to_numpy()) for p in cols}, index=df.index)
+
+
+def compute_aqi(df):
+    """AQI per row of raw concentrations (NaN where CPCB's validity rule fails)."""
+    si = sub_indices(df)
+    values = si.to_numpy()
+    present = ~np.isnan(values)
+    has_pm = np.zeros(len(si), dtype=bool)
+    for p in ("PM2.5", "PM10"):
+        if p in si.columns:
+            has_pm |= present[:, si.columns.get_loc(p)]
+    valid = (present.sum(axis=1) >= MIN_POLLUTANTS) & has_pm
+    aqi = np.full(len(si), np.nan)
+    if valid.any():
+        aqi[valid] = np.round(np.nanmax(values[valid], axis=1))
+    return pd.Series(aqi, index=df.index, name="AQI")
+
+
+# -------------------------------------------------
+# Categorization
+# -------------------------------------------------
+def category_codes(aqi):
+    """Category number (0 = Good ... 5 = Severe, -1 for NaN) for an AQI array."""
+    a = np.asarray(aqi, dtype="float64")
+    codes = np.searchsorted(INDEX_BOUNDS[1:-1], a, side="left")
+    return np.where(np.isnan(a), -1, codes).astype("int8")
+
+
+def categorize(aqi):
+    """Return ``(category, color)`` as categorical arrays for an AQI array."""
+    codes = category_codes(aqi)
+    return (pd.Categorical.from_codes(codes, CATEGORIES),
+            pd.Categorical.from_codes(codes, COLORS))
+
+
+def category_of(aqi):
+    """Scalar ``(category, color)`` for a single AQI value."""
+    category, color = categorize([aqi])
+    return category[0], color[0]
@@ -0,0 +1,64 @@
+"""
+Lazy loader for the optional ML stacks behind the forecasting models.
+
+statsmodels, Prophet and Keras/TensorFlow cost seconds and hundreds of MB
+to import, and most page views only read precomputed forecasts.  Nothing
+here imports them up front: ``available`` answers from the import system's
+finders alone, and ``load`` imports a backend the first time a model is
+actually fitted, then caches the module for the rest of the process.
+
+    python import_benchmark.py    # startup time and memory per dashboard
+"""
+
+import importlib
+import importlib.util
+import sys
+import threading
+
+# Model -> module to import for it (its top-level package must be installed)
+MODULES = {
+    "ARIMA": "statsmodels.tsa.arima.model",
+    "Prophet": "prophet",
+    "LSTM": "keras",
+    "Global": "xgboost",
+}
+
+# Heavy packages the dashboards should not pull in before a forecast is fitted
+HEAVY_PACKAGES = ["statsmodels", "sklearn", "prophet", "keras", "tensorflow", "torch", "xgboost"]
+
+_loaded = {}
+_lock = threading.Lock()
+
+
+def available(model):
+    """Whether ``model``'s library is installed, without importing it."""
+    package = MODULES[model].split(".")[0]
+    if package in sys.modules:
+        return True
+    try:
+        return importlib.util.find_spec(package) is not None
+    except (ImportError, ValueError):
+        return False
+
+
+def availability():
+    """``{model: installed}`` for every backend."""
+    return {model: available(model) for model in MODULES}
+
+
+def load(model):
+    """Import (once) and return the module backing ``model``."""
+    module = _loaded.get(model)
+    if module is not None:
+        return module
+    with _lock:
+        if model not in _loaded:
+            if not available(model):
+                raise ImportError(f"{model} needs the '{MODULES[model].split('.')[0]}' package")
+            _loaded[model] = importlib.import_module(MODULES[model])
+        return _loaded[model]
+
+
+def loaded_packages():
+    """Heavy packages already imported into this process."""
+    return [p for p in HEAVY_PACKAGES if p in sys.modules]
@@ -0,0 +1,188 @@
+"""
+Rolling-origin backtesting behind Dashboard2's "Forecast Accuracy" chart.
+
+Each model is fitted once on the history before the first origin.  Forecasts
+for every origin are then produced in batch and stacked into an
+(origins x steps) matrix that is scored against the matching matrix of
+actual windows in a single NumPy pass:
+
+* ARIMA keeps its fitted parameters and ``append``s the remaining data, then
+  projects the Kalman predicted states of all origins forward together.
+* Prophet has no autoregressive state, so one ``predict`` over the test
+  period serves every origin.
+* LSTM rolls all origin windows forward as one batch per step.
+
+Results are cached in the model registry under the ``backtest`` kind, keyed
+by the series' data hash, so recomputing nightly only redoes changed series.
+
+    python backtest.py --cities Delhi --models ARIMA
+"""
+
+import argparse
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from data_store import load_data
+from station_index import StationIndex
+from forecasting import (BACKENDS, LSTM_INPUT, MODELS, POLLUTANTS, TEST_FRACTION,
+                         ModelRegistry, city_series, data_hash, horizon_steps, step_hours)
+
+HORIZONS = [1, 3, 6, 12, 24, 48, 72, 168]  # hours; resolved to whole steps of each series
+MAX_ORIGINS = 50
+KIND = "backtest"
+
+
+# -------------------------------------------------
+# Horizons, origins & target windows
+# -------------------------------------------------
+def series_horizons(series, hours=HORIZONS):
+    """
+    Distinct horizons (hours) that ``series`` resolves: each of ``hours``
+    rounded up to whole steps, so a daily series gets 1, 2, 3 and 7 days.
+    """
+    step = step_hours(series)
+    return sorted({int(round(horizon_steps(series, h) * step)) for h in hours})
+
+
+def rolling_origins(n, steps, n_origins=MAX_ORIGINS):
+    """Evenly spaced forecast origins inside the test portion of the series."""
+    first, last = max(int(n * (1 - TEST_FRACTION)), LSTM_INPUT), n - steps
+    if last < first:
+        return np.array([], dtype=int)
+    return np.unique(np.linspace(first, last, min(n_origins, last - first + 1)).astype(int))
+
+
+def target_windows(values, origins, steps):
+    """Actual values ``values[o:o + steps]`` for every origin as one matrix."""
+    return np.lib.stride_tricks.sliding_window_view(values, steps)[origins]
+
+
+# -------------------------------------------------
+# Batched forecasters: (series, origins, steps) -> (origins x steps) matrix
+# -------------------------------------------------
+def _arima_forecasts(series, origins, steps):
+    fit, _ = BACKENDS["ARIMA"]
+    res = fit(series.iloc[:origins[0]]).append(series.iloc[origins[0]:])
+    fr = res.filter_results
+    Z, T = fr.design[:, :, 0], fr.transition[:, :, 0]
+    c, d = fr.state_intercept[:, :1], fr.obs_intercept[0, 0]
+
+    # predicted_state[:, o] is the state at o given data up to o - 1
+    state = fr.predicted_state[:, origins]
+    out = np.empty((len(origins), steps))
+    for h in range(steps):
+        out[:, h] = (Z @ state)[0] + d
+        state = T @ state + c
+    return out
+
+
+def _prophet_forecasts(series, origins, steps):
+    fit, _ = BACKENDS["Prophet"]
+    model = fit(series.iloc[:origins[0]])
+    dates = series.index[origins[0]:origins[-1] + steps]
+    yhat = model.predict(pd.DataFrame({"ds": dates}))["yhat"].to_numpy()
+    return target_windows(yhat, origins - origins[0], steps)
+
+
+def _lstm_forecasts(series, origins, steps):
+    fit, _ = BACKENDS["LSTM"]
+    model = fit(series.iloc[:origins[0]])
+    scaled = model._scale(series.to_numpy(dtype="float32"))
+    window = np.lib.stride_tricks.sliding_window_view(scaled, LSTM_INPUT)[origins - LSTM_INPUT]
+    return model._unscale(model.runtime.forecast(window, steps))
+
+
+FORECASTERS = {
+    "ARIMA": _arima_forecasts,
+    "Prophet": _prophet_forecasts,
+    "LSTM": _lstm_forecasts,
+}
+
+
+# -------------------------------------------------
+# Scoring
+# -------------------------------------------------
+def score(actual, forecast):
+    """Per-step RMSE, MAE and accuracy (100 - WAPE) over all origins."""
+    err = actual - forecast
+    rmse = np.sqrt(np.nanmean(err ** 2, axis=0))
+    mae = np.nanmean(np.abs(err), axis=0)
+    scale = np.nanmean(np.abs(actual), axis=0)
+    accuracy = np.clip(100 * (1 - mae / np.where(scale > 0, scale, np.nan)), 0, 100)
+    return rmse, mae, accuracy
+
+
+def backtest(series, city, pollutant, models=MODELS, horizons=None, registry=None):
+    """
+    Backtest ``models`` on ``series`` at ``horizons`` (hours; by default
+    ``series_horizons(series)``) and cache the result per data hash.
+    """
+    registry = registry or ModelRegistry()
+    horizons = series_horizons(series) if horizons is None else list(horizons)
+    digest = data_hash(series)
+    cached = registry.get(city, pollutant, KIND, digest)
+    if cached is not None and cached["horizons"] != horizons:
+        cached = None  # scored at other horizons
+    if cached is not None and set(models) <= set(cached["scores"]):
+        return cached
+
+    cols = np.array([horizon_steps(series, h) for h in horizons]) - 1
+    steps = int(cols.max()) + 1
+    values = series.to_numpy(dtype="float64")
+    origins = rolling_origins(len(values), steps)
+    entry = cached or {"city": city, "pollutant": pollutant, "model": KIND,
+                       "data_hash": digest, "horizons": horizons, "scores": {}}
+    entry["n_origins"] = int(len(origins))
+    if len(origins) == 0:
+        return entry
+
+    actual = target_windows(values, origins, steps)
+    for model in models:
+        if model in entry["scores"]:
+            continue
+        try:
+            forecast = FORECASTERS[model](series, origins, steps)
+        except ImportError:
+            continue
+        rmse, mae, accuracy = score(actual, forecast)
+        entry["scores"][model] = {
+            "RMSE": rmse[cols].tolist(),
+            "MAE": mae[cols].tolist(),
+            "Accuracy": accuracy[cols].tolist(),
+        }
+    registry.put(entry, kind=KIND)
+    return entry
+
+
+def accuracy_frame(entry, metric="Accuracy"):
+    """Backtest entry as a horizons x models DataFrame of ``metric``."""
+    if entry is None:
+        return pd.DataFrame()
+    data = {model: scores[metric] for model, scores in entry["scores"].items()}
+    return pd.DataFrame(data, index=pd.Index(entry["horizons"], name="Horizon"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rolling-origin backtests for every city.")
+    parser.add_argument("--data", default=None)
+    parser.add_argument("--cities", nargs="*", default=None)
+    parser.add_argument("--pollutants", nargs="*", default=POLLUTANTS)
+    parser.add_argument("--models", nargs="*", default=MODELS, choices=MODELS)
+    args = parser.parse_args()
+    warnings.filterwarnings("ignore")
+
+    df = load_data(args.data)
+    index = StationIndex(df)
+    registry = ModelRegistry()
+    for city in args.cities or index.cities:
+        for pollutant in args.pollutants:
+            series = city_series(df, city, pollutant, index=index)
+            entry = backtest(series, city, pollutant, args.models, registry=registry)
+            print(f"\n{city} {pollutant} ({entry['n_origins']} origins)")
+            print(accuracy_frame(entry).round(1).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""
+Headless benchmarks of the dashboards' hot paths on synthetic data.
+
+Each dataset size is written as a columnar store next to the real ones and
+run through the same code the dashboards use:
+
+    load          ``load_data`` (every dashboard)
+    index         ``StationIndex`` build (Dashboards 1, 2, 4)
+    filter_sort   one city's rows in date order (Dashboard4 station view)
+    stats_cube    ``StatsCube`` build (Dashboard1)
+    stats_query   summary, correlation and histogram of one city (Dashboard1)
+    aqi_category  AQI categories of every row (Dashboard3)
+    rollups       trend rollups build (Dashboard4)
+    trends_figure melted trend query and ``px.line`` figure (Dashboard4)
+    arima         ARIMA fit and 48h forecast of one city (Dashboard2)
+
+Wall time is the best of ``--repeat`` runs; peak memory is the tracemalloc
+peak of one extra run.  A case that queries a structure (``filter_sort``,
+``stats_query``, ``trends_figure``, ``arima``) runs after the case that
+builds it, which is added to the run if it was not selected, so query
+timings never include the build.  Results go to JSON, and two result files
+can be compared to catch regressions before deploying:
+
+    python benchmark.py --sizes 30k,300k,3M --json after.json
+    python benchmark.py --sizes 30M --repeat 1 --cases load,filter_sort,stats_query
+    python benchmark.py compare before.json after.json --tolerance 0.25
+"""
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import pandas as pd
+
+from data_store import STORE_DIR, load_data, store_path, to_arrow, write_table
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_SIZES = "30k,300k,3M"
+DAYS_PER_CITY = 2000  # ~5.5 years of daily readings, like the real data
+MIN_CITIES = 26
+MISSING_FRACTION = 0.05
+TREND_POLLUTANTS = ["PM2.5", "PM10", "NO2", "O3"]
+STATS_POLLUTANTS = ["PM2.5", "PM10", "NO2", "CO", "SO2", "O3"]
+
+# Typical level of each pollutant (log-normal median)
+LEVELS = {"PM2.5": 60, "PM10": 110, "NO": 15, "NO2": 30, "NOx": 35, "NH3": 20, "CO": 1.5,
+          "SO2": 12, "O3": 35, "Benzene": 3, "Toluene": 8, "Xylene": 2, "AQI": 150}
+
+
+# -------------------------------------------------
+# Synthetic data
+# -------------------------------------------------
+def parse_size(text):
+    """``"30k"`` / ``"3M"`` / ``"300000"`` -> row count."""
+    text = text.strip().lower()
+    scale = {"k": 10**3, "m": 10**6}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def synthetic_frame(rows, seed=0):
+    """
+    ``rows`` daily readings in the cleaned-data schema.  Cities are added as
+    the size grows so each keeps roughly ``DAYS_PER_CITY`` days.
+    """
+    from aqi import categorize
+    rng = np.random.default_rng(seed)
+    n_cities = max(MIN_CITIES, -(-rows // DAYS_PER_CITY))
+    days = -(-rows // n_cities)
+    codes = np.repeat(np.arange(n_cities, dtype="int32"), days)[:rows]
+    day = np.tile(np.arange(days), n_cities)[:rows]
+    season = 1 + 0.4 * np.cos(2 * np.pi * day / 365.25)
+
+    df = pd.DataFrame({
+        "City": pd.Categorical.from_codes(codes, [f"City{i:05d}" for i in range(n_cities)]),
+        "Date": pd.Timestamp("2015-01-01") + pd.to_timedelta(day, unit="D"),
+    })
+    for col, level in LEVELS.items():
+        values = (level * season * rng.lognormal(0, 0.5, rows)).astype("float32")
+        values[rng.random(rows) < MISSING_FRACTION] = np.nan
+        df[col] = values
+    df["AQI_Bucket"] = pd.Categorical(categorize(df["AQI"])[0])
+    return df
+
+
+def write_dataset(rows, seed=0):
+    """Write the synthetic dataset as a store and return its dataset name."""
+    name = f"benchmark_{rows}.csv"
+    os.makedirs(STORE_DIR, exist_ok=True)
+    write_table(to_arrow(synthetic_frame(rows, seed)), store_path(name))
+    return name
+
+
+# -------------------------------------------------
+# Cases
+# -------------------------------------------------
+class Context:
+    """Dataset plus the structures built by earlier (build) cases, reused by later ones."""
+
+    def __init__(self, name):
+        self.name = name
+        self.df = load_data(name)
+        self.city = self.df["City"].cat.categories[0]
+        self.built = {}
+
+    @property
+    def index(self):
+        return self.built["index"]
+
+    @property
+    def cube(self):
+        return self.built["stats_cube"]
+
+    @property
+    def rollups(self):
+        return self.built["rollups"]
+
+
+def case_load(ctx):
+    return load_data(ctx.name)
+
+
+def case_index(ctx):
+    from station_index import StationIndex
+    return StationIndex(ctx.df)
+
+
+def case_filter_sort(ctx):
+    return ctx.index.query(ctx.city)
+
+
+def case_stats_cube(ctx):
+    from stats_cube import StatsCube
+    return StatsCube(ctx.df, STATS_POLLUTANTS)
+
+
+def case_stats_query(ctx):
+    stats = ctx.cube.query(ctx.city)
+    return ([stats.describe(p) for p in stats.pollutants], stats.corr,
+            stats.histogram(stats.pollutants[0], 20))
+
+
+def case_aqi_category(ctx):
+    from aqi import categorize
+    return categorize(ctx.df["AQI"])
+
+
+def case_rollups(ctx):
+    from downsample import Rollups
+    return Rollups(ctx.df, TREND_POLLUTANTS)
+
+
+def case_trends_figure(ctx):
+    import plotly.express as px
+    trend, resolution = ctx.rollups.query()
+    return px.line(trend, x="Date", y="Concentration", color="Pollutant",
+                   title=f"Pollutant Trends Over Time (all stations, {resolution} mean)")
+
+
+def case_arima(ctx):
+    from forecasting import ALPHA, BACKENDS, city_series, horizon_steps
+    from backends import load
+    fit, forecast = BACKENDS["ARIMA"]
+    series = city_series(ctx.df, ctx.city, "PM2.5", index=ctx.index)
+    load("ARIMA")  # statsmodels installs its own warning filters on import
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")  # convergence chatter on random data
+        return forecast(fit(series), horizon_steps(series, 48), ALPHA)
+
+
+CASES = {
+    "load": case_load,
+    "index": case_index,
+    "filter_sort": case_filter_sort,
+    "stats_cube": case_stats_cube,
+    "stats_query": case_stats_query,
+    "aqi_category": case_aqi_category,
+    "rollups": case_rollups,
+    "trends_figure": case_trends_figure,
+    "arima": case_arima,
+}
+
+# Build case each query case needs to have run first
+NEEDS = {"filter_sort": "index", "stats_query": "stats_cube", "trends_figure": "rollups", "arima": "index"}
+BUILDS = set(NEEDS.values())
+
+
+def with_builds(cases):
+    """``cases`` with the build case of each query case added ahead of it."""
+    ordered = []
+    for case in cases:
+        for needed in (NEEDS.get(case), case):
+            if needed is not None and needed not in ordered:
+                ordered.append(needed)
+    return ordered
+
+
+def measure(case, ctx, repeat=3):
+    """Best-of-``repeat`` seconds, tracemalloc peak (MB) and result of ``case(ctx)``."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = case(ctx)
+        best = min(best, time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        case(ctx)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return best, peak / 2**20, result
+
+
+def run(sizes, cases=CASES, repeat=3, seed=0, log=print):
+    """Results of every case on every dataset size."""
+    results = []
+    for rows in sizes:
+        name = write_dataset(rows, seed)
+        try:
+            ctx = Context(name)
+            n_cities = len(ctx.df["City"].cat.categories)
+            for case in with_builds(cases):
+                seconds, peak_mb, result = measure(CASES[case], ctx, repeat)
+                if case in BUILDS:
+                    ctx.built[case] = result
+                results.append({"case": case, "rows": rows, "cities": n_cities,
+                                "seconds": round(seconds, 6), "peak_mb": round(peak_mb, 2)})
+                log(f"{case:<14}{rows:>11,}{seconds:>11.4f}{peak_mb:>11.1f}")
+        finally:
+            os.remove(store_path(name))
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"timestamp": datetime.datetime.now().isoformat(timespec="seconds"), "commit": commit,
+            "python": platform.python_version(), "platform": platform.platform(),
+            "pandas": pd.__version__, "numpy": np.__version__}
+
+
+# -------------------------------------------------
+# Comparison report
+# -------------------------------------------------
+def compare(before, after, tolerance=0.25, min_seconds=0.005):
+    """
+    Rows of (case, rows, seconds before/after, peak before/after, status) for
+    every result present in both runs.  A case regresses when its time or
+    peak memory grows by more than ``tolerance``; timings below
+    ``min_seconds`` are too noisy to flag.
+    """
+    old = {(r["case"], r["rows"]): r for r in before["results"]}
+    report = []
+    for r in after["results"]:
+        base = old.get((r["case"], r["rows"]))
+        if base is None:
+            continue
+        slower = r["seconds"] > base["seconds"] * (1 + tolerance) and r["seconds"] >= min_seconds
+        larger = r["peak_mb"] > base["peak_mb"] * (1 + tolerance) and r["peak_mb"] >= 1
+        faster = r["seconds"] < base["seconds"] / (1 + tolerance) and base["seconds"] >= min_seconds
+        status = "REGRESSION" if slower or larger else ("faster" if faster else "ok")
+        report.append((r["case"], r["rows"], base["seconds"], r["seconds"],
+                       base["peak_mb"], r["peak_mb"], status))
+    return report
+
+
+def print_report(report):
+    print(f"{'case':<14}{'rows':>11}{'s before':>11}{'s after':>11}{'x':>7}"
+          f"{'MB before':>11}{'MB after':>10}  status")
+    for case, rows, s0, s1, m0, m1, status in report:
+        ratio = s1 / s0 if s0 else float("nan")
+        print(f"{case:<14}{rows:>11,}{s0:>11.4f}{s1:>11.4f}{ratio:>7.2f}{m0:>11.1f}{m1:>10.1f}  {status}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the dashboard hot paths on synthetic data.")
+    sub = parser.add_subparsers(dest="command")
+    cmp_parser = sub.add_parser("compare", help="compare two result files")
+    cmp_parser.add_argument("before")
+    cmp_parser.add_argument("after")
+    cmp_parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated row counts, e.g. 30k,3M,30M")
+    parser.add_argument("--cases", default=",".join(CASES), help="comma-separated subset of cases")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="optional path to write the results to")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.before) as f:
+            before = json.load(f)
+        with open(args.after) as f:
+            after = json.load(f)
+        report = compare(before, after, args.tolerance)
+        print_report(report)
+        sys.exit(1 if any(r[-1] == "REGRESSION" for r in report) else 0)
+
+    cases = [c.strip() for c in args.cases.split(",")]
+    unknown = set(cases) - CASES.keys()
+    if unknown:
+        parser.error(f"unknown cases: {', '.join(sorted(unknown))}")
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+
+    print(f"{'case':<14}{'rows':>11}{'seconds':>11}{'peak MB':>11}")
+    results = run(sizes, cases, args.repeat, args.seed)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+"""
+Deterministic cleaning of the raw readings.
+
+Each city is cleaned on its own, in vectorized steps:
+
+    regular grid   readings averaged onto a fixed ``FREQ`` grid (duplicates merged)
+    validity       negative or impossible concentrations become NaN
+    outliers       values beyond a per-pollutant fence (3 IQR in log space) are clipped
+    gaps           time interpolation of gaps up to ``MAX_GAP`` periods, inside the series
+    AQI            reported AQI kept where valid, otherwise recomputed (``aqi.compute_aqi``)
+
+Cities are independent, so they are cleaned in parallel worker processes.
+``sync`` only cleans raw partitions appended by ``ingest.py`` since its last
+run.  It adds a short history tail per city as interpolation context and
+appends the result to the cleaned dataset through ``ingest_frame``.
+
+``QualityCounters`` keeps cumulative counts of present and valid raw
+readings per city.  The completeness and validity of any (city, date range,
+pollutant) are then two binary searches.
+
+``legacy_clean`` and ``legacy_hourly`` reproduce the notebook steps that
+produced ``cleaned_air_quality_data.csv`` (rows ordered by date and
+forward-filled across cities) and ``air_quality_data_cleaned.csv`` exactly::
+
+    python cleaning.py --out cleaned_v2.csv      # clean the raw CSV
+    python cleaning.py --sync                    # clean newly ingested raw partitions
+    python cleaning.py --legacy --check          # regenerate the notebook CSVs and compare
+"""
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from data_store import (CLEANED_CSV, DATA_DIR, POLLUTANTS, RAW_CSV, load_data, load_partition,
+                        partitions_dir, read_manifest, to_frame)
+from aqi import categorize, compute_aqi
+
+FREQ = "D"
+MAX_GAP = 7              # longest run of missing periods that is interpolated
+FENCE_IQR = 3.0          # outlier fence in interquartile ranges of log concentration
+MIN_FENCE_POINTS = 30    # fewer valid readings than this: no outlier clipping
+PARALLEL_MIN_ROWS = 200_000  # below this, worker start-up costs more than it saves
+MAX_CONCENTRATION = 2000.0
+VALID_MAX = {"CO": 100.0}  # mg/m³; everything else µg/m³
+COUNTERS = ["expected", "present", "invalid", "clipped", "interpolated", "missing"]
+
+LEGACY_CLEANED_CSV = "cleaned_air_quality_data.csv"
+LEGACY_HOURLY_CSV = "air_quality_data_cleaned.csv"
+LEGACY_COMPLETE = ["NO", "NOx", "NH3", "Benzene", "Toluene", "Xylene", "AQI"]
+
+
+def valid_mask(values, columns):
+    """Readings that are present, non-negative and below the column's ceiling."""
+    ceilings = np.array([VALID_MAX.get(c, MAX_CONCENTRATION) if c != "AQI" else np.inf for c in columns])
+    with np.errstate(invalid="ignore"):
+        return (values >= 0) & (values <= ceilings)
+
+
+# -------------------------------------------------
+# Cleaning
+# -------------------------------------------------
+def clean_city(frame, freq=FREQ, max_gap=MAX_GAP):
+    """
+    Clean one city's rows.  Returns ``(cleaned, counters)``; ``counters``
+    has one row per pollutant with the ``COUNTERS`` counts.
+    """
+    city = frame["City"].iat[0]
+    columns = [c for c in POLLUTANTS if c in frame.columns]
+    readings = frame.set_index("Date")[columns + ["AQI"] if "AQI" in frame.columns else columns]
+    grid = readings.astype("float64").resample(freq).mean()
+
+    values = grid[columns].to_numpy(dtype="float64", copy=True)
+    present = ~np.isnan(values)
+    invalid = present & ~valid_mask(values, columns)
+    values[invalid] = np.nan
+
+    # Far-out fence on log concentrations: robust to the heavy right tail
+    logs = np.log1p(np.where(np.isnan(values), np.nan, values))
+    enough = (~np.isnan(logs)).sum(axis=0) >= MIN_FENCE_POINTS
+    upper = np.full(len(columns), np.inf)
+    if enough.any():
+        q1, q3 = np.nanpercentile(logs[:, enough], [25, 75], axis=0)
+        upper[enough] = np.expm1(q3 + FENCE_IQR * (q3 - q1))
+    with np.errstate(invalid="ignore"):
+        clipped = values > upper
+    values = np.where(clipped, upper, values)
+
+    filled = pd.DataFrame(values, index=grid.index, columns=columns).interpolate(
+        method="time", limit=max_gap, limit_area="inside")
+    interpolated = np.isnan(values) & filled.notna().to_numpy()
+
+    derived = compute_aqi(filled)
+    if "AQI" in grid.columns:
+        reported = grid["AQI"].where(grid["AQI"] >= 0)
+        aqi = reported.fillna(derived)
+    else:
+        aqi = derived
+    cleaned = filled.astype("float32")
+    cleaned["AQI"] = aqi.astype("float32")
+    cleaned["AQI_Bucket"] = categorize(cleaned["AQI"])[0]
+    cleaned = cleaned[cleaned[columns].notna().any(axis=1)]
+    cleaned = cleaned.rename_axis("Date").reset_index()
+    cleaned.insert(0, "City", city)
+
+    counters = pd.DataFrame({
+        "City": city, "Pollutant": columns,
+        "expected": len(grid), "present": present.sum(axis=0), "invalid": invalid.sum(axis=0),
+        "clipped": clipped.sum(axis=0), "interpolated": interpolated.sum(axis=0),
+        "missing": filled.isna().sum().to_numpy(),
+    })
+    return cleaned, counters
+
+
+def _clean_job(args):
+    frame, freq, max_gap = args
+    return clean_city(frame, freq, max_gap)
+
+
+def clean(df, freq=FREQ, max_gap=MAX_GAP, workers=None):
+    """
+    Clean every city of ``df`` in ``workers`` processes (``1``, or fewer
+    than ``PARALLEL_MIN_ROWS`` rows with ``workers=None``, runs inline).
+    Returns ``(cleaned, counters)`` sorted by City and Date.
+    """
+    frames = [g for _, g in df.groupby("City", observed=True, sort=True) if len(g)]
+    jobs = [(g, freq, max_gap) for g in frames]
+    if workers == 1 or len(jobs) <= 1 or (workers is None and len(df) < PARALLEL_MIN_ROWS):
+        results = [_clean_job(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_clean_job, jobs))
+    if not results:
+        return df.iloc[0:0], pd.DataFrame(columns=["City", "Pollutant"] + COUNTERS)
+    cleaned = pd.concat([r[0] for r in results], ignore_index=True)
+    cleaned["City"] = cleaned["City"].astype("category")
+    return cleaned, pd.concat([r[1] for r in results], ignore_index=True)
+
+
+def sync(raw=RAW_CSV, target=CLEANED_CSV, freq=FREQ, max_gap=MAX_GAP, workers=None):
+    """
+    Clean the raw partitions appended since the last run and append them to
+    ``target``.  Returns ``ingest_frame`` stats (``None`` if nothing was new).
+    """
+    from ingest import ingest_frame
+    state_path = os.path.join(partitions_dir(raw), "cleaned.json")
+    state = {"target": target, "done": []}
+    if os.path.exists(state_path):
+        with open(state_path) as f:
+            state = json.load(f)
+    todo = [p["path"] for p in read_manifest(raw)["partitions"] if p["path"] not in state["done"]]
+    if not todo:
+        return None
+
+    new = pd.concat([to_frame(load_partition(raw, path)) for path in todo], ignore_index=True)
+    # History tail of the affected cities so gaps at the boundary interpolate
+    first = new["Date"].min()
+    context_start = first - max_gap * pd.tseries.frequencies.to_offset(freq)
+    history = load_data(raw)
+    history = history[history["City"].isin(new["City"].unique()) & (history["Date"] >= context_start)]
+    cleaned, _ = clean(history, freq, max_gap, workers)
+    stats = ingest_frame(cleaned[cleaned["Date"] >= first.floor(freq)], target)
+
+    state["done"] += todo
+    tmp = state_path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, state_path)
+    return stats
+
+
+# -------------------------------------------------
+# Quality counters
+# -------------------------------------------------
+class QualityCounters:
+    """Cumulative present/valid counts of the raw readings per city and pollutant."""
+
+    def __init__(self, df, columns=None, freq=FREQ, city_col="City", date_col="Date"):
+        self.columns = [c for c in (columns or POLLUTANTS + ["AQI"]) if c in df.columns]
+        self.period = pd.tseries.frequencies.to_offset(freq).nanos
+        codes = pd.Categorical(df[city_col]).codes
+        dates = df[date_col].to_numpy(dtype="datetime64[ns]").view("i8")
+        order = np.lexsort((dates, codes))
+        codes, self.dates = codes[order], dates[order]
+        values = df[self.columns].to_numpy(dtype="float64")[order]
+
+        present = ~np.isnan(values)
+        valid = present & valid_mask(values, self.columns)
+        zero = np.zeros((1, len(self.columns)), dtype="int64")
+        self.present = np.vstack([zero, np.cumsum(present, axis=0)])
+        self.valid = np.vstack([zero, np.cumsum(valid, axis=0)])
+
+        cities = pd.Categorical(df[city_col]).categories
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        starts = np.concatenate(([0], bounds))
+        stops = np.concatenate((bounds, [len(codes)]))
+        self.offsets = {cities[codes[s]]: (int(s), int(e)) for s, e in zip(starts, stops) if e > s}
+
+    def query(self, city=None, start=None, end=None, column="PM2.5"):
+        """
+        ``{"expected", "present", "valid", "completeness", "validity"}`` for
+        ``column`` in ``city`` (all cities when ``None``) between ``start``
+        and ``end``.  ``expected`` counts the regular periods between the
+        city's first and last reading within the range.
+        """
+        k = self.columns.index(column)
+        lo_ns = None if start is None else pd.Timestamp(start).value
+        hi_ns = None if end is None else pd.Timestamp(end).value
+        expected = present = valid = 0
+        for name in ([city] if city is not None else list(self.offsets)):
+            lo, hi = self.offsets.get(name, (0, 0))
+            if lo_ns is not None:
+                lo += int(np.searchsorted(self.dates[lo:hi], lo_ns, side="left"))
+            if hi_ns is not None:
+                hi = lo + int(np.searchsorted(self.dates[lo:hi], hi_ns, side="right"))
+            if hi <= lo:
+                continue
+            expected += int((self.dates[hi - 1] - self.dates[lo]) // self.period) + 1
+            present += int(self.present[hi, k] - self.present[lo, k])
+            valid += int(self.valid[hi, k] - self.valid[lo, k])
+        return {"expected": expected, "present": present, "valid": valid,
+                "completeness": 100.0 * present / expected if expected else None,
+                "validity": 100.0 * valid / present if present else None}
+
+
+# -------------------------------------------------
+# Notebook reproduction
+# -------------------------------------------------
+def read_raw_csv(path):
+    """The raw CSV with pandas' default dtypes, as the notebook read it."""
+    return pd.read_csv(path, parse_dates=["Date"])
+
+
+def legacy_clean(raw):
+    """
+    ``cleaned_air_quality_data.csv``: rows ordered by Date with pandas'
+    default (quicksort) ordering within a day, every column forward-filled
+    across cities, and the leading rows that stay incomplete dropped.
+    """
+    return raw.sort_values("Date").ffill().dropna()
+
+
+def legacy_hourly(raw):
+    """
+    ``air_quality_data_cleaned.csv``: the forward-filled rows whose raw
+    readings had every ``LEGACY_COMPLETE`` column, re-sorted by date, with
+    the date renamed ``timestamp`` and an ``hour`` column.
+    """
+    ordered = raw.sort_values("Date")
+    filled = ordered.ffill()
+    keep = ordered[LEGACY_COMPLETE].notna().all(axis=1) & filled.notna().all(axis=1)
+    out = filled[keep].sort_values("Date").rename(columns={"Date": "timestamp"})
+    out["hour"] = out["timestamp"].dt.hour
+    return out
+
+
+def _same_file(frame, path):
+    with open(path, newline="") as f:
+        expected = f.read()
+    return frame.to_csv(index=False, lineterminator="\n") == expected.replace("\r\n", "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Clean the raw air quality readings.")
+    parser.add_argument("--raw", default=RAW_CSV)
+    parser.add_argument("--out", default=None, help="CSV to write the cleaned rows to")
+    parser.add_argument("--report", default=None, help="CSV to write the per-city quality counters to")
+    parser.add_argument("--freq", default=FREQ)
+    parser.add_argument("--max-gap", type=int, default=MAX_GAP)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--sync", action="store_true", help="clean newly ingested raw partitions only")
+    parser.add_argument("--legacy", action="store_true", help="reproduce the notebook's cleaned CSVs")
+    parser.add_argument("--check", action="store_true", help="with --legacy: compare instead of writing")
+    args = parser.parse_args()
+
+    if args.legacy:
+        raw = read_raw_csv(os.path.join(DATA_DIR, args.raw))
+        for name, frame in ((LEGACY_CLEANED_CSV, legacy_clean(raw)), (LEGACY_HOURLY_CSV, legacy_hourly(raw))):
+            path = os.path.join(DATA_DIR, name)
+            if args.check:
+                print(f"{name}: {'identical' if _same_file(frame, path) else 'DIFFERS'} ({len(frame)} rows)")
+            else:
+                frame.to_csv(path, index=False)
+                print(f"wrote {name} ({len(frame)} rows)")
+        return
+
+    if args.sync:
+        stats = sync(args.raw, freq=args.freq, max_gap=args.max_gap, workers=args.workers)
+        print("nothing new" if stats is None else
+              f"{stats['appended']} cleaned rows appended ({stats['duplicates']} already present)")
+        return
+
+    cleaned, counters = clean(load_data(args.raw), args.freq, args.max_gap, args.workers)
+    totals = counters.groupby("Pollutant", sort=False)[COUNTERS].sum()
+    print(totals.to_string())
+    if args.out:
+        cleaned.to_csv(args.out, index=False)
+    if args.report:
+        counters.to_csv(args.report, index=False)
+
+
+if __name__ == "__main__":
+    main()
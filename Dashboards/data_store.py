@@ -0,0 +1,220 @@
+"""
+Shared data layer for the air quality dashboards.
+
+The CSV files are parsed once and written to a typed Arrow IPC (Feather v2)
+file under ``.store/``.  Every dashboard then memory-maps that file instead
+of re-parsing the CSV, so all Streamlit processes share one page-cached copy
+of the data and cold start is a file open rather than a CSV parse.
+
+The store schema is fixed: categorical ``City``/``AQI_Bucket``, float32
+pollutants and AQI, and ``Date`` as ``datetime64[ns]``.  Missing readings
+are stored as NaN rather than Arrow nulls, so numeric and date columns
+convert to pandas without a copy.  The frame's columns then point into the
+shared memory map instead of being private to each process.
+"""
+
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+# -------------------------------------------------
+# Paths & Schema
+# -------------------------------------------------
+DATA_DIR = os.path.dirname(os.path.abspath(__file__))
+STORE_DIR = os.path.join(DATA_DIR, ".store")
+
+CLEANED_CSV = "cleaned_air_quality_data.csv"
+RAW_CSV = "air_quality_data.csv"
+
+POLLUTANTS = ["PM2.5", "PM10", "NO", "NO2", "NOx", "NH3", "CO",
+              "SO2", "O3", "Benzene", "Toluene", "Xylene"]
+CATEGORICAL_COLS = ["City", "AQI_Bucket"]
+DATE_DTYPE = "datetime64[ns]"
+NUMERIC_DTYPE = "float32"
+SCHEMA_VERSION = "2"  # bump when the store layout changes; stale stores are rebuilt
+
+
+def _csv_path(name):
+    return name if os.path.isabs(name) else os.path.join(DATA_DIR, name)
+
+
+def store_path(name):
+    """Path of the columnar store file built from the CSV ``name``."""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return os.path.join(STORE_DIR, stem + ".arrow")
+
+
+def partitions_dir(name):
+    """Directory holding the appended date partitions of dataset ``name``."""
+    return os.path.splitext(store_path(name))[0]
+
+
+def read_manifest(name):
+    """Partition manifest written by ``ingest.py`` (empty if nothing was ingested)."""
+    path = os.path.join(partitions_dir(name), "manifest.json")
+    if not os.path.exists(path):
+        return {"version": 0, "partitions": []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _find_date_column(columns):
+    for c in columns:
+        if "date" in c.lower() or "time" in c.lower():
+            return c
+    return None
+
+
+# -------------------------------------------------
+# CSV -> Arrow conversion
+# -------------------------------------------------
+def read_csv_typed(path_or_buffer):
+    """Parse an air quality CSV with compact dtypes and a datetime ``Date``."""
+    return normalize_frame(pd.read_csv(path_or_buffer))
+
+
+def normalize_frame(df):
+    """Normalize column names and apply the compact dtypes to ``df``."""
+    df.columns = [c.strip().replace(" ", "_") for c in df.columns]
+
+    date_col = _find_date_column(df.columns)
+    if date_col is None:
+        df["Date"] = pd.date_range("2025-01-01", periods=len(df), freq="h")
+    else:
+        df["Date"] = pd.to_datetime(df[date_col], errors="coerce").astype(DATE_DTYPE)
+        if date_col != "Date":
+            df = df.drop(columns=date_col)
+
+    for col in CATEGORICAL_COLS:
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    for col in POLLUTANTS + ["AQI"]:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(NUMERIC_DTYPE)
+    return df
+
+
+def to_arrow(df):
+    """
+    ``df`` as an Arrow table in the store layout: categoricals as
+    dictionaries, float and date columns as plain buffers with NaN/NaT kept
+    in place, so reading them back is zero-copy.
+    """
+    arrays = {}
+    for col in df.columns:
+        s = df[col]
+        if s.dtype.kind == "f":
+            arrays[col] = pa.array(s.to_numpy(), from_pandas=False)
+        elif s.dtype.kind == "M":
+            arrays[col] = pa.array(s.to_numpy(dtype=DATE_DTYPE), from_pandas=False)
+        else:
+            arrays[col] = pa.array(s)
+    table = pa.table(arrays)
+    return table.replace_schema_metadata({"airq_schema": SCHEMA_VERSION})
+
+
+def write_table(table, path):
+    """
+    Write ``table`` to ``path`` atomically as one uncompressed record batch:
+    readers never see a half-written file, and the file is memory-mappable.
+    A single batch keeps each column contiguous so it maps without a copy.
+    """
+    tmp = path + ".tmp"
+    feather.write_feather(table, tmp, compression="uncompressed", chunksize=max(len(table), 1))
+    os.replace(tmp, path)
+
+
+def to_frame(table):
+    """pandas view of a store table; one block per column so nothing is consolidated (copied)."""
+    return table.to_pandas(split_blocks=True)
+
+
+def _schema_version(path):
+    metadata = pa.ipc.open_file(pa.memory_map(path, "r")).schema.metadata or {}
+    return metadata.get(b"airq_schema", b"").decode()
+
+
+def build_store(name=CLEANED_CSV, force=False):
+    """Convert ``name`` to the columnar store if it is missing or stale."""
+    src = _csv_path(name)
+    dst = store_path(name)
+    if not os.path.exists(src):
+        if os.path.exists(dst):
+            return dst
+        raise FileNotFoundError(src)
+    if (not force and os.path.exists(dst)
+            and os.path.getmtime(dst) >= os.path.getmtime(src)
+            and _schema_version(dst) == SCHEMA_VERSION):
+        return dst
+
+    os.makedirs(STORE_DIR, exist_ok=True)
+    df = read_csv_typed(src)
+    if "City" in df.columns:
+        # Pre-sort so the (City, Date) index can be built without reordering
+        df = df.sort_values(["City", "Date"], kind="stable", ignore_index=True)
+    write_table(to_arrow(df), dst)
+    return dst
+
+
+# -------------------------------------------------
+# Readers
+# -------------------------------------------------
+def _map_file(path):
+    return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+
+def load_partition(name=CLEANED_CSV, path=None):
+    """
+    Memory-map only the base store of ``name`` (``path=None``) or one
+    appended partition, given by its manifest ``path``.
+    """
+    if path is None:
+        return _map_file(build_store(name))
+    return _map_file(os.path.join(partitions_dir(name), path))
+
+
+def load_table(name=CLEANED_CSV):
+    """
+    Memory-map the columnar store for ``name`` as a ``pyarrow.Table``,
+    followed by any partitions appended by ``ingest.py``.
+    """
+    table = _map_file(build_store(name))
+    parts = [_map_file(os.path.join(partitions_dir(name), p["path"]))
+             for p in read_manifest(name)["partitions"]]
+    if not parts:
+        return table
+    return pa.concat_tables([table] + [p.select(table.column_names).cast(table.schema) for p in parts])
+
+
+def resolve_name(name=None):
+    """Dataset to load: ``name`` or the cleaned CSV, falling back to the raw one."""
+    candidates = [name] if name else [CLEANED_CSV, RAW_CSV]
+    for candidate in candidates:
+        if os.path.exists(_csv_path(candidate)) or os.path.exists(store_path(candidate)):
+            return candidate
+    raise FileNotFoundError(", ".join(candidates))
+
+
+def data_version(name=None):
+    """Token that changes whenever the store is rebuilt or a partition is added."""
+    name = resolve_name(name)
+    path = build_store(name)
+    return f"{os.path.getmtime(path):.0f}-{read_manifest(name)['version']}"
+
+
+def last_modified(name=None):
+    """Unix time of the last store rebuild or ingested partition of ``name``."""
+    name = resolve_name(name)
+    paths = [build_store(name), os.path.join(partitions_dir(name), "manifest.json")]
+    return max(os.path.getmtime(p) for p in paths if os.path.exists(p))
+
+
+def load_data(name=None):
+    """
+    Load a dataset as a DataFrame, preferring the cleaned CSV like the
+    dashboards always have.  Raises ``FileNotFoundError`` if nothing exists.
+    """
+    return to_frame(load_table(resolve_name(name)))
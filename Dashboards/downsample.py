@@ -0,0 +1,154 @@
+"""
+Server-side downsampling for time-series charts.
+
+Traces are reduced to a pixel budget before they reach Plotly:
+
+* ``Rollups`` pre-aggregates the data to daily/weekly/monthly means per city
+  (and across all cities) once per data version.  A query picks the finest
+  level that fits the budget for the requested window, so zooming into a
+  shorter window automatically re-queries at a finer resolution.
+* If even that level is over budget, ``lttb`` (Largest-Triangle-Three-Buckets)
+  or ``minmax`` decimation keeps the visual shape with a bounded number of
+  points.
+"""
+
+import numpy as np
+import pandas as pd
+
+MAX_POINTS = 5000  # per chart, shared by its traces
+RESOLUTIONS = ["D", "W", "MS"]  # finest to coarsest rollup
+RESOLUTION_LABELS = {None: "raw", "D": "daily", "W": "weekly", "MS": "monthly"}
+
+
+# -------------------------------------------------
+# Point selection
+# -------------------------------------------------
+def _as_float(x):
+    x = np.asarray(x)
+    if np.issubdtype(x.dtype, np.datetime64):
+        return x.astype("datetime64[ns]").astype("int64").astype("float64")
+    return x.astype("float64")
+
+
+def lttb(x, y, n_out):
+    """Indices of the ``n_out`` points LTTB keeps from ``(x, y)``."""
+    n = len(y)
+    if n_out >= n or n < 3:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])  # no interior buckets: just the ends
+    x, y = _as_float(x), np.asarray(y, dtype="float64")
+
+    # Interior points split into n_out - 2 buckets; first and last are kept
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    starts, stops = edges[:-1], edges[1:]
+    counts = stops - starts
+    avg_x = np.add.reduceat(x[1:n - 1], starts - 1) / counts
+    avg_y = np.add.reduceat(y[1:n - 1], starts - 1) / counts
+    next_x = np.append(avg_x[1:], x[-1])
+    next_y = np.append(avg_y[1:], y[-1])
+
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        bx, by = x[starts[i]:stops[i]], y[starts[i]:stops[i]]
+        area = np.abs((x[a] - next_x[i]) * (by - y[a]) - (x[a] - bx) * (next_y[i] - y[a]))
+        a = starts[i] + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+
+def minmax(x, y, n_out):
+    """Indices of the min and max of ``n_out // 2`` equal-width buckets of sorted ``x``."""
+    n = len(y)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    xf, y = _as_float(x), np.asarray(y, dtype="float64")
+    n_buckets = max(1, n_out // 2)
+    span = (xf[-1] - xf[0]) or 1.0
+    bucket = np.minimum(((xf - xf[0]) / span * n_buckets).astype(int), n_buckets - 1)
+    # x is sorted, so buckets are contiguous runs reducible in one pass each
+    starts = np.flatnonzero(np.r_[True, bucket[1:] != bucket[:-1]])
+    counts = np.diff(np.r_[starts, n])
+    picks = []
+    for reduce in (np.minimum, np.maximum):
+        hit = np.flatnonzero(y == np.repeat(reduce.reduceat(y, starts), counts))
+        _, first = np.unique(bucket[hit], return_index=True)
+        picks.append(hit[first])
+    return np.unique(np.concatenate(picks))
+
+
+METHODS = {"lttb": lttb, "minmax": minmax}
+
+
+def trace_budget(budget, columns):
+    """Points each of ``columns``' traces gets from a chart ``budget`` (at least 2)."""
+    return max(budget // max(len(columns), 1), 2)
+
+
+def downsample(df, x, columns, budget=MAX_POINTS, method="lttb"):
+    """
+    Long-format frame (``x``, Pollutant, Concentration) with the columns of
+    ``df`` reduced to at most ``budget`` points in total, split evenly
+    between their traces.
+    """
+    select = METHODS[method]
+    per_trace = trace_budget(budget, columns)
+    parts = []
+    for col in columns:
+        trace = df[[x, col]].dropna()
+        keep = select(trace[x].to_numpy(), trace[col].to_numpy(), per_trace)
+        trace = trace.iloc[keep]
+        parts.append(pd.DataFrame({x: trace[x].to_numpy(), "Pollutant": col,
+                                   "Concentration": trace[col].to_numpy()}))
+    if not parts:
+        return pd.DataFrame(columns=[x, "Pollutant", "Concentration"])
+    return pd.concat(parts, ignore_index=True)
+
+
+# -------------------------------------------------
+# Rollups
+# -------------------------------------------------
+class Rollups:
+    """Mean of ``columns`` per (city, period) and across all cities per period."""
+
+    def __init__(self, df, columns, freqs=RESOLUTIONS, city_col="City", date_col="Date"):
+        self.columns = list(columns)
+        self.city_col = city_col
+        self.date_col = date_col
+        self.levels = {}
+        for freq in freqs:
+            grouper = pd.Grouper(key=date_col, freq=freq)
+            per_city = df.groupby([city_col, grouper], observed=True)[self.columns].mean()
+            overall = df.groupby(grouper)[self.columns].mean().dropna(how="all")
+            self.levels[freq] = (per_city.sort_index(), overall)
+
+    def _window(self, frame, start, end):
+        dates = frame.index
+        lo = 0 if start is None else dates.searchsorted(pd.Timestamp(start), side="left")
+        hi = len(dates) if end is None else dates.searchsorted(pd.Timestamp(end), side="right")
+        return frame.iloc[lo:hi]
+
+    def query(self, city=None, start=None, end=None, budget=MAX_POINTS, method="lttb"):
+        """
+        Long-format trend for ``city`` (all cities when ``None``) between
+        ``start`` and ``end`` at the finest rollup within ``budget`` points
+        for the whole chart.  Returns ``(frame, resolution)``.
+        """
+        per_trace = trace_budget(budget, self.columns)
+        frame, freq = None, None
+        for freq in self.levels:
+            per_city, overall = self.levels[freq]
+            if city is None:
+                level = overall
+            else:
+                try:
+                    level = per_city.xs(city, level=0)
+                except KeyError:
+                    level = overall.iloc[0:0]
+            frame = self._window(level, start, end)
+            if len(frame) <= per_trace:
+                break
+        frame = frame.rename_axis(self.date_col).reset_index()
+        return downsample(frame, self.date_col, self.columns, budget, method), RESOLUTION_LABELS[freq]
@@ -0,0 +1,75 @@
+"""
+Figure cache and lightweight rendering helpers for the dashboard pages.
+
+Building a Plotly figure (``px.line``, ``px.imshow``...) costs tens to
+hundreds of milliseconds per rerun even when its inputs have not changed.
+``FigureCache`` keeps the built ``go.Figure`` of each (query, data version)
+key in the same bounded LRU as ``QueryCache``, sized by its trace arrays.
+A hit is a dictionary lookup.  The figure is shared by every session, so
+callers must treat it as read-only (``st.plotly_chart`` only reads it).
+
+Scatter traces with more than ``WEBGL_POINTS`` points are switched to
+``Scattergl`` so the browser draws them on the GPU.  ``card_strip`` builds
+rows of HTML cards with vectorized string operations instead of a Python
+loop over rows.
+"""
+
+import html
+
+import plotly.graph_objects as go
+
+from query_cache import QueryCache
+from instrument import payload_bytes
+
+WEBGL_POINTS = 1000
+FIGURE_ENTRIES = 128
+FIGURE_BYTES = 32 * 2**20
+
+
+def use_webgl(fig, threshold=WEBGL_POINTS):
+    """``fig`` with every scatter trace longer than ``threshold`` drawn as ``Scattergl``."""
+    long = [t.type == "scatter" and t.x is not None and len(t.x) > threshold for t in fig.data]
+    if not any(long):
+        return fig
+    traces = [go.Scattergl(t.to_plotly_json(), skip_invalid=True) if gl else t for t, gl in zip(fig.data, long)]
+    return go.Figure(data=traces, layout=fig.layout)
+
+
+class FigureCache(QueryCache):
+    """LRU of built figures; a hit returns the cached (read-only) ``go.Figure``."""
+
+    def __init__(self, max_entries=FIGURE_ENTRIES, max_bytes=FIGURE_BYTES, **kwargs):
+        super().__init__(max_entries, max_bytes, **kwargs)
+
+    def figure(self, key, build):
+        """Figure for ``key`` (put the data version in it), calling ``build()`` on a miss."""
+        missing = object()
+        fig = self.get(key, missing)
+        if fig is missing:
+            fig = use_webgl(build())
+            self.put(key, fig, payload_bytes(fig))
+        return fig
+
+
+def card_strip(frame, title, body, caption, color, width=110):
+    """
+    One HTML string of inline cards, one per row of ``frame``: ``title``
+    in bold, then ``body`` and a small ``caption``, on a ``color`` background.
+    The columns are HTML-escaped and concatenated as whole string arrays.
+    """
+    if frame.empty:
+        return ""
+
+    def text(col):
+        # Values may come from uploaded data (city names): escape them
+        escaped = frame[col].astype(str)
+        for char in "&<>\"'":  # & first, so the entities added below stay intact
+            escaped = escaped.str.replace(char, html.escape(char), regex=False)
+        return escaped
+
+    cards = ("<div style='display:inline-block;width:" + str(width) + "px;padding:10px;margin:8px;"
+             "background-color:" + text(color) + ";border-radius:10px;text-align:center;"
+             "color:black;font-weight:500;box-shadow:0px 2px 5px rgba(0,0,0,0.1);'>"
+             "<b>" + text(title) + "</b><br>" + text(body) + "<br>"
+             "<small>" + text(caption) + "</small></div>")
+    return cards.str.cat()
@@ -0,0 +1,492 @@
+"""
+Forecasting service for the dashboards.
+
+Per-(city, pollutant, model) fits follow the Milestone 2 notebook (ARIMA(3,1,2),
+Prophet, LSTM with a 10-step input window).  Each fit is stored in an on-disk
+model registry keyed by a hash of the training series, together with its
+holdout RMSE/MAE and a precomputed forecast with confidence intervals.
+Serving a forecast only reads that JSON entry, so a page view never fits a
+model or imports an ML library.
+
+When data is appended, ``update`` brings the newest fit forward instead of
+refitting.  ARIMA filters the new observations through its state space
+with the fitted parameters, the LSTM trains a few epochs on the new windows
+only, and Prophet refits warm-started from its previous parameters.  The
+one-step errors on the new observations are the drift check.  If their
+RMSE exceeds ``DRIFT_FACTOR`` times the fit's own in-sample one-step RMSE,
+the model is refit from scratch.
+"""
+
+import hashlib
+import json
+import math
+import os
+import re
+import time
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from data_store import DATA_DIR
+from backends import load
+
+# -------------------------------------------------
+# Configuration
+# -------------------------------------------------
+REGISTRY_DIR = os.path.join(DATA_DIR, ".models")
+MODEL_VERSION = 1  # bump when fitting code changes to invalidate old entries
+
+MODELS = ["ARIMA", "Prophet", "LSTM"]
+GLOBAL = "Global"  # one cross-city model per pollutant, see global_model.py
+POLLUTANTS = ["PM2.5", "PM10", "NO2", "O3", "SO2"]
+HORIZONS = {"12h": 12, "24h": 24, "48h": 48}
+MAX_HORIZON_HOURS = max(HORIZONS.values())
+
+ARIMA_ORDER = (3, 1, 2)
+LSTM_INPUT = 10
+LSTM_EPOCHS = 20
+LSTM_UPDATE_EPOCHS = 3
+DRIFT_FACTOR = 2.0
+TEST_FRACTION = 0.2
+ALPHA = 0.05
+
+
+# -------------------------------------------------
+# Series preparation
+# -------------------------------------------------
+def city_series(df, city, pollutant, index=None):
+    """Regular, gap-free series of ``pollutant`` for ``city`` indexed by Date."""
+    rows = index.query(city) if index is not None else df[df["City"] == city]
+    s = rows.set_index("Date")[pollutant].astype("float64").dropna()
+    s = s[~s.index.duplicated(keep="last")].sort_index()
+    if len(s) < 3:
+        return s
+    freq = pd.infer_freq(s.index[:50]) or "D"
+    return s.asfreq(freq).interpolate(limit_direction="both")
+
+
+def data_hash(series):
+    """Stable digest of a series' timestamps and values."""
+    h = pd.util.hash_pandas_object(series, index=True).to_numpy()
+    return hashlib.sha1(h.tobytes()).hexdigest()[:16]
+
+
+def step_hours(series):
+    """Length of one step of ``series`` in hours (daily if it has no frequency)."""
+    step = pd.tseries.frequencies.to_offset(series.index.freq or "D")
+    start = pd.Timestamp(0)
+    return ((start + step) - start).total_seconds() / 3600
+
+
+def horizon_steps(series, hours):
+    """Number of series steps needed to cover ``hours`` (at least one)."""
+    return max(1, math.ceil(hours / step_hours(series)))
+
+
+# -------------------------------------------------
+# Model backends
+# -------------------------------------------------
+def _fit_arima(train):
+    return load("ARIMA").ARIMA(train, order=ARIMA_ORDER).fit()
+
+
+def _forecast_arima(fit, steps, alpha):
+    frame = fit.get_forecast(steps).summary_frame(alpha=alpha)
+    return frame["mean"].to_numpy(), frame["mean_ci_lower"].to_numpy(), frame["mean_ci_upper"].to_numpy()
+
+
+def _fit_prophet(train):
+    model = load("Prophet").Prophet(interval_width=1 - ALPHA)
+    model.fit(pd.DataFrame({"ds": train.index, "y": train.to_numpy()}))
+    model.freq_ = train.index.freq
+    return model
+
+
+def _warm_start(model):
+    """Previous Prophet parameters in the form ``Prophet.fit(init=...)`` takes."""
+    params = {name: model.params[name][0][0] for name in ("k", "m", "sigma_obs")}
+    params.update({name: model.params[name][0] for name in ("delta", "beta")})
+    return params
+
+
+def _forecast_prophet(model, steps, alpha):
+    future = model.make_future_dataframe(periods=steps, freq=model.freq_, include_history=False)
+    pred = model.predict(future)
+    return pred["yhat"].to_numpy(), pred["yhat_lower"].to_numpy(), pred["yhat_upper"].to_numpy()
+
+
+class _LSTMModel:
+    """
+    Notebook LSTM plus the scaling and residual spread needed to forecast.
+    Forecasts run on a ``NumpyLSTM`` copy of the weights, and only that copy
+    is pickled, so loading a trained model does not need Keras.
+    """
+
+    def __init__(self, train):
+        from lstm_inference import NumpyLSTM
+        keras = load("LSTM")
+
+        values = train.to_numpy(dtype="float32")
+        self.lo, self.hi = float(values.min()), float(values.max())
+        scaled = self._scale(values)
+        windows = np.lib.stride_tricks.sliding_window_view(scaled[:-1], LSTM_INPUT)
+        X, y = windows[..., None], scaled[LSTM_INPUT:]
+
+        self.net = self._network(keras)
+        self.net.fit(X, y, epochs=LSTM_EPOCHS, batch_size=16, verbose=0)
+        self.runtime = NumpyLSTM.from_keras(self.net)
+
+        fitted = self._unscale(self.runtime.predict(X).ravel())
+        self.resid_std = float(np.std(values[LSTM_INPUT:] - fitted))
+        self.last_window = scaled[-LSTM_INPUT:]
+
+    @staticmethod
+    def _network(keras):
+        net = keras.Sequential([
+            keras.Input(shape=(LSTM_INPUT, 1)),
+            keras.layers.LSTM(64, activation="relu"),
+            keras.layers.Dense(1),
+        ])
+        net.compile(optimizer="adam", loss="mse")
+        return net
+
+    def fine_tune(self, values, epochs=LSTM_UPDATE_EPOCHS):
+        """
+        Train a few epochs on the windows ending in ``values`` (the new
+        observations) and advance the input window.  Returns the one-step
+        errors of the model before tuning.  The scaling range is kept.
+        """
+        from lstm_inference import NumpyLSTM
+        context = np.concatenate([self.last_window, self._scale(np.asarray(values, dtype="float32"))])
+        windows = np.lib.stride_tricks.sliding_window_view(context[:-1], LSTM_INPUT)
+        X, y = windows[..., None], context[LSTM_INPUT:]
+        errors = self._unscale(y) - self._unscale(self.runtime.predict(X).ravel())
+
+        rt = self.runtime
+        self.net = self._network(load("LSTM"))
+        self.net.set_weights([rt.kernel, rt.recurrent, rt.bias, rt.dense_w, rt.dense_b])
+        self.net.fit(X, y, epochs=epochs, batch_size=16, verbose=0)
+        self.runtime = NumpyLSTM.from_keras(self.net)
+        self.last_window = context[-LSTM_INPUT:]
+        return errors
+
+    def _scale(self, x):
+        return (x - self.lo) / ((self.hi - self.lo) or 1.0)
+
+    def _unscale(self, x):
+        return x * ((self.hi - self.lo) or 1.0) + self.lo
+
+    def forecast(self, steps):
+        return self._unscale(self.runtime.forecast(self.last_window[None], steps)[0])
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("net", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if "runtime" not in state:  # pickled before the NumPy runtime existed
+            from lstm_inference import NumpyLSTM
+            self.runtime = NumpyLSTM.from_keras(self.net)
+
+
+def _fit_lstm(train):
+    return _LSTMModel(train)
+
+
+def _forecast_lstm(model, steps, alpha):
+    mean = model.forecast(steps)
+    z = NormalDist().inv_cdf(1 - alpha / 2)
+    spread = z * model.resid_std * np.sqrt(np.arange(1, steps + 1))
+    return mean, mean - spread, mean + spread
+
+
+BACKENDS = {
+    "ARIMA": (_fit_arima, _forecast_arima),
+    "Prophet": (_fit_prophet, _forecast_prophet),
+    "LSTM": (_fit_lstm, _forecast_lstm),
+}
+
+
+# Online updates: (fitted model, full series, new observations) -> (model, errors on the new observations)
+def _update_arima(fit, series, new):
+    # Kalman filter over the new observations only; parameters stay fixed
+    updated = fit.extend(new)
+    return updated, new.to_numpy() - updated.fittedvalues.to_numpy()
+
+
+def _update_prophet(model, series, new):
+    errors = new.to_numpy() - model.predict(pd.DataFrame({"ds": new.index}))["yhat"].to_numpy()
+    updated = load("Prophet").Prophet(interval_width=1 - ALPHA)
+    updated.fit(pd.DataFrame({"ds": series.index, "y": series.to_numpy()}), init=_warm_start(model))
+    updated.freq_ = series.index.freq
+    return updated, errors
+
+
+def _update_lstm(model, series, new):
+    errors = model.fine_tune(new.to_numpy())
+    return model, errors
+
+
+UPDATERS = {
+    "ARIMA": _update_arima,
+    "Prophet": _update_prophet,
+    "LSTM": _update_lstm,
+}
+
+
+# -------------------------------------------------
+# Model registry
+# -------------------------------------------------
+def _safe(name):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(name))
+
+
+class ModelRegistry:
+    """
+    Versioned on-disk store of fitted models.
+
+    Layout: ``<root>/v<MODEL_VERSION>/<model>/<city>/<pollutant>-<hash>.json``
+    with the pickled model object next to it as ``.pkl``.  The JSON entry
+    holds metrics and the precomputed forecast, which is all serving needs.
+    Derived artifacts such as backtests are stored the same way under their
+    own ``kind`` folder in place of a model name.
+    """
+
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = os.path.join(root, f"v{MODEL_VERSION}")
+
+    def _base(self, city, pollutant, model, digest):
+        return os.path.join(self.root, _safe(model), _safe(city), f"{_safe(pollutant)}-{digest}")
+
+    def get(self, city, pollutant, model, digest):
+        """Registry entry as a dict, or ``None`` if this fit does not exist."""
+        path = self._base(city, pollutant, model, digest) + ".json"
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def latest(self, city, pollutant, model):
+        """Most recently written entry for a key regardless of data hash."""
+        folder = os.path.join(self.root, _safe(model), _safe(city))
+        prefix = _safe(pollutant) + "-"
+        if not os.path.isdir(folder):
+            return None
+        names = [n for n in os.listdir(folder) if n.startswith(prefix) and n.endswith(".json")]
+        if not names:
+            return None
+        newest = max(names, key=lambda n: os.path.getmtime(os.path.join(folder, n)))
+        with open(os.path.join(folder, newest)) as f:
+            return json.load(f)
+
+    def put(self, entry, model_obj=None, kind=None):
+        base = self._base(entry["city"], entry["pollutant"], kind or entry["model"], entry["data_hash"])
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        if model_obj is not None:
+            _dump_model(model_obj, base + ".pkl")
+        # Atomic swap so concurrent readers never see a partial entry
+        tmp = base + ".json.tmp"
+        with open(tmp, "w") as f:
+            json.dump(entry, f)
+        os.replace(tmp, base + ".json")
+
+    def load_model(self, city, pollutant, model, digest):
+        """Unpickle the fitted model object (imports its ML library)."""
+        import joblib
+        return joblib.load(self._base(city, pollutant, model, digest) + ".pkl")
+
+
+def _dump_model(model_obj, path):
+    import joblib
+    tmp = path + ".tmp"
+    joblib.dump(model_obj, tmp)
+    os.replace(tmp, path)
+
+
+# -------------------------------------------------
+# Training & serving
+# -------------------------------------------------
+def _metrics(actual, predicted):
+    err = np.asarray(actual, dtype="float64") - np.asarray(predicted, dtype="float64")
+    return float(np.sqrt(np.mean(err ** 2))), float(np.mean(np.abs(err)))
+
+
+def train(series, city, pollutant, model, registry=None, save_model=True):
+    """
+    Fit ``model`` on ``series``, score it on the last ``TEST_FRACTION`` of
+    the data and store the full-history fit plus its forecast.  Returns the
+    registry entry.  Existing entries for the same data hash are reused.
+    """
+    registry = registry or ModelRegistry()
+    digest = data_hash(series)
+    cached = registry.get(city, pollutant, model, digest)
+    if cached is not None:
+        return cached
+
+    fit_fn, forecast_fn = BACKENDS[model]
+    started = time.time()
+
+    # Holdout evaluation as in the notebook: fit on 80%, forecast the rest
+    split = int(len(series) * (1 - TEST_FRACTION))
+    train_part, test_part = series.iloc[:split], series.iloc[split:]
+    holdout_fit = fit_fn(train_part)
+    mean, _, _ = forecast_fn(holdout_fit, len(test_part), ALPHA)
+    rmse, mae = _metrics(test_part.to_numpy(), mean)
+
+    # Serving fit on the full history; ARIMA only needs its state extended
+    if model == "ARIMA":
+        final_fit = holdout_fit.append(test_part)
+    else:
+        final_fit = fit_fn(series)
+
+    entry = _entry(series, city, pollutant, model, digest, final_fit, rmse, mae,
+                   _resid_rmse(model, final_fit, series), started)
+    registry.put(entry, final_fit if save_model else None)
+    return entry
+
+
+def _resid_rmse(model, fitted, series):
+    """In-sample one-step RMSE of a fit, the baseline of the drift check."""
+    if model == "LSTM":
+        return fitted.resid_std
+    if model == "ARIMA":
+        resid = np.asarray(fitted.resid)[ARIMA_ORDER[1]:]  # first residuals are the diffuse start
+    else:
+        resid = series.to_numpy() - fitted.predict(pd.DataFrame({"ds": series.index}))["yhat"].to_numpy()
+    return float(np.sqrt(np.mean(np.square(resid))))
+
+
+def _entry(series, city, pollutant, model, digest, fitted, rmse, mae, resid_rmse, started):
+    """Registry entry with the forecast of ``fitted`` past the end of ``series``."""
+    steps = horizon_steps(series, MAX_HORIZON_HOURS)
+    mean, lower, upper = BACKENDS[model][1](fitted, steps, ALPHA)
+    dates = pd.date_range(series.index[-1], periods=steps + 1, freq=series.index.freq)[1:]
+    return {
+        "city": city,
+        "pollutant": pollutant,
+        "model": model,
+        "data_hash": digest,
+        "model_version": MODEL_VERSION,
+        "trained_at": pd.Timestamp.now().isoformat(),
+        "train_seconds": round(time.time() - started, 3),
+        "n_obs": int(len(series)),
+        "freq": series.index.freqstr,
+        "last_date": series.index[-1].isoformat(),
+        "RMSE": rmse,
+        "MAE": mae,
+        "resid_rmse": resid_rmse,
+        "forecast": {
+            "Date": [d.isoformat() for d in dates],
+            "Forecast": [float(v) for v in mean],
+            "Lower": [float(v) for v in lower],
+            "Upper": [float(v) for v in upper],
+        },
+    }
+
+
+def _last_date(entry):
+    """Last observation a registry entry was fitted on."""
+    if "last_date" in entry:
+        return pd.Timestamp(entry["last_date"])
+    # Entries written before last_date was stored: one step before the forecast
+    return pd.Timestamp(entry["forecast"]["Date"][0]) - pd.tseries.frequencies.to_offset(entry["freq"])
+
+
+def update(series, city, pollutant, model, registry=None, drift_factor=DRIFT_FACTOR):
+    """
+    Bring the newest fit of ``model`` up to date with ``series`` without
+    refitting it, when ``series`` only appends observations to the data
+    that fit saw.  Falls back to ``train`` when there is no usable fit, the
+    history changed, or the one-step RMSE on the new observations exceeds
+    ``drift_factor`` times the fit's in-sample one (the holdout RMSE for
+    entries that predate it).  Returns the registry entry;
+    ``entry["update"]`` records how it was produced.
+    """
+    registry = registry or ModelRegistry()
+    digest = data_hash(series)
+    cached = registry.get(city, pollutant, model, digest)
+    if cached is not None:
+        return cached
+
+    started = time.time()
+    base = registry.latest(city, pollutant, model)
+    if base is None:
+        return train(series, city, pollutant, model, registry)
+    last = _last_date(base)
+    new = series[series.index > last]
+    appended_only = (not new.empty and base.get("freq") == series.index.freqstr
+                     and data_hash(series[series.index <= last]) == base["data_hash"])
+    if not appended_only:
+        return train(series, city, pollutant, model, registry)
+    try:
+        fitted = registry.load_model(city, pollutant, model, base["data_hash"])
+    except FileNotFoundError:
+        return train(series, city, pollutant, model, registry)
+
+    fitted, errors = UPDATERS[model](fitted, series, new)
+    drift_rmse = float(np.sqrt(np.mean(np.square(errors))))
+    baseline = base.get("resid_rmse") or base["RMSE"]
+    info = {"base_hash": base["data_hash"], "new_obs": int(len(new)), "drift_rmse": drift_rmse}
+    if drift_rmse > drift_factor * baseline:
+        entry = train(series, city, pollutant, model, registry)
+        entry["update"] = dict(info, mode="refit")
+        registry.put(entry)
+        return entry
+
+    entry = _entry(series, city, pollutant, model, digest, fitted, base["RMSE"], base["MAE"], baseline, started)
+    entry["update"] = dict(info, mode="online")
+    registry.put(entry, fitted)
+    return entry
+
+
+def get_forecast(df, city, pollutant, model, horizon="24h", index=None, registry=None):
+    """
+    Cached forecast for ``horizon`` (``None``: every stored step) as a
+    DataFrame with Date, Forecast, Lower and Upper columns, or ``None`` if no
+    model has been trained yet.  Falls back to the newest entry when the data
+    has changed since the last fit.
+    """
+    registry = registry or ModelRegistry()
+    series = city_series(df, city, pollutant, index=index)
+    if series.empty:
+        return None
+    entry = registry.get(city, pollutant, model, data_hash(series))
+    if entry is None:
+        entry = registry.latest(city, pollutant, model)
+    if entry is None:
+        return None
+    frame = pd.DataFrame(entry["forecast"])
+    if horizon is not None:
+        frame = frame.head(horizon_steps(series, HORIZONS[horizon]))
+    frame["Date"] = pd.to_datetime(frame["Date"])
+    return frame
+
+
+def performance_table(city, pollutants=POLLUTANTS, models=MODELS, registry=None):
+    """Holdout RMSE/MAE of the newest fit for every pollutant and model of ``city``."""
+    registry = registry or ModelRegistry()
+    rows = []
+    for pollutant in pollutants:
+        for model in models:
+            entry = registry.latest(city, pollutant, model) or {}
+            rows.append({"Pollutant": pollutant, "Model": model,
+                         "RMSE": entry.get("RMSE", np.nan), "MAE": entry.get("MAE", np.nan),
+                         "Trained": entry.get("trained_at")})
+    return pd.DataFrame(rows)
+
+
+def best_models(perf, metric="RMSE"):
+    """Lowest-``metric`` model per pollutant from a ``performance_table``."""
+    rows = []
+    for pollutant, group in perf.groupby("Pollutant", sort=False):
+        scored = group.dropna(subset=[metric])
+        if scored.empty:
+            rows.append({"Pollutant": pollutant, "Best Model": None, metric: np.nan, "Status": "Not trained"})
+            continue
+        best = scored.loc[scored[metric].idxmin()]
+        rows.append({"Pollutant": pollutant, "Best Model": best["Model"],
+                     metric: round(float(best[metric]), 2), "Status": "Active"})
+    return pd.DataFrame(rows)
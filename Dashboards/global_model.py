@@ -0,0 +1,301 @@
+"""
+Global forecasting mode: one gradient-boosted model per pollutant, shared by every city.
+
+Instead of one univariate fit per (city, pollutant), every city's history
+is laid out on a common daily grid (Date x City) and turned into features
+with whole-grid shifts and rolling windows:
+
+    lags       the value 1, 2, 3, 7 and 14 days before the first forecast day
+    rolling    7- and 30-day mean and spread
+    spatial    the same-day mean over all cities, and its 7-day mean
+    exogenous  the latest reading of the other main pollutants
+    calendar   day of week and season of the target date, and the horizon
+
+The forecast is direct: the horizon is a feature, so one model covers all
+``GLOBAL_STEPS`` days ahead.  It is one fit per pollutant and one batched
+predict for every station.  A city that was never seen in training is
+forecast as soon as it has ``max(LAGS)`` days of history, with no fit of its
+own.  The booster is XGBoost when installed, else scikit-learn's
+histogram gradient boosting.
+
+Each city's forecast is written to the model registry as an ordinary entry
+of model ``"Global"``, so ``forecasting.get_forecast`` and the dashboards
+serve it like any other model::
+
+    python global_model.py                        # train and forecast every pollutant
+    python global_model.py --forecast-only        # re-forecast (new data or stations) without fitting
+"""
+
+import argparse
+import time
+from statistics import NormalDist
+
+import numpy as np
+import pandas as pd
+
+from backends import available, load
+from forecasting import (ALPHA, GLOBAL, MODEL_VERSION, POLLUTANTS, TEST_FRACTION, ModelRegistry, city_series,
+                         data_hash)
+
+GLOBAL_STEPS = 7
+FREQ = "D"
+LAGS = (1, 2, 3, 7, 14)
+WINDOWS = (7, 30)
+EXOGENOUS = ["PM2.5", "PM10", "NO2", "CO", "SO2", "O3"]
+ALL_CITIES = "_all"
+
+
+def _regressor():
+    if available(GLOBAL):
+        return load(GLOBAL).XGBRegressor(n_estimators=400, learning_rate=0.05, max_depth=6,
+                                         subsample=0.8, tree_method="hist")
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    return HistGradientBoostingRegressor(max_iter=300, learning_rate=0.05, random_state=0)
+
+
+# -------------------------------------------------
+# Features
+# -------------------------------------------------
+def grid(df, columns, freq=FREQ):
+    """
+    ``{column: Date x City frame}`` on a regular ``freq`` grid (duplicates
+    averaged).  Every frame has the same cities, so a city that never
+    reported a column gets an all-NaN column for it.
+    """
+    wide = df.pivot_table(index="Date", columns="City", values=columns, observed=True)
+    wide = wide.resample(freq).mean()
+    cities = wide.columns.get_level_values("City").unique()
+    return {c: wide[c].reindex(columns=cities) if c in wide else pd.DataFrame(np.nan, wide.index, cities)
+            for c in columns}
+
+
+def origin_features(wide, target):
+    """
+    ``(names, X)`` with ``X`` of shape (dates, cities, features): what is
+    known at the end of each day, for a forecast starting the next day.
+    """
+    y = wide[target]
+    names, blocks = [], []
+
+    def add(name, frame):
+        names.append(name)
+        blocks.append(np.asarray(frame, dtype="float32"))
+
+    for lag in LAGS:
+        add(f"lag{lag}", y.shift(lag - 1))
+    for w in WINDOWS:
+        add(f"mean{w}", y.rolling(w, min_periods=w // 2).mean())
+        add(f"std{w}", y.rolling(w, min_periods=w // 2).std())
+    cities = np.ones((1, y.shape[1]), dtype="float32")
+    add("all_cities", y.mean(axis=1).to_numpy()[:, None] * cities)
+    add("all_cities_mean7", y.rolling(7, min_periods=3).mean().mean(axis=1).to_numpy()[:, None] * cities)
+    for col in EXOGENOUS:
+        if col != target and col in wide:
+            add(col, wide[col])
+    return names, np.stack(blocks, axis=-1)
+
+
+def _calendar(dates, steps):
+    """(dates, steps, 4) day-of-week, season (sin/cos) and horizon of each target date."""
+    h = np.arange(1, steps + 1)
+    target = dates.to_numpy()[:, None] + pd.to_timedelta(h, unit="D").to_numpy()[None, :]
+    target = pd.DatetimeIndex(target.ravel())
+    angle = 2 * np.pi * target.dayofyear.to_numpy() / 365.25
+    cal = np.stack([target.dayofweek.to_numpy(), np.sin(angle), np.cos(angle), np.tile(h, len(dates))], axis=-1)
+    return cal.reshape(len(dates), steps, 4).astype("float32")
+
+
+CALENDAR = ["dayofweek", "season_sin", "season_cos", "horizon"]
+
+
+# -------------------------------------------------
+# Model
+# -------------------------------------------------
+class GlobalModel:
+    """Direct multi-horizon booster for one pollutant across all cities."""
+
+    def __init__(self, target, steps=GLOBAL_STEPS):
+        self.target = target
+        self.steps = steps
+        self.features = None
+        self.regressor = None
+        self.resid_std = None
+        self.holdout = {}
+
+    def _rows(self, wide):
+        """Training rows: every (date, city, horizon) with a known target."""
+        names, X = origin_features(wide, self.target)
+        y = wide[self.target].to_numpy(dtype="float32")
+        T, C, _ = X.shape
+        h = np.arange(1, self.steps + 1)
+        Y = np.full((T, self.steps, C), np.nan, dtype="float32")          # target k days after each origin
+        for k in h:
+            Y[:T - k, k - 1] = y[k:]
+        cal = _calendar(wide[self.target].index, self.steps)               # (T, H, 4)
+
+        Xfull = np.concatenate([np.broadcast_to(X[:, None], (T, self.steps, C, X.shape[-1])),
+                                np.broadcast_to(cal[:, :, None], (T, self.steps, C, 4))], axis=-1)
+        keep = ~np.isnan(Y) & ~np.isnan(X[:, None, :, 0])
+        origin = np.broadcast_to(np.arange(T)[:, None, None], keep.shape)
+        city = np.broadcast_to(np.arange(C)[None, None, :], keep.shape)
+        horizon = np.broadcast_to(h[None, :, None], keep.shape)
+        return names + CALENDAR, Xfull[keep], Y[keep], origin[keep], city[keep], horizon[keep]
+
+    def fit(self, df):
+        """Holdout-score on the last ``TEST_FRACTION`` of dates, then fit on everything."""
+        wide = grid(df, [self.target] + [c for c in EXOGENOUS if c != self.target and c in df.columns])
+        self.features, X, y, origin, city, horizon = self._rows(wide)
+        cutoff = int(len(wide[self.target]) * (1 - TEST_FRACTION))
+        train = origin + horizon < cutoff
+        test = origin >= cutoff
+
+        holdout = _regressor().fit(X[train], y[train])
+        err = y[test] - holdout.predict(X[test])
+        self.resid_std = np.array([err[horizon[test] == k].std() if (horizon[test] == k).any() else np.nan
+                                   for k in range(1, self.steps + 1)])
+        cities = wide[self.target].columns
+        for c in np.unique(city[test]):
+            e = err[city[test] == c]
+            self.holdout[cities[c]] = (float(np.sqrt(np.mean(e ** 2))), float(np.mean(np.abs(e))))
+
+        self.regressor = _regressor().fit(X, y)
+        return self
+
+    def predict(self, df, cities=None):
+        """
+        ``{city: (last_date, mean, lower, upper)}`` for every city with enough
+        history, all in one batched predict.
+        """
+        wide = grid(df, [self.target] + [c for c in EXOGENOUS if c != self.target and c in df.columns])
+        names, X = origin_features(wide, self.target)
+        for col in self.features:
+            if col not in names and col not in CALENDAR:  # exogenous column missing from this data
+                names.append(col)
+                X = np.concatenate([X, np.full(X.shape[:2] + (1,), np.nan, dtype="float32")], axis=-1)
+        X = X[..., [names.index(c) for c in self.features if c not in CALENDAR]]
+
+        y = wide[self.target]
+        observed = y.notna().to_numpy()
+        enough = observed.sum(axis=0) >= max(LAGS)
+        if cities is not None:
+            enough &= y.columns.isin(list(cities))
+        cols = np.flatnonzero(enough)
+        if not len(cols):
+            return {}
+        last = len(observed) - 1 - np.argmax(observed[::-1, cols], axis=0)   # last observed row per city
+        dates = y.index[last]
+        batch = np.concatenate([np.repeat(X[last, cols][:, None], self.steps, axis=1),
+                                _calendar(dates, self.steps)], axis=-1)
+        mean = self.regressor.predict(batch.reshape(-1, batch.shape[-1])).reshape(len(cols), self.steps)
+
+        z = NormalDist().inv_cdf(1 - ALPHA / 2)
+        spread = z * np.nan_to_num(self.resid_std, nan=np.nanmax(self.resid_std))
+        return {y.columns[c]: (dates[k], mean[k], mean[k] - spread, mean[k] + spread) for k, c in enumerate(cols)}
+
+
+# -------------------------------------------------
+# Registry
+# -------------------------------------------------
+def _entries(model, df, index=None, cities=None, started=None):
+    """Per-city registry entries of ``model``'s batched forecast."""
+    started = started or time.time()
+    forecasts = model.predict(df, cities)
+    entries = []
+    for city, (last, mean, lower, upper) in forecasts.items():
+        series = city_series(df, city, model.target, index=index)
+        rmse, mae = model.holdout.get(city, (np.nan, np.nan))
+        dates = pd.date_range(last, periods=model.steps + 1, freq=FREQ)[1:]
+        entries.append({
+            "city": city,
+            "pollutant": model.target,
+            "model": GLOBAL,
+            "data_hash": data_hash(series),
+            "model_version": MODEL_VERSION,
+            "trained_at": pd.Timestamp.now().isoformat(),
+            "train_seconds": round(time.time() - started, 3),
+            "n_obs": int(len(series)),
+            "freq": series.index.freqstr,
+            "last_date": last.isoformat(),
+            "RMSE": rmse,
+            "MAE": mae,
+            "resid_rmse": float(model.resid_std[0]),
+            "forecast": {
+                "Date": [d.isoformat() for d in dates],
+                "Forecast": [float(v) for v in mean],
+                "Lower": [float(v) for v in lower],
+                "Upper": [float(v) for v in upper],
+            },
+        })
+    return entries
+
+
+def train_global(df, pollutant, registry=None, index=None, steps=GLOBAL_STEPS):
+    """
+    Fit the global model for ``pollutant`` and write every city's forecast
+    to the registry.  Returns the per-city entries.
+    """
+    registry = registry or ModelRegistry()
+    started = time.time()
+    model = GlobalModel(pollutant, steps).fit(df)
+    entries = _entries(model, df, index, started=started)
+    for entry in entries:
+        registry.put(entry)
+    digest = data_hash(pd.Series([e["data_hash"] for e in entries], dtype="object"))
+    registry.put({"city": ALL_CITIES, "pollutant": pollutant, "model": GLOBAL, "data_hash": digest,
+                  "trained_at": pd.Timestamp.now().isoformat(), "cities": len(entries),
+                  "train_seconds": round(time.time() - started, 3)}, model)
+    # Round trip: the scheduler and the dashboards unpickle this in other processes
+    loaded = registry.load_model(ALL_CITIES, pollutant, GLOBAL, digest)
+    if type(loaded).__module__ != __name__ or __name__ == "__main__":
+        raise RuntimeError(f"global {pollutant} model pickled as {type(loaded).__module__}.GlobalModel, "
+                           "which other processes cannot import")
+    return entries
+
+
+def forecast_global(df, pollutant, registry=None, index=None, cities=None):
+    """
+    Forecast with the last fitted global model (no fit): picks up new data
+    and new stations.  Returns the entries written, or ``None`` if untrained.
+    """
+    registry = registry or ModelRegistry()
+    latest = registry.latest(ALL_CITIES, pollutant, GLOBAL)
+    if latest is None:
+        return None
+    model = registry.load_model(ALL_CITIES, pollutant, GLOBAL, latest["data_hash"])
+    entries = _entries(model, df, index, cities)
+    for entry in entries:
+        registry.put(entry)
+    return entries
+
+
+def main():
+    from data_store import load_data
+    from station_index import StationIndex
+    # Run as a script this file is __main__; train through the importable
+    # module so the pickled model resolves as global_model.GlobalModel
+    from global_model import forecast_global, train_global
+    parser = argparse.ArgumentParser(description="Train the cross-city global forecasting model.")
+    parser.add_argument("--data", default=None)
+    parser.add_argument("--pollutants", nargs="*", default=POLLUTANTS + ["AQI"])
+    parser.add_argument("--forecast-only", action="store_true", help="re-forecast with the saved models")
+    args = parser.parse_args()
+
+    df = load_data(args.data)
+    index = StationIndex(df)
+    for pollutant in args.pollutants:
+        if pollutant not in df.columns:
+            continue
+        started = time.time()
+        if args.forecast_only:
+            entries = forecast_global(df, pollutant, index=index)
+            if entries is None:
+                print(f"{pollutant}: no global model yet")
+                continue
+        else:
+            entries = train_global(df, pollutant, index=index)
+        rmse = np.nanmean([e["RMSE"] for e in entries]) if entries else np.nan
+        print(f"{pollutant}: {len(entries)} cities in {time.time() - started:.1f}s, mean holdout RMSE {rmse:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Startup cost of each dashboard's imports.
+
+Every dashboard's top-level import statements are run in a fresh
+interpreter, the way a new Streamlit server process would, and the wall
+time, peak RSS and heavy ML packages pulled in are reported.  Run it before
+and after a change to track cold start:
+
+    python import_benchmark.py
+    python import_benchmark.py Dashboard2.py --repeat 5 --json startup.json
+"""
+
+import argparse
+import ast
+import glob
+import json
+import os
+import subprocess
+import sys
+
+from backends import HEAVY_PACKAGES
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Runs in the child: time the imports, then report RSS and heavy packages
+PROBE = """
+import json, resource, sys, time
+sys.path.insert(0, {here!r})
+start = time.perf_counter()
+{imports}
+seconds = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+scale = 1 if sys.platform == "darwin" else 1024  # ru_maxrss is KB on Linux
+print(json.dumps({{"seconds": seconds, "peak_rss_mb": rss * scale / 2**20,
+                  "heavy": [p for p in {heavy!r} if p in sys.modules]}}))
+"""
+
+
+def import_block(path):
+    """Top-level imports of a script (including ``try:`` wrapped ones) as source."""
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    nodes = []
+    for node in tree.body:
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            nodes.append(node)
+        elif isinstance(node, ast.Try) and all(isinstance(n, (ast.Import, ast.ImportFrom)) for n in node.body):
+            # Optional imports: keep the try/except so missing packages don't abort
+            nodes.append(ast.Try(body=node.body, handlers=[ast.ExceptHandler(
+                type=ast.Name("Exception", ast.Load()), name=None, body=[ast.Pass()])],
+                orelse=[], finalbody=[]))
+    module = ast.fix_missing_locations(ast.Module(body=nodes, type_ignores=[]))
+    return ast.unparse(module) or "pass"
+
+
+def measure(path, repeat=3):
+    """Best-of-``repeat`` import time, peak RSS and heavy packages of ``path``."""
+    code = PROBE.format(here=HERE, imports=import_block(path), heavy=HEAVY_PACKAGES)
+    runs = []
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=HERE)
+        if out.returncode != 0:
+            raise RuntimeError(f"{path}: {out.stderr.strip().splitlines()[-1]}")
+        runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    best = min(runs, key=lambda r: r["seconds"])
+    return {"script": os.path.basename(path), "seconds": round(best["seconds"], 3),
+            "peak_rss_mb": round(max(r["peak_rss_mb"] for r in runs), 1), "heavy": best["heavy"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and memory per dashboard.")
+    parser.add_argument("scripts", nargs="*", help="defaults to every Dashboard*.py")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", default=None, help="optional path to write the results to")
+    args = parser.parse_args()
+
+    scripts = args.scripts or sorted(glob.glob(os.path.join(HERE, "Dashboard*.py")))
+    results = [measure(path, args.repeat) for path in scripts]
+    print(f"{'script':<16}{'seconds':>9}{'peak RSS MB':>13}  heavy packages")
+    for r in results:
+        print(f"{r['script']:<16}{r['seconds']:>9.3f}{r['peak_rss_mb']:>13.1f}  {', '.join(r['heavy']) or '-'}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,238 @@
+"""
+Incremental ingestion of new air quality readings.
+
+Readings are streamed in chunks from CSV or JSONL files (or stdin),
+validated, deduplicated on (City, Date) and appended to the dataset as new
+month partitions next to its columnar store::
+
+    .store/<dataset>/date=2020-07/part-<timestamp>.arrow
+    .store/<dataset>/keys/2020-07.npy     sorted (City, Date) keys per month
+    .store/<dataset>/cities.json          stable City -> id mapping for keys
+    .store/<dataset>/manifest.json        partition list and data version
+
+Existing files are never rewritten.  Deduplication only reads the key files
+of the months a chunk touches, and registered hooks receive just the new
+rows, so intake cost follows the size of the new data rather than the
+history.
+
+    python ingest.py new_readings.csv
+    tail -f feed.jsonl | python ingest.py - --format jsonl
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from data_store import (CLEANED_CSV, POLLUTANTS, build_store, normalize_frame,
+                        partitions_dir, read_manifest, resolve_name, load_table, to_arrow, write_table)
+from aqi import categorize, compute_aqi
+
+CHUNK_ROWS = 50_000
+DATE_SHIFT = 40  # key = city_id << 40 | seconds since epoch
+
+# Callbacks ``hook(name, new_rows)`` run after each partition is written
+INGEST_HOOKS = []
+
+
+def on_ingest(hook):
+    """Register ``hook(name, new_rows)`` to update downstream state incrementally."""
+    INGEST_HOOKS.append(hook)
+    return hook
+
+
+# -------------------------------------------------
+# Reading & validation
+# -------------------------------------------------
+def read_chunks(source, fmt=None, chunksize=CHUNK_ROWS):
+    """Yield DataFrame chunks from a CSV/JSONL path, ``-`` for stdin, or a buffer."""
+    if fmt is None:
+        fmt = "jsonl" if str(source).endswith((".jsonl", ".json")) else "csv"
+    handle = sys.stdin if source == "-" else source
+    if fmt == "jsonl":
+        reader = pd.read_json(handle, lines=True, chunksize=chunksize)
+    else:
+        reader = pd.read_csv(handle, chunksize=chunksize)
+    with reader:
+        yield from reader
+
+
+def validate(chunk):
+    """
+    Coerce a raw chunk to the store schema.  Rows without a City or a
+    parseable Date are dropped, negative concentrations become NaN and a
+    missing AQI/AQI_Bucket is derived from the pollutants.
+    Returns ``(valid_rows, n_invalid)``.
+    """
+    names = [str(c).strip().lower() for c in chunk.columns]
+    if "city" not in names or not any("date" in c or "time" in c for c in names):
+        raise ValueError("input needs City and Date columns")
+    # Headers are matched case-insensitively; renaming leaves the caller's frame alone
+    chunk = chunk.rename(columns={chunk.columns[names.index("city")]: "City"})
+    chunk = normalize_frame(chunk)
+    ok = chunk["City"].notna() & chunk["Date"].notna()
+    chunk = chunk[ok].copy()
+
+    numeric = [c for c in POLLUTANTS + ["AQI"] if c in chunk.columns]
+    chunk[numeric] = chunk[numeric].mask(chunk[numeric] < 0)
+
+    derived = compute_aqi(chunk).astype("float32")
+    chunk["AQI"] = chunk["AQI"].fillna(derived) if "AQI" in chunk.columns else derived
+    bucket, _ = categorize(chunk["AQI"])
+    if "AQI_Bucket" in chunk.columns:
+        chunk["AQI_Bucket"] = chunk["AQI_Bucket"].astype(str).where(chunk["AQI_Bucket"].notna(), bucket)
+    else:
+        chunk["AQI_Bucket"] = bucket
+    chunk["AQI_Bucket"] = chunk["AQI_Bucket"].astype("category")
+    return chunk, int((~ok).sum())
+
+
+# -------------------------------------------------
+# Key files
+# -------------------------------------------------
+class KeyStore:
+    """Sorted int64 (City, Date) keys per month, used to dedupe new rows."""
+
+    def __init__(self, name):
+        self.root = partitions_dir(name)
+        self.keys_dir = os.path.join(self.root, "keys")
+        self.cities_path = os.path.join(self.root, "cities.json")
+        self.cities = {}
+        if os.path.exists(self.cities_path):
+            with open(self.cities_path) as f:
+                self.cities = json.load(f)
+
+    def encode(self, df):
+        for city in pd.unique(df["City"].astype(str)):
+            self.cities.setdefault(city, len(self.cities))
+        ids = df["City"].astype(str).map(self.cities).to_numpy(dtype="int64")
+        seconds = df["Date"].to_numpy(dtype="datetime64[s]").astype("int64")
+        return (ids << DATE_SHIFT) | seconds
+
+    def _path(self, month):
+        return os.path.join(self.keys_dir, f"{month}.npy")
+
+    def load(self, month):
+        path = self._path(month)
+        return np.load(path) if os.path.exists(path) else np.array([], dtype="int64")
+
+    def add(self, month, keys):
+        merged = np.union1d(self.load(month), keys)
+        os.makedirs(self.keys_dir, exist_ok=True)
+        tmp = self._path(month) + ".tmp.npy"
+        np.save(tmp, merged)
+        os.replace(tmp, self._path(month))
+
+    def save_cities(self):
+        _write_json(self.cities_path, self.cities)
+
+    def bootstrap(self, df):
+        """One-time build of the key files from the existing history."""
+        if os.path.isdir(self.keys_dir):
+            for stale in os.listdir(self.keys_dir):
+                os.remove(os.path.join(self.keys_dir, stale))
+        keys = self.encode(df)
+        months = df["Date"].dt.strftime("%Y-%m").to_numpy()
+        for month in np.unique(months):
+            self.add(month, keys[months == month])
+        self.save_cities()
+
+
+def _write_json(path, obj):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp, path)
+
+
+# -------------------------------------------------
+# Ingestion
+# -------------------------------------------------
+def _conform(df, schema):
+    """Reorder/extend ``df`` to the base store's columns and Arrow types."""
+    return to_arrow(df.reindex(columns=schema.names)).cast(schema)
+
+
+def ingest_frame(chunk, name=CLEANED_CSV):
+    """Validate, dedupe and append one chunk.  Returns a stats dict."""
+    name = resolve_name(name)
+    base = build_store(name)
+    schema = pa.ipc.open_file(pa.memory_map(base, "r")).schema
+    manifest = read_manifest(name)
+    keystore = KeyStore(name)
+    manifest_path = os.path.join(partitions_dir(name), "manifest.json")
+    if manifest.get("base_mtime") != os.path.getmtime(base):
+        # First ingest, or the base CSV was rebuilt: (re)index existing keys once
+        os.makedirs(partitions_dir(name), exist_ok=True)
+        keystore.bootstrap(load_table(name).select(["City", "Date"]).to_pandas())
+        manifest["base_mtime"] = os.path.getmtime(base)
+        _write_json(manifest_path, manifest)
+
+    rows, invalid = validate(chunk)
+    deduped = rows.drop_duplicates(["City", "Date"], keep="last")
+    repeated, rows = len(rows) - len(deduped), deduped
+    keys = keystore.encode(rows)
+    months = rows["Date"].dt.strftime("%Y-%m").to_numpy()
+    fresh = np.ones(len(rows), dtype=bool)
+    for month in np.unique(months):
+        in_month = months == month
+        fresh[in_month] = ~np.isin(keys[in_month], keystore.load(month))
+
+    stats = {"rows": int(len(chunk)), "invalid": invalid,
+             "duplicates": repeated + int((~fresh).sum()), "appended": int(fresh.sum()), "partitions": []}
+    new_rows = rows[fresh].sort_values(["City", "Date"], kind="stable")
+    if new_rows.empty:
+        return stats
+
+    stamp = time.strftime("%Y%m%dT%H%M%S") + f"-{time.time_ns() % 1_000_000:06d}"
+    new_months = new_rows["Date"].dt.strftime("%Y-%m").to_numpy()
+    for month in np.unique(new_months):
+        part = new_rows[new_months == month]
+        rel = os.path.join(f"date={month}", f"part-{stamp}.arrow")
+        path = os.path.join(partitions_dir(name), rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_table(_conform(part, schema), path)
+        keystore.add(month, keystore.encode(part))
+        manifest["partitions"].append({"path": rel, "rows": int(len(part)),
+                                       "min_date": str(part["Date"].min()), "max_date": str(part["Date"].max())})
+        stats["partitions"].append(rel)
+
+    keystore.save_cities()
+    manifest["version"] += 1
+    _write_json(manifest_path, manifest)
+    for hook in INGEST_HOOKS:
+        hook(name, new_rows)
+    return stats
+
+
+def ingest(source, name=CLEANED_CSV, fmt=None, chunksize=CHUNK_ROWS):
+    """Stream ``source`` chunk by chunk into the dataset; returns summed stats."""
+    total = {"rows": 0, "invalid": 0, "duplicates": 0, "appended": 0, "partitions": []}
+    for chunk in read_chunks(source, fmt, chunksize):
+        stats = ingest_frame(chunk, name)
+        for key in total:
+            total[key] += stats[key]
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Append new readings to the columnar store.")
+    parser.add_argument("sources", nargs="+", help="CSV/JSONL files, or - for stdin")
+    parser.add_argument("--dataset", default=CLEANED_CSV, help="dataset CSV the readings belong to")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    parser.add_argument("--chunksize", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+
+    for source in args.sources:
+        stats = ingest(source, args.dataset, args.format, args.chunksize)
+        print(f"{source}: {stats['appended']} appended, {stats['duplicates']} duplicates, "
+              f"{stats['invalid']} invalid, {len(stats['partitions'])} partition file(s)")
+
+
+if __name__ == "__main__":
+    main()
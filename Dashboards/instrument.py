@@ -0,0 +1,310 @@
+"""
+Timing, row counts and payload sizes of the dashboards' hot-path stages.
+
+A page run (one Streamlit rerun, or one API request) is a ``Trace``; the
+load, filter, aggregate, model and chart steps inside it are stages::
+
+    begin("Dashboard1")
+    with stage("filter") as s:
+        filtered = index.query(city)
+        s.record(filtered)            # rows and bytes
+    ...
+    end()                             # totals, JSON log line, optional profile
+
+Functions can be wrapped with ``@timed("aggregate")`` instead.  Every stage
+also feeds process-wide counters that ``prometheus_text()`` renders in the
+Prometheus text format (``/metrics`` on the API, or ``serve_metrics`` for the
+Streamlit process).  Finished traces are logged as JSON on the
+``airq.metrics`` logger (to a file with ``AIRQ_METRICS_LOG=path``) and the
+last few are kept for the admin panel.  A sampled share of reruns
+(``AIRQ_PROFILE_RATE``, e.g. ``0.01``) or an explicitly requested one is
+profiled with pyinstrument when installed, else cProfile.
+"""
+
+import contextvars
+import functools
+import io
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+from query_cache import sizeof
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+RECENT_TRACES = 50
+RECENT_PROFILES = 5
+PROFILE_RATE = float(os.environ.get("AIRQ_PROFILE_RATE", "0"))
+PROFILE_LINES = 40
+
+log = logging.getLogger("airq.metrics")
+if os.environ.get("AIRQ_METRICS_LOG"):
+    _handler = logging.FileHandler(os.environ["AIRQ_METRICS_LOG"])
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    log.addHandler(_handler)
+    log.setLevel(logging.INFO)
+
+_current = contextvars.ContextVar("airq_trace", default=None)
+
+
+def payload_bytes(value):
+    """Approximate bytes a value puts on the wire (figures: their trace arrays)."""
+    if hasattr(value, "data") and hasattr(value, "layout"):  # plotly Figure
+        total = 0
+        for trace in value.data:
+            for attr in ("x", "y", "z", "values", "labels", "text", "customdata", "width"):
+                arr = getattr(trace, attr, None)
+                if arr is not None and not isinstance(arr, (str, int, float)):
+                    total += sizeof(arr) if hasattr(arr, "nbytes") else 8 * len(arr)
+        return total
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return sizeof(value)
+
+
+# -------------------------------------------------
+# Metrics
+# -------------------------------------------------
+class Metrics:
+    """Process-wide per (page, stage) counters and latency histograms."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {}   # (page, stage) -> [count, seconds, rows, bytes, max, buckets]
+        self._reruns = {}   # page -> [count, seconds]
+
+    def observe(self, page, name, seconds, rows=None, nbytes=None):
+        with self._lock:
+            item = self._stages.setdefault((page, name), [0, 0.0, 0, 0, 0.0, [0] * len(BUCKETS)])
+            item[0] += 1
+            item[1] += seconds
+            item[2] += rows or 0
+            item[3] += nbytes or 0
+            item[4] = max(item[4], seconds)
+            for k, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    item[5][k] += 1
+
+    def observe_rerun(self, page, seconds):
+        with self._lock:
+            item = self._reruns.setdefault(page, [0, 0.0])
+            item[0] += 1
+            item[1] += seconds
+
+    def stages(self):
+        """Per-stage summaries, slowest mean first."""
+        with self._lock:
+            rows = [{"page": page, "stage": name, "count": c, "mean_s": s / c, "max_s": mx,
+                     "total_s": s, "rows": r, "bytes": b}
+                    for (page, name), (c, s, r, b, mx, _) in self._stages.items()]
+        return sorted(rows, key=lambda r: r["mean_s"], reverse=True)
+
+    def prometheus_text(self):
+        with self._lock:
+            stages = {k: (v[0], v[1], v[2], v[3], list(v[5])) for k, v in self._stages.items()}
+            reruns = dict(self._reruns)
+        lines = ["# HELP airq_stage_seconds Duration of dashboard stages.",
+                 "# TYPE airq_stage_seconds histogram"]
+        for (page, name), (count, total, _, _, buckets) in sorted(stages.items()):
+            labels = f'page="{_escape(page)}",stage="{_escape(name)}"'
+            for bound, n in zip(BUCKETS, buckets):
+                lines.append(f'airq_stage_seconds_bucket{{{labels},le="{bound}"}} {n}')
+            lines.append(f'airq_stage_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"airq_stage_seconds_sum{{{labels}}} {total:.6f}")
+            lines.append(f"airq_stage_seconds_count{{{labels}}} {count}")
+        for metric, pos, help_text in (("airq_stage_rows_total", 2, "Rows produced by dashboard stages."),
+                                       ("airq_stage_bytes_total", 3, "Payload bytes produced by dashboard stages.")):
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} counter"]
+            for (page, name), item in sorted(stages.items()):
+                lines.append(f'{metric}{{page="{_escape(page)}",stage="{_escape(name)}"}} {item[pos]}')
+        lines += ["# HELP airq_reruns_total Completed page runs.", "# TYPE airq_reruns_total counter"]
+        lines += [f'airq_reruns_total{{page="{_escape(p)}"}} {c}' for p, (c, _) in sorted(reruns.items())]
+        lines += ["# HELP airq_rerun_seconds_total Time spent in page runs.",
+                  "# TYPE airq_rerun_seconds_total counter"]
+        lines += [f'airq_rerun_seconds_total{{page="{_escape(p)}"}} {s:.6f}' for p, (_, s) in sorted(reruns.items())]
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        with self._lock:
+            self._stages.clear()
+            self._reruns.clear()
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+METRICS = Metrics()
+TRACES = deque(maxlen=RECENT_TRACES)
+PROFILES = deque(maxlen=RECENT_PROFILES)
+
+
+# -------------------------------------------------
+# Stages and traces
+# -------------------------------------------------
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+        self.seconds = 0.0
+        self.rows = None
+        self.bytes = None
+
+    def record(self, value):
+        """Take the row count and payload size from ``value``; returns it."""
+        if hasattr(value, "__len__") and not isinstance(value, (str, bytes)):
+            self.rows = len(value)
+        self.bytes = payload_bytes(value)
+        return value
+
+    def as_dict(self):
+        return {"stage": self.name, "seconds": round(self.seconds, 6), "rows": self.rows, "bytes": self.bytes}
+
+
+class Trace:
+    """Stages of one page run."""
+
+    def __init__(self, page, profile=False):
+        self.page = page
+        self.stages = []
+        self.started = time.perf_counter()
+        self.seconds = None
+        self.profile = None
+        self._profiler = _start_profiler() if profile else None
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.started
+        if self._profiler is not None:
+            self.profile = _stop_profiler(self._profiler)
+            self._profiler = None
+            PROFILES.append({"page": self.page, "time": time.time(), "report": self.profile})
+        METRICS.observe_rerun(self.page, self.seconds)
+        TRACES.append(self)
+        log.info(json.dumps(self.as_dict(), default=str))
+        return self
+
+    def slowest(self, n=5):
+        return sorted(self.stages, key=lambda s: s.seconds, reverse=True)[:n]
+
+    def as_dict(self):
+        return {"event": "rerun", "page": self.page, "time": time.time(),
+                "seconds": round(self.seconds or 0.0, 6), "profiled": self.profile is not None,
+                "stages": [s.as_dict() for s in self.stages]}
+
+
+def begin(page, profile=None):
+    """Start the trace of a page run; ``profile=None`` samples at ``PROFILE_RATE``."""
+    previous = _current.get()
+    if previous is not None and previous._profiler is not None:
+        _stop_profiler(previous._profiler)  # the last run stopped early (st.stop)
+    if profile is None:
+        profile = PROFILE_RATE > 0 and random.random() < PROFILE_RATE
+    trace = Trace(page, profile)
+    _current.set(trace)
+    return trace
+
+
+def end():
+    """Finish the current trace; returns it (``None`` if none was started)."""
+    trace = _current.get()
+    if trace is None:
+        return None
+    _current.set(None)
+    return trace.finish()
+
+
+def current_trace():
+    return _current.get()
+
+
+class stage:
+    """Context manager timing one stage of the current trace."""
+
+    def __init__(self, name, page=None):
+        self._record = _Stage(name)
+        self.page = page
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self._record
+
+    def __exit__(self, *exc):
+        record = self._record
+        record.seconds = time.perf_counter() - self.started
+        trace = _current.get()
+        if trace is not None:
+            trace.stages.append(record)
+        page = self.page or (trace.page if trace is not None else "default")
+        METRICS.observe(page, record.name, record.seconds, record.rows, record.bytes)
+        return False
+
+
+def timed(name):
+    """Decorator recording each call as stage ``name`` with its result's rows and bytes."""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name) as s:
+                return s.record(func(*args, **kwargs))
+        return wrapper
+    return decorate
+
+
+# -------------------------------------------------
+# Profiling
+# -------------------------------------------------
+def _start_profiler():
+    try:
+        from pyinstrument import Profiler
+    except ImportError:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    else:
+        profiler = Profiler()
+        profiler.start()
+    return profiler
+
+
+def _stop_profiler(profiler):
+    if hasattr(profiler, "output_text"):  # pyinstrument
+        profiler.stop()
+        return profiler.output_text(unicode=True)
+    import pstats
+    profiler.disable()
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_LINES)
+    return out.getvalue()
+
+
+# -------------------------------------------------
+# Export
+# -------------------------------------------------
+def prometheus_text():
+    return METRICS.prometheus_text()
+
+
+def serve_metrics(port, host="0.0.0.0"):
+    """Serve ``/metrics`` from a daemon thread of this process; returns the server."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,221 @@
+"""
+Batched LSTM inference without TensorFlow.
+
+The notebook LSTM (``LSTM(64, activation="relu")`` + ``Dense``, 10-step
+input window) is small enough that its forward pass is a handful of matrix
+products.  ``NumpyLSTM`` runs it from exported weights in plain NumPy, and
+``OnnxLSTM`` runs an ONNX export through onnxruntime.  Both evaluate a whole
+batch of windows per call.  Every (city, pollutant) series therefore goes
+into one ``(batch, 10, 1)`` tensor, and all horizons come out of a single
+forecast: directly when the model's Dense layer has one output per step,
+otherwise by rolling the batch forward one step at a time.
+
+Keras is only needed once, to export::
+
+    python lstm_inference.py export ../best_lstm_model.h5 .models/lstm.npz
+    python lstm_inference.py forecast .models/lstm.npz     # all cities, 12/24/48h
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from forecasting import HORIZONS, LSTM_INPUT, POLLUTANTS, city_series, horizon_steps
+
+ACTIVATIONS = {
+    "relu": lambda x: np.maximum(x, 0),
+    "tanh": np.tanh,
+    "sigmoid": lambda x: 1 / (1 + np.exp(-x)),
+    "linear": lambda x: x,
+}
+
+
+# -------------------------------------------------
+# Runtimes
+# -------------------------------------------------
+class _Runtime:
+    """Common batched forecasting on top of ``predict(windows) -> (batch, outputs)``."""
+
+    outputs = 1
+
+    def forecast(self, windows, steps):
+        """``(batch, steps)`` forecasts for scaled ``(batch, LSTM_INPUT)`` windows."""
+        windows = np.asarray(windows, dtype="float32")
+        if self.outputs >= steps:
+            return self.predict(windows[:, :, None])[:, :steps]
+        out = np.empty((len(windows), steps), dtype="float32")
+        done = 0
+        while done < steps:
+            pred = self.predict(windows[:, :, None])
+            take = min(self.outputs, steps - done)
+            out[:, done:done + take] = pred[:, :take]
+            windows = np.concatenate([windows[:, take:], pred[:, :take]], axis=1)[:, -windows.shape[1]:]
+            done += take
+        return out
+
+
+class NumpyLSTM(_Runtime):
+    """Keras LSTM + Dense forward pass in NumPy (gate order i, f, c, o)."""
+
+    def __init__(self, kernel, recurrent, bias, dense_w, dense_b,
+                 activation="relu", recurrent_activation="sigmoid"):
+        self.kernel = np.asarray(kernel, dtype="float32")
+        self.recurrent = np.asarray(recurrent, dtype="float32")
+        self.bias = np.asarray(bias, dtype="float32")
+        self.dense_w = np.asarray(dense_w, dtype="float32")
+        self.dense_b = np.asarray(dense_b, dtype="float32")
+        self.activation = str(activation)
+        self.recurrent_activation = str(recurrent_activation)
+        if not {self.activation, self.recurrent_activation} <= ACTIVATIONS.keys():
+            raise ValueError(f"unsupported activation {self.activation!r}/{self.recurrent_activation!r}")
+        self.units = self.recurrent.shape[0]
+        self.outputs = self.dense_w.shape[1]
+
+    def predict(self, windows):
+        """``(batch, outputs)`` for ``(batch, timesteps, features)`` windows."""
+        x = np.asarray(windows, dtype="float32")
+        act, gate = ACTIVATIONS[self.activation], ACTIVATIONS[self.recurrent_activation]
+        batch, u = x.shape[0], self.units
+        h = np.zeros((batch, u), dtype="float32")
+        c = np.zeros((batch, u), dtype="float32")
+        # Input projections of all timesteps in one product
+        xz = x @ self.kernel + self.bias
+        for t in range(x.shape[1]):
+            z = xz[:, t] + h @ self.recurrent
+            i, f = gate(z[:, :u]), gate(z[:, u:2 * u])
+            g, o = act(z[:, 2 * u:3 * u]), gate(z[:, 3 * u:])
+            c = f * c + i * g
+            h = o * act(c)
+        return h @ self.dense_w + self.dense_b
+
+    @classmethod
+    def from_keras(cls, model):
+        """Copy the weights of a Sequential ``LSTM -> Dense`` Keras model."""
+        lstm = next(layer for layer in model.layers if type(layer).__name__ == "LSTM")
+        dense = next(layer for layer in model.layers if type(layer).__name__ == "Dense")
+        kernel, recurrent, bias = lstm.get_weights()
+        dense_w, dense_b = dense.get_weights()
+        return cls(kernel, recurrent, bias, dense_w, dense_b,
+                   lstm.get_config().get("activation", "tanh"),
+                   lstm.get_config().get("recurrent_activation", "sigmoid"))
+
+    def save(self, path):
+        np.savez(path, kernel=self.kernel, recurrent=self.recurrent, bias=self.bias,
+                 dense_w=self.dense_w, dense_b=self.dense_b,
+                 activation=self.activation, recurrent_activation=self.recurrent_activation)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as w:
+            return cls(w["kernel"], w["recurrent"], w["bias"], w["dense_w"], w["dense_b"],
+                       w["activation"].item(), w["recurrent_activation"].item())
+
+
+class OnnxLSTM(_Runtime):
+    """The same model exported to ONNX, run by onnxruntime on CPU."""
+
+    def __init__(self, path):
+        import onnxruntime
+        self.session = onnxruntime.InferenceSession(path, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.outputs = self.session.get_outputs()[0].shape[-1]
+
+    def predict(self, windows):
+        return self.session.run(None, {self.input_name: np.asarray(windows, dtype="float32")})[0]
+
+
+def export(source, path):
+    """
+    Export a Keras model (object or ``.h5``/``.keras`` path) to ``path``:
+    NumPy weights for ``.npz``, an ONNX graph for ``.onnx`` (needs tf2onnx).
+    """
+    if isinstance(source, str):
+        from backends import load
+        source = load("LSTM").models.load_model(source, compile=False)
+    if path.endswith(".onnx"):
+        import tensorflow as tf
+        import tf2onnx
+        spec = (tf.TensorSpec((None, LSTM_INPUT, 1), tf.float32, name="window"),)
+        tf2onnx.convert.from_keras(source, input_signature=spec, output_path=path)
+    else:
+        NumpyLSTM.from_keras(source).save(path)
+
+
+def load_runtime(path):
+    """``NumpyLSTM`` for ``.npz`` weights, ``OnnxLSTM`` for an ``.onnx`` graph."""
+    return OnnxLSTM(path) if path.endswith(".onnx") else NumpyLSTM.load(path)
+
+
+# -------------------------------------------------
+# Batched multi-horizon forecasts
+# -------------------------------------------------
+class BatchForecaster:
+    """One loaded model applied to many series with per-series min-max scaling."""
+
+    def __init__(self, runtime):
+        self.runtime = runtime
+
+    def forecast(self, series, horizons=HORIZONS):
+        """
+        ``{key: {horizon: array}}`` for a ``{key: series}`` mapping.  All
+        windows are stacked into one batch and forecast once for the longest
+        horizon; shorter horizons are prefixes of it.
+        """
+        keys = [k for k, s in series.items() if len(s) >= LSTM_INPUT]
+        if not keys:
+            return {}
+        values = [series[k].to_numpy(dtype="float32") for k in keys]
+        lo = np.array([v.min() for v in values], dtype="float32")
+        span = np.array([v.max() for v in values], dtype="float32") - lo
+        span[span == 0] = 1.0
+        windows = (np.stack([v[-LSTM_INPUT:] for v in values]) - lo[:, None]) / span[:, None]
+
+        steps = {k: {h: horizon_steps(series[k], hours) for h, hours in horizons.items()} for k in keys}
+        longest = max(n for per_key in steps.values() for n in per_key.values())
+        out = self.runtime.forecast(windows, longest) * span[:, None] + lo[:, None]
+        return {k: {h: out[row, :n] for h, n in steps[k].items()} for row, k in enumerate(keys)}
+
+
+def forecast_all(df, runtime, cities=None, pollutants=POLLUTANTS, index=None):
+    """Forecasts for every city and pollutant of ``df`` in one batch."""
+    cities = cities if cities is not None else (index.cities if index is not None else df["City"].unique())
+    series = {(city, p): city_series(df, city, p, index=index)
+              for city in cities for p in pollutants if p in df.columns}
+    return BatchForecaster(runtime).forecast(series)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the LSTM or run batched forecasts without TensorFlow.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    exp = sub.add_parser("export", help="Keras model -> .npz weights or .onnx graph")
+    exp.add_argument("source")
+    exp.add_argument("target")
+    fc = sub.add_parser("forecast", help="forecast every city and pollutant in one batch")
+    fc.add_argument("model", help=".npz or .onnx file")
+    fc.add_argument("--data", default=None)
+    fc.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        export(args.source, args.target)
+        print(f"wrote {args.target}")
+        return
+
+    from data_store import load_data
+    from station_index import StationIndex
+    df = load_data(args.data)
+    index = StationIndex(df)
+    runtime = load_runtime(args.model)
+    result = forecast_all(df, runtime, index=index)
+    series = {k: city_series(df, *k, index=index) for k in result}
+    forecaster = BatchForecaster(runtime)
+    started = time.perf_counter()
+    for _ in range(args.repeat):
+        forecaster.forecast(series)
+    per_batch = (time.perf_counter() - started) / args.repeat * 1000
+    print(f"{len(result)} series per batch, {per_batch:.2f} ms per batch ({type(runtime).__name__})")
+
+
+if __name__ == "__main__":
+    main()
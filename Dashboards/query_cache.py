@@ -0,0 +1,99 @@
+"""
+Bounded LRU cache for per-query results (filtered frames, forecasts,
+summaries).
+
+One process-wide instance is shared by every session, so memory is capped by
+``max_entries`` and ``max_bytes`` rather than growing with the number of
+users.  Entries also expire after ``ttl`` seconds, which picks up artifacts
+that change without a new data version (e.g. freshly trained models).
+Callers put the data version into the key, so a new version simply stops
+hitting old entries and LRU eviction reclaims them.
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+MAX_ENTRIES = 256
+MAX_BYTES = 64 * 2**20
+TTL_SECONDS = 300
+
+
+def sizeof(value):
+    """Approximate memory held by a cached value."""
+    if isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        return int(value.memory_usage(index=True, deep=False).sum()
+                   if isinstance(value, pd.DataFrame) else value.memory_usage(deep=False))
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(v) for v in value.values())
+    return sys.getsizeof(value)
+
+
+class QueryCache:
+    """Thread-safe LRU with entry-count, byte-size and TTL eviction."""
+
+    def __init__(self, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES, ttl=TTL_SECONDS):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (value, size, expires)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None or item[2] < time.monotonic():
+                if item is not None:
+                    self._drop(key)
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, value, size=None):
+        """Cache ``value``; ``size`` (bytes) defaults to ``sizeof(value)``."""
+        size = sizeof(value) if size is None else size
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            if size > self.max_bytes:
+                return value  # too large to be worth caching
+            self._entries[key] = (value, size, time.monotonic() + self.ttl)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+        return value
+
+    def get_or_compute(self, key, compute):
+        """Cached value for ``key``, calling ``compute()`` on a miss."""
+        missing = object()
+        value = self.get(key, missing)
+        if value is missing:
+            value = self.put(key, compute())
+        return value
+
+    def _drop(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
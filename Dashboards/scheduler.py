@@ -0,0 +1,180 @@
+"""
+Background scheduler: keeps models, forecasts, outlooks and alerts fresh off the request path.
+
+A standalone asyncio process with interval jobs.  Each job runs in a worker
+thread, and a job never overlaps itself: the next run starts ``interval``
+seconds after the previous one finished.
+
+    models     clean newly ingested raw partitions, update the trained models
+               online (train_models.update_all), and re-forecast every city
+               with the saved global models
+    snapshots  when the data or the models changed, build and publish a
+               snapshot per dataset (see snapshots.py)
+
+The dashboards only read the latest snapshot, so their latency does not
+depend on model cost.  Run it next to the Streamlit server::
+
+    python scheduler.py                              # models hourly, snapshots every minute
+    python scheduler.py --models-every 600 --snapshots-every 30
+    python scheduler.py --once                       # run every job once and exit (cron)
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+import warnings
+
+from data_store import CLEANED_CSV, RAW_CSV, data_version, load_data, read_manifest, resolve_name
+from instrument import stage
+
+log = logging.getLogger("airq.scheduler")
+
+MODELS_EVERY = 3600
+SNAPSHOTS_EVERY = 60
+DATASETS = [CLEANED_CSV, RAW_CSV]
+GLOBAL_POLLUTANTS = ["PM2.5", "AQI"]
+
+
+class Job:
+    def __init__(self, name, interval, func):
+        self.name = name
+        self.interval = interval
+        self.func = func
+        self.runs = 0
+        self.last_seconds = None
+        self.last_error = None
+
+    def run(self):
+        started = time.perf_counter()
+        try:
+            with stage(self.name, page="scheduler"):
+                self.func()
+            self.last_error = None
+        except Exception as exc:  # a failing job must not stop the others
+            self.last_error = f"{type(exc).__name__}: {exc}"
+            log.exception("job %s failed", self.name)
+        self.runs += 1
+        self.last_seconds = time.perf_counter() - started
+        log.info("job %s: %.2fs%s", self.name, self.last_seconds,
+                 f" ({self.last_error})" if self.last_error else "")
+
+
+class Scheduler:
+    """Interval jobs on one asyncio loop, executed in worker threads."""
+
+    def __init__(self):
+        self.jobs = []
+
+    def every(self, seconds, name=None):
+        """Decorator registering ``func`` to run every ``seconds``."""
+        def register(func):
+            self.jobs.append(Job(name or func.__name__, seconds, func))
+            return func
+        return register
+
+    async def _loop(self, job):
+        while True:
+            await asyncio.to_thread(job.run)
+            await asyncio.sleep(job.interval)
+
+    async def run(self):
+        await asyncio.gather(*(self._loop(job) for job in self.jobs))
+
+    def run_once(self):
+        for job in self.jobs:
+            job.run()
+
+
+# -------------------------------------------------
+# Jobs
+# -------------------------------------------------
+class Refresher:
+    """State shared by the jobs: alert engines and what the last snapshot saw."""
+
+    def __init__(self, datasets=DATASETS, registry_root=None):
+        from forecasting import REGISTRY_DIR, ModelRegistry
+        self.datasets = datasets
+        self.registry_root = registry_root or REGISTRY_DIR
+        self.registry = ModelRegistry(self.registry_root)
+        self.engines = {}
+        self.indexes = {}           # dataset -> long-lived StationIndex, synced with each ingest
+        self.models_version = 0     # bumped whenever the models job wrote new forecasts
+        self.published = {}         # dataset -> (data version, models version) of its last snapshot
+
+    def index(self, name):
+        from station_index import StationIndex
+        return self.indexes.setdefault(name, StationIndex()).sync(name)
+
+    def refresh_models(self):
+        from cleaning import sync
+        from global_model import forecast_global
+        from train_models import update_all
+
+        if read_manifest(RAW_CSV)["partitions"]:
+            sync(RAW_CSV)
+        name = resolve_name()
+        df = load_data(name)
+        index = self.index(name)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            updates = update_all(df, registry_root=self.registry_root, verbose=False)
+        written = bool((~updates["Status"].isin(["untrained", "cached", "failed"])).any())
+        for pollutant in GLOBAL_POLLUTANTS:
+            if pollutant not in df.columns:
+                continue
+            try:
+                # One pollutant's global model failing must not hold back the others
+                written |= bool(forecast_global(df, pollutant, registry=self.registry, index=index))
+            except Exception:
+                log.exception("global %s forecast failed", pollutant)
+        if written:
+            self.models_version += 1
+
+    def publish_snapshots(self):
+        import snapshots
+        from alerts import AlertEngine
+
+        for name in self.datasets:
+            try:
+                name = resolve_name(name)
+            except FileNotFoundError:
+                continue
+            version = data_version(name)
+            state = (version, self.models_version)
+            if self.published.get(name) == state and snapshots.snapshot_version(name) is not None:
+                continue
+            df = load_data(name)
+            engine = self.engines.setdefault(name, AlertEngine())
+            snap = snapshots.build(name, version, df, engine, self.index(name), self.registry)
+            number = snapshots.write(name, snap)
+            self.published[name] = state
+            log.info("published snapshot %d of %s (data %s)", number, name, version)
+
+
+def build_scheduler(models_every=MODELS_EVERY, snapshots_every=SNAPSHOTS_EVERY, datasets=DATASETS):
+    refresher = Refresher(datasets)
+    scheduler = Scheduler()
+    scheduler.every(models_every, "models")(refresher.refresh_models)
+    scheduler.every(snapshots_every, "snapshots")(refresher.publish_snapshots)
+    return scheduler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute forecasts, outlooks and alerts in the background.")
+    parser.add_argument("--models-every", type=float, default=MODELS_EVERY, help="seconds between model refreshes")
+    parser.add_argument("--snapshots-every", type=float, default=SNAPSHOTS_EVERY,
+                        help="seconds between snapshot checks")
+    parser.add_argument("--once", action="store_true", help="run every job once and exit")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+
+    scheduler = build_scheduler(args.models_every, args.snapshots_every)
+    if args.once:
+        scheduler.run_once()
+    else:
+        asyncio.run(scheduler.run())
+
+
+if __name__ == "__main__":
+    main()
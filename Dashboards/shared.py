@@ -0,0 +1,193 @@
+"""
+Process-wide resources shared by every page of the dashboard app.
+
+Each getter is an ``st.cache_resource`` singleton, so the dataset, its
+indexes, the model registry and the alert engines exist once per server
+process no matter how many pages or sessions use them.  Data-derived
+resources are keyed on ``(dataset, version)`` and keep one version per
+dataset.  Per-query results go through one bounded ``QueryCache``.
+
+With ``AIRQ_BACKEND=sqlite`` the explorer and web dashboard pages query the
+SQLite store (``sql_store.py``) per request instead of holding the frame.
+
+Forecasts, 7-day outlooks and alerts are read from the latest snapshot
+published by ``scheduler.py`` when it matches the current data version, so
+a rerun does no model work; without a current snapshot the pages compute
+them in-process as before.
+
+Every page brackets its run with ``start_rerun``/``end_rerun`` and times its
+stages with ``instrument.stage`` (see ``instrument.py``); ``AIRQ_METRICS_PORT``
+serves the collected metrics in Prometheus format from this process.
+
+    streamlit run app.py
+"""
+
+import os
+
+import streamlit as st
+
+from data_store import RAW_CSV, data_version, load_data, resolve_name
+from station_index import StationIndex
+from query_cache import QueryCache
+from figure_cache import FigureCache, use_webgl
+from instrument import begin, end, payload_bytes, serve_metrics, stage
+from snapshots import load as load_snapshot, snapshot_version
+
+DATASETS = 2  # cleaned and raw CSV: cache one version of each
+BACKEND = os.environ.get("AIRQ_BACKEND", "arrow")  # "arrow" (in memory) or "sqlite"
+
+
+@st.cache_resource(max_entries=DATASETS)
+def get_data(name, version):
+    return load_data(name)
+
+
+def current(name=None):
+    """``(name, version)`` of the current data; stops the page if there is none."""
+    try:
+        name = resolve_name(name)
+        return name, data_version(name)
+    except FileNotFoundError:
+        st.error("❌ No dataset found. Please upload your air quality CSV file.")
+        st.stop()
+
+
+def dataset(name=None):
+    """``(name, version, df)`` for the current data; stops the page if there is none."""
+    with stage("load") as s:
+        name, version = current(name)
+        df = s.record(get_data(name, version))
+    return name, version, df
+
+
+@st.cache_resource
+def _station_index(name):
+    # Long-lived; sync() indexes newly ingested partitions only
+    return StationIndex()
+
+
+def get_index(name, version):
+    if "City" not in get_data(name, version).columns:
+        return None
+    return _station_index(name).sync(name)
+
+
+@st.cache_resource(max_entries=DATASETS)
+def get_sql_store(name, version):
+    # Constructing the store syncs newly ingested partitions into SQLite
+    from sql_store import SQLStore
+    return SQLStore(name)
+
+
+@st.cache_resource
+def get_registry():
+    from forecasting import ModelRegistry
+    return ModelRegistry()
+
+
+@st.cache_resource
+def get_alert_engine(name):
+    # Evaluated once per data version and on every in-process ingest
+    from alerts import AlertEngine, watch_ingest
+    engine = AlertEngine()
+    watch_ingest(engine, name)
+    return engine
+
+
+@st.cache_resource
+def get_cube(name, pollutants):
+    # Long-lived; sync() folds in newly ingested partitions only
+    from stats_cube import StatsCube
+    return StatsCube(pollutants=pollutants)
+
+
+@st.cache_resource(max_entries=DATASETS)
+def get_rollups(name, version, pollutants):
+    from downsample import Rollups
+    return Rollups(get_data(name, version), list(pollutants))
+
+
+@st.cache_resource(max_entries=1)
+def get_quality(name, version):
+    # Counted on the raw readings: cleaning fills the gaps these measure
+    from cleaning import QualityCounters
+    return QualityCounters(load_data(name))
+
+
+def quality_counters():
+    """``QualityCounters`` of the raw dataset, or ``None`` if there is none."""
+    try:
+        return get_quality(RAW_CSV, data_version(RAW_CSV))
+    except FileNotFoundError:
+        return None
+
+
+@st.cache_resource(max_entries=DATASETS)
+def get_snapshot(name, number):
+    return load_snapshot(name)
+
+
+def latest_snapshot(name, version):
+    """
+    Latest scheduler snapshot of ``name`` (see snapshots.py), or ``None`` if
+    there is none or it was built from another data ``version`` (an ingest
+    the scheduler has not caught up with, or a stopped scheduler).
+    """
+    number = snapshot_version(name)
+    if number is None:
+        return None
+    snapshot = get_snapshot(name, number)
+    if snapshot["data_version"] != version:
+        st.caption("⏳ The background snapshot is behind the latest data; computing it in this session.")
+        return None
+    return snapshot
+
+
+@st.cache_resource
+def get_query_cache():
+    return QueryCache()
+
+
+def cached(key, compute):
+    """Result of ``compute()`` from the shared query LRU; put the data version in ``key``."""
+    return get_query_cache().get_or_compute(key, compute)
+
+
+@st.cache_resource
+def get_figure_cache():
+    return FigureCache()
+
+
+def cached_figure(key, build):
+    """Figure from the shared figure LRU, ``build()`` on a miss; put the data version in ``key``."""
+    return get_figure_cache().figure(key, build)
+
+
+# -------------------------------------------------
+# Instrumentation
+# -------------------------------------------------
+@st.cache_resource
+def get_metrics_server():
+    port = os.environ.get("AIRQ_METRICS_PORT")
+    return serve_metrics(int(port)) if port else None
+
+
+def start_rerun(page):
+    """Start this run's trace; profiled while the admin panel's profiling toggle is on."""
+    get_metrics_server()
+    return begin(page, profile=st.session_state.get("profile_reruns") or None)
+
+
+def end_rerun():
+    return end()
+
+
+def plotly_chart(fig, name):
+    """
+    ``st.plotly_chart`` timed as stage ``chart:<name>`` with the figure's
+    payload size; long scatter traces are drawn with WebGL.
+    """
+    with stage(f"chart:{name}") as s:
+        fig = use_webgl(fig)
+        s.bytes = payload_bytes(fig)
+        st.plotly_chart(fig, use_container_width=True)
@@ -0,0 +1,142 @@
+"""
+Versioned snapshots of everything the dashboards show that costs model time.
+
+``scheduler.py`` periodically builds one snapshot per dataset:
+
+    stations   latest AQI of every city with its CPCB category and color
+    outlook    7-day AQI outlook per city (the global model's forecast, categorized)
+    alerts     active alerts and recent history from a long-lived ``AlertEngine``
+
+Each snapshot is written as ``snapshot-<n>.json`` and published by
+atomically replacing the ``LATEST`` pointer.  A page reads the pointer (a
+few bytes), and loads the snapshot only when the number has changed.  The
+previous ``KEEP`` snapshots stay on disk, so a reader never sees a partial
+or vanished file.
+"""
+
+import json
+import os
+import time
+
+import pandas as pd
+
+from data_store import DATA_DIR
+from aqi import categorize
+
+SNAPSHOT_DIR = os.path.join(DATA_DIR, ".snapshots")
+KEEP = 5
+RECENT_ALERTS = 50
+
+
+def snapshot_dir(name):
+    return os.path.join(SNAPSHOT_DIR, os.path.splitext(os.path.basename(name))[0])
+
+
+def _pointer(name):
+    return os.path.join(snapshot_dir(name), "LATEST")
+
+
+def _write_json(path, obj):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(obj, f, default=str)
+    os.replace(tmp, path)
+
+
+# -------------------------------------------------
+# Building
+# -------------------------------------------------
+def station_table(df):
+    """Latest reported AQI per city, with its category and color."""
+    latest = df.dropna(subset=["AQI"]).sort_values("Date", kind="stable").groupby("City", observed=True).tail(1)
+    table = pd.DataFrame({"City": latest["City"].astype(str).to_numpy(), "Date": latest["Date"].to_numpy(),
+                          "AQI": latest["AQI"].round().to_numpy()})
+    category, color = categorize(table["AQI"])
+    table["Category"], table["Color"] = category.astype(str), color.astype(str)
+    return table.sort_values("City", ignore_index=True)
+
+
+def outlook_table(df, cities, index=None, registry=None):
+    """7-day AQI outlook of every city from the global model's registry entries."""
+    from forecasting import GLOBAL, get_forecast
+    from aqi import AQI_MAX
+    frames = []
+    for city in cities:
+        forecast = get_forecast(df, city, "AQI", GLOBAL, horizon=None, index=index, registry=registry)
+        if forecast is not None:
+            frames.append(pd.DataFrame({"City": city, "Date": forecast["Date"],
+                                        "AQI": forecast["Forecast"].clip(0, AQI_MAX).round()}))
+    if not frames:
+        return pd.DataFrame(columns=["City", "Date", "AQI", "Category", "Color"])
+    table = pd.concat(frames, ignore_index=True)
+    category, color = categorize(table["AQI"])
+    table["Category"], table["Color"] = category.astype(str), color.astype(str)
+    return table
+
+
+def build(name, version, df, engine, index=None, registry=None):
+    """
+    Snapshot dict for dataset ``name`` at ``version``.  ``engine`` is the
+    caller's long-lived ``AlertEngine`` (hysteresis and cooldowns carry over
+    between snapshots).
+    """
+    from alerts import forecast_peaks
+    cities = index.cities if index is not None else sorted(df["City"].astype(str).unique())
+    engine.sync(df, version, forecast_peaks(cities, registry=registry))
+    stations = station_table(df)
+    outlook = outlook_table(df, cities, index, registry)
+    return {
+        "dataset": name,
+        "data_version": version,
+        "created_at": pd.Timestamp.now().isoformat(),
+        "stations": {c: stations[c].tolist() for c in stations.columns},
+        "outlook": {c: outlook[c].tolist() for c in outlook.columns},
+        "alerts": engine.active_alerts(),
+        "history": list(engine.history)[-RECENT_ALERTS:],
+    }
+
+
+# -------------------------------------------------
+# Publishing & reading
+# -------------------------------------------------
+def write(name, snapshot):
+    """Publish ``snapshot`` as the next version of ``name``; returns its number."""
+    folder = snapshot_dir(name)
+    os.makedirs(folder, exist_ok=True)
+    number = (snapshot_version(name) or 0) + 1
+    filename = f"snapshot-{number:06d}.json"
+    _write_json(os.path.join(folder, filename), dict(snapshot, version=number))
+    _write_json(_pointer(name), {"version": number, "file": filename, "written_at": time.time()})
+    for old in sorted(f for f in os.listdir(folder) if f.startswith("snapshot-"))[:-KEEP]:
+        os.remove(os.path.join(folder, old))
+    return number
+
+
+def snapshot_version(name):
+    """Number of the latest published snapshot of ``name`` (``None`` if there is none)."""
+    try:
+        with open(_pointer(name)) as f:
+            return json.load(f)["version"]
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+
+
+def load(name):
+    """
+    Latest snapshot of ``name`` with frames and timestamps restored, or
+    ``None``.  ``stations`` is indexed by City; ``outlook`` has one row per
+    city and day.
+    """
+    try:
+        with open(_pointer(name)) as f:
+            pointer = json.load(f)
+        with open(os.path.join(snapshot_dir(name), pointer["file"])) as f:
+            snap = json.load(f)
+    except (FileNotFoundError, ValueError, KeyError):
+        return None
+    snap["stations"] = pd.DataFrame(snap["stations"]).assign(
+        Date=lambda t: pd.to_datetime(t["Date"])).set_index("City")
+    snap["outlook"] = pd.DataFrame(snap["outlook"]).assign(Date=lambda t: pd.to_datetime(t["Date"]))
+    for alert in snap["alerts"] + snap["history"]:
+        alert["time"] = pd.Timestamp(alert["time"])
+    return snap
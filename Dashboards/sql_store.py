@@ -0,0 +1,349 @@
+"""
+SQLite storage backend for the dashboards.
+
+Readings live in ``.store/<dataset>.sqlite`` in one ``readings`` table
+clustered on its (City, Date) primary key (``WITHOUT ROWID``), so every
+station/time-range selection is a B-tree range scan.  The database runs in
+WAL mode: one writer (``sync``) never blocks the pooled read-only
+connections the dashboards query through.
+
+Queries are fixed, parameterized SQL strings, which sqlite3 keeps prepared
+in each connection's statement cache.  Aggregations are pushed down:
+summaries, correlations, histogram sketches and trend rollups come back as
+a few rows, so a page fetches only what it renders and the history does
+not have to fit in memory.
+
+``SQLStore`` answers the same calls as ``StationIndex`` (``cities``,
+``latest``, ``window``, ``query``, ``query_range``), and ``cube()`` /
+``rollups()`` return objects with the ``query`` methods of ``StatsCube`` and
+``Rollups``, so a page can switch backends without changing its logic.
+
+    python sql_store.py --dataset air_quality_data.csv
+    AIRQ_BACKEND=sqlite streamlit run app.py
+"""
+
+import argparse
+import math
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+from data_store import (POLLUTANTS, build_store, load_partition, read_manifest,
+                        resolve_name, store_path)
+from station_index import TIME_RANGES
+from stats_cube import HIST_BINS, HIST_MIN, HIST_RATIO, Summary
+from downsample import MAX_POINTS, RESOLUTION_LABELS, downsample, trace_budget
+
+POOL_SIZE = 4
+BATCH_ROWS = 50_000
+MIN_SECONDS, MAX_SECONDS = -(2 ** 62), 2 ** 62  # open range bounds
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    City TEXT NOT NULL,
+    Date INTEGER NOT NULL,          -- seconds since epoch
+    {columns},
+    PRIMARY KEY (City, Date)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS partitions (path TEXT PRIMARY KEY);
+"""
+
+
+def db_path(name):
+    """Path of the SQLite database built from dataset ``name``."""
+    return os.path.splitext(store_path(name))[0] + ".sqlite"
+
+
+def _quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def _seconds(ts, up=False):
+    """Timestamp -> epoch seconds (rounded up for inclusive lower bounds)."""
+    ns = pd.Timestamp(ts).value
+    return -(-ns // 10 ** 9) if up else ns // 10 ** 9
+
+
+def _ensure_ln(conn):
+    try:
+        conn.execute("SELECT ln(2)")
+    except sqlite3.OperationalError:
+        # SQLite built without math functions
+        conn.create_function("ln", 1, lambda x: math.log(x) if x and x > 0 else None, deterministic=True)
+
+
+# -------------------------------------------------
+# Store
+# -------------------------------------------------
+class SQLStore:
+    def __init__(self, name=None, pool_size=POOL_SIZE):
+        self.name = resolve_name(name)
+        self.path = db_path(self.name)
+        self.pool_size = pool_size
+        self._pool = queue.LifoQueue()
+        self._opened = 0
+        self._pool_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.sync()
+        with self.reader() as conn:
+            info = conn.execute("PRAGMA table_info(readings)").fetchall()
+        self.columns = [row[1] for row in info]
+        self.values = [c for c in self.columns if c not in ("City", "Date", "AQI_Bucket")]
+
+    # -- connections -----------------------------------------------------
+    def _writer(self):
+        conn = sqlite3.connect(self.path, timeout=60)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def reader(self):
+        """Borrow a pooled read-only connection."""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                can_open = self._opened < self.pool_size
+                self._opened += can_open
+            if can_open:
+                conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True,
+                                       check_same_thread=False, cached_statements=256)
+                conn.execute("PRAGMA query_only=ON")
+                _ensure_ln(conn)
+            else:
+                conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+
+    def _read(self, sql, params=()):
+        with self.reader() as conn:
+            cursor = conn.execute(sql, params)
+            rows = cursor.fetchall()
+            names = [d[0] for d in cursor.description]
+        return pd.DataFrame.from_records(rows, columns=names)
+
+    # -- loading ---------------------------------------------------------
+    def sync(self):
+        """Load the base store, then any partitions ``ingest.py`` appended since the last sync."""
+        base = build_store(self.name)
+        with self._write_lock:
+            conn = self._writer()
+            try:
+                table = load_partition(self.name)
+                value_cols = [c for c in table.column_names if c not in ("City", "Date")]
+                defs = ", ".join(f"{_quote(c)} {'TEXT' if c == 'AQI_Bucket' else 'REAL'}" for c in value_cols)
+                conn.executescript(SCHEMA.format(columns=defs))
+                stamp = conn.execute("SELECT value FROM meta WHERE key = 'base_mtime'").fetchone()
+                with conn:
+                    if stamp is None or float(stamp[0]) != os.path.getmtime(base):
+                        # Base store rebuilt (or first sync): reload everything
+                        conn.execute("DELETE FROM readings")
+                        conn.execute("DELETE FROM partitions")
+                        self._insert(conn, table, value_cols)
+                        conn.execute("INSERT OR REPLACE INTO meta VALUES ('base_mtime', ?)",
+                                     (repr(os.path.getmtime(base)),))
+                    done = {row[0] for row in conn.execute("SELECT path FROM partitions")}
+                    for part in read_manifest(self.name)["partitions"]:
+                        if part["path"] not in done:
+                            self._insert(conn, load_partition(self.name, part["path"]), value_cols)
+                            conn.execute("INSERT INTO partitions VALUES (?)", (part["path"],))
+            finally:
+                conn.close()
+        return self
+
+    def _insert(self, conn, table, value_cols):
+        columns = ["City", "Date"] + value_cols
+        sql = (f"INSERT OR REPLACE INTO readings ({', '.join(map(_quote, columns))}) "
+               f"VALUES ({', '.join('?' * len(columns))})")
+        for batch in table.to_batches(max_chunksize=BATCH_ROWS):
+            frame = batch.to_pandas()
+            frame = frame[frame["City"].notna() & frame["Date"].notna()]
+            out = {"City": frame["City"].astype(str).to_numpy(dtype=object),
+                   "Date": frame["Date"].to_numpy(dtype="datetime64[s]").astype(np.int64).tolist()}
+            for col in value_cols:
+                s = frame[col] if col in frame.columns else pd.Series(np.nan, index=frame.index)
+                if col == "AQI_Bucket":
+                    out[col] = s.astype(object).where(s.notna(), None).tolist()
+                else:
+                    out[col] = s.astype("float64").astype(object).where(s.notna(), None).tolist()
+            conn.executemany(sql, zip(*(out[c] for c in columns)))
+
+    # -- StationIndex interface -------------------------------------------
+    @property
+    def cities(self):
+        return self._read("SELECT DISTINCT City FROM readings ORDER BY City")["City"].tolist()
+
+    def latest(self, city):
+        row = self._read("SELECT MAX(Date) AS Date FROM readings WHERE City = ?", (city,))
+        value = row["Date"].iat[0]
+        return None if pd.isna(value) else pd.Timestamp(int(value), unit="s")
+
+    def date_bounds(self):
+        row = self._read("SELECT MIN(Date) AS lo, MAX(Date) AS hi FROM readings")
+        return pd.Timestamp(int(row["lo"].iat[0]), unit="s"), pd.Timestamp(int(row["hi"].iat[0]), unit="s")
+
+    def window(self, city, time_range):
+        window = TIME_RANGES.get(time_range)
+        end = self.latest(city)
+        if window is None or end is None:
+            return None, None
+        return end - window + pd.Timedelta(1, "ns"), end
+
+    def _bounds(self, start, end):
+        return (MIN_SECONDS if start is None else _seconds(start, up=True),
+                MAX_SECONDS if end is None else _seconds(end))
+
+    def query(self, city, start=None, end=None, columns=None):
+        """Rows for ``city`` with ``start <= Date <= end``, sorted by Date."""
+        columns = self.columns if columns is None else ["City", "Date"] + [c for c in columns if c in self.values]
+        sql = (f"SELECT {', '.join(map(_quote, columns))} FROM readings "
+               f"WHERE City = ? AND Date BETWEEN ? AND ? ORDER BY Date")
+        return self._typed(self._read(sql, (city, *self._bounds(start, end))), columns)
+
+    def query_range(self, city, time_range, columns=None):
+        start, end = self.window(city, time_range)
+        return self.query(city, start, end, columns)
+
+    def tail(self, n=2):
+        """Last ``n`` readings of every city (what the alert engine evaluates)."""
+        cols = ", ".join(map(_quote, self.columns))
+        sql = (f"SELECT {cols} FROM (SELECT *, ROW_NUMBER() OVER "
+               f"(PARTITION BY City ORDER BY Date DESC) AS rn FROM readings) WHERE rn <= ? ORDER BY City, Date")
+        return self._typed(self._read(sql, (n,)), self.columns)
+
+    def frame(self):
+        """Empty frame with the table's columns and dtypes."""
+        return self._typed(pd.DataFrame(columns=self.columns), self.columns)
+
+    def _typed(self, df, columns):
+        df = df.reindex(columns=columns)
+        df["City"] = df["City"].astype("category")
+        df["Date"] = pd.to_datetime(df["Date"].astype("int64"), unit="s").astype("datetime64[ns]")
+        for col in columns:
+            if col in POLLUTANTS or col == "AQI":
+                df[col] = df[col].astype("float32")
+            elif col == "AQI_Bucket":
+                df[col] = df[col].astype("category")
+        return df
+
+    # -- Aggregates pushed down into SQL -----------------------------------
+    def summary(self, city, start, end, pollutants):
+        """``stats_cube.Summary`` for ``city`` computed by SQLite over the range."""
+        pollutants = [p for p in pollutants if p in self.values]
+        q = [_quote(p) for p in pollutants]
+        i, j = np.triu_indices(len(q), k=1)
+        terms = []
+        for c in q:
+            terms += [f"COUNT({c})", f"SUM({c})", f"SUM({c} * {c})", f"MIN({c})", f"MAX({c})"]
+        for a, b in zip(i, j):
+            # a + 0 * b is NULL unless both are present: pairwise-complete sums
+            x, y = q[a], q[b]
+            terms += [f"COUNT({x} * {y})", f"SUM({x} + 0 * {y})", f"SUM({y} + 0 * {x})",
+                      f"SUM({x} * {x} + 0 * {y})", f"SUM({y} * {y} + 0 * {x})", f"SUM({x} * {y})"]
+        where = "WHERE City = ? AND Date BETWEEN ? AND ?"
+        params = (city, *self._bounds(start, end))
+        with self.reader() as conn:
+            row = conn.execute(f"SELECT {', '.join(terms)} FROM readings {where}", params).fetchone()
+        row = np.array([np.nan if v is None else v for v in row], dtype="float64")
+        p = len(pollutants)
+        per = row[:5 * p].reshape(p, 5)
+        pairs = np.nan_to_num(row[5 * p:].reshape(-1, 6).T) if len(i) else np.zeros((6, 0))
+        sums = {"n": per[:, 0], "s": np.nan_to_num(per[:, 1]), "ss": np.nan_to_num(per[:, 2])}
+        pair_sums = dict(zip(["n", "si", "sj", "sii", "sjj", "sij"], pairs))
+        return Summary(pollutants, (i, j), sums, per[:, 3], per[:, 4], pair_sums,
+                       self._histogram(city, start, end, pollutants))
+
+    def _histogram(self, city, start, end, pollutants):
+        step = math.log(HIST_RATIO)
+        parts = []
+        for k, p in enumerate(pollutants):
+            c = _quote(p)
+            bucket = (f"CASE WHEN {c} <= {HIST_MIN} THEN 0 ELSE "
+                      f"MIN(CAST(ln({c} / {HIST_MIN}) / {step} AS INTEGER) + 1, {HIST_BINS - 1}) END")
+            parts.append(f"SELECT {k} AS p, {bucket} AS b, COUNT(*) AS n FROM readings "
+                         f"WHERE City = :city AND Date BETWEEN :lo AND :hi AND {c} IS NOT NULL GROUP BY b")
+        hist = np.zeros(len(pollutants) * HIST_BINS)
+        if parts:
+            lo, hi = self._bounds(start, end)
+            with self.reader() as conn:
+                for k, b, n in conn.execute(" UNION ALL ".join(parts), {"city": city, "lo": lo, "hi": hi}):
+                    hist[k * HIST_BINS + b] = n
+        return hist
+
+    def cube(self, pollutants):
+        """``StatsCube``-like view: ``query(city, start, end)`` runs in SQLite."""
+        return _CubeView(self, list(pollutants))
+
+    def trend(self, columns, city=None, start=None, end=None, freq="D"):
+        """Mean of ``columns`` per day/week/month (all cities when ``city`` is None)."""
+        columns = [c for c in columns if c in self.values]
+        if freq == "MS":
+            bucket = "strftime('%Y-%m-01', Date, 'unixepoch')"
+        elif freq == "W":
+            # Weeks end on Sunday as in pandas' "W"; 1970-01-01 was a Thursday
+            bucket = "((Date / 86400 + 3) / 7) * 7 * 86400 + 3 * 86400"
+        else:
+            bucket = "(Date / 86400) * 86400"
+        avgs = ", ".join(f"AVG({_quote(c)}) AS {_quote(c)}" for c in columns)
+        where = "WHERE Date BETWEEN ? AND ?" + (" AND City = ?" if city is not None else "")
+        params = (*self._bounds(start, end),) + ((city,) if city is not None else ())
+        frame = self._read(f"SELECT {bucket} AS Date, {avgs} FROM readings {where} GROUP BY 1 ORDER BY 1", params)
+        if freq == "MS":
+            frame["Date"] = pd.to_datetime(frame["Date"])
+        else:
+            frame["Date"] = pd.to_datetime(frame["Date"].astype("int64"), unit="s")
+        frame["Date"] = frame["Date"].astype("datetime64[ns]")
+        return frame
+
+    def rollups(self, columns):
+        """``Rollups``-like view: ``query(...)`` aggregates in SQLite."""
+        return _RollupView(self, list(columns))
+
+
+class _CubeView:
+    def __init__(self, store, pollutants):
+        self.store, self.pollutants = store, pollutants
+
+    def query(self, city=None, start=None, end=None):
+        # Same whole-day semantics as StatsCube.query (a start after midnight begins the next day)
+        start = None if start is None else pd.Timestamp(start).ceil("D")
+        end = None if end is None else pd.Timestamp(end).floor("D") + pd.Timedelta(days=1) - pd.Timedelta(1, "s")
+        return self.store.summary(city, start, end, self.pollutants)
+
+
+class _RollupView:
+    def __init__(self, store, columns):
+        self.store, self.columns = store, columns
+
+    def query(self, city=None, start=None, end=None, budget=MAX_POINTS, method="lttb"):
+        lo, hi = self.store.date_bounds()
+        start = lo if start is None else max(pd.Timestamp(start), lo)
+        end = hi if end is None else pd.Timestamp(end)
+        days = max((end - start).days + 1, 1)
+        # Finest level whose bucket count fits each trace's share of the budget
+        per_trace = trace_budget(budget, self.columns)
+        freq = "D" if days <= per_trace else "W" if days / 7 <= per_trace else "MS"
+        frame = self.store.trend(self.columns, city, start, end, freq)
+        return downsample(frame, "Date", self.columns, budget, method), RESOLUTION_LABELS[freq]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or update the SQLite copy of a dataset.")
+    parser.add_argument("--dataset", default=None)
+    args = parser.parse_args()
+    store = SQLStore(args.dataset)
+    rows = store._read("SELECT COUNT(*) AS n FROM readings")["n"].iat[0]
+    print(f"{store.path}: {rows} readings, {len(store.cities)} cities")
+
+
+if __name__ == "__main__":
+    main()
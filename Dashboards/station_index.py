@@ -0,0 +1,164 @@
+"""
+(City, Date) index over the shared dataset.
+
+Rows are kept sorted by City then Date, and each city owns a contiguous
+``[start, stop)`` slice.  A station/time-range query is a dictionary lookup
+plus two binary searches and returns a positional slice of the sorted frame,
+so it never scans or copies the full history.
+
+``StationIndex.from_store`` indexes the memory-mapped store of a dataset
+and ``sync`` adds each partition ``ingest.py`` appended as its own segment,
+so an ingest never re-sorts (or copies) the history.
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_store import build_store, load_partition, read_manifest, resolve_name, to_frame
+
+# Time range selector labels used by the dashboards
+TIME_RANGES = {
+    "Last 24 Hours": pd.Timedelta(hours=24),
+    "Last 3 Days": pd.Timedelta(days=3),
+    "Last 7 Days": pd.Timedelta(days=7),
+    "Last 30 Days": pd.Timedelta(days=30),
+    "All Time": None,
+}
+
+
+class _Segment:
+    """One block of rows sorted by (City, Date) with per-city offsets."""
+
+    def __init__(self, df, city_col, date_col):
+        codes = pd.Categorical(df[city_col]).codes
+        # Dates as int64 nanoseconds so bounds compare exactly
+        dates = df[date_col].to_numpy(dtype="datetime64[ns]").view("i8")
+        if not _is_sorted(codes, dates):
+            order = np.lexsort((dates, codes))
+            df = df.take(order).reset_index(drop=True)
+            codes, dates = codes[order], dates[order]
+        self.df = df
+        self.dates = dates
+
+        # Per-city [start, stop) offsets from the boundaries of the sorted codes
+        cities = df[city_col]
+        bounds = np.flatnonzero(np.diff(codes)) + 1
+        starts = np.concatenate(([0], bounds))
+        stops = np.concatenate((bounds, [len(codes)]))
+        self.offsets = {
+            cities.iat[s]: (int(s), int(e)) for s, e in zip(starts, stops) if e > s
+        }
+
+    def bounds(self, city, start=None, end=None):
+        lo, hi = self.offsets.get(city, (0, 0))
+        if start is not None:
+            lo += int(np.searchsorted(self.dates[lo:hi], start, side="left"))
+        if end is not None:
+            hi = lo + int(np.searchsorted(self.dates[lo:hi], end, side="right"))
+        return lo, hi
+
+
+class StationIndex:
+    """
+    Index over one or more row segments.  The base dataset is one segment;
+    ``extend`` adds each newly ingested partition as its own small segment,
+    so the existing history is never re-sorted.
+    """
+
+    def __init__(self, df=None, city_col="City", date_col="Date"):
+        self.city_col = city_col
+        self.date_col = date_col
+        self.segments = [] if df is None else [_Segment(df, city_col, date_col)]
+        self._synced = (None, set())  # (base mtime, applied partition paths)
+        self._lock = threading.Lock()
+
+    def extend(self, df):
+        """Index newly appended rows (e.g. an ingested partition)."""
+        if len(df):
+            self.segments.append(_Segment(df, self.city_col, self.date_col))
+
+    def sync(self, name=None):
+        """Index the partitions ``ingest.py`` appended to ``name`` since the last call."""
+        name = resolve_name(name)
+        base = os.path.getmtime(build_store(name))
+        with self._lock:
+            mtime, applied = self._synced
+            if mtime != base:
+                # Base store rebuilt (or first sync): start over from it
+                self.segments = [_Segment(to_frame(load_partition(name)), self.city_col, self.date_col)]
+                applied = set()
+            for part in read_manifest(name)["partitions"]:
+                if part["path"] not in applied:
+                    self.extend(to_frame(load_partition(name, part["path"])))
+                    applied.add(part["path"])
+            self._synced = (base, applied)
+        return self
+
+    @classmethod
+    def from_store(cls, name=None):
+        return cls().sync(name)
+
+    @property
+    def cities(self):
+        seen = {}
+        for seg in self.segments:
+            seen.update(dict.fromkeys(seg.offsets))
+        return list(seen)
+
+    def latest(self, city):
+        """Timestamp of the newest reading for ``city`` (``None`` if unknown)."""
+        newest = None
+        for seg in self.segments:
+            lo, hi = seg.offsets.get(city, (0, 0))
+            if hi > lo and (newest is None or seg.dates[hi - 1] > newest):
+                newest = seg.dates[hi - 1]
+        return None if newest is None else pd.Timestamp(int(newest), unit="ns")
+
+    def date_bounds(self):
+        """Oldest and newest reading over all cities."""
+        lo = min(int(seg.dates.min()) for seg in self.segments if len(seg.dates))
+        hi = max(int(seg.dates.max()) for seg in self.segments if len(seg.dates))
+        return pd.Timestamp(lo, unit="ns"), pd.Timestamp(hi, unit="ns")
+
+    def query(self, city, start=None, end=None):
+        """Rows for ``city`` with ``start <= Date <= end``, sorted by Date."""
+        start = None if start is None else pd.Timestamp(start).value
+        end = None if end is None else pd.Timestamp(end).value
+        parts = []
+        for seg in self.segments:
+            lo, hi = seg.bounds(city, start, end)
+            if hi > lo:
+                parts.append(seg.df.iloc[lo:hi])
+        if len(parts) == 1:
+            # Common case: a positional view of one segment, no copy
+            return parts[0]
+        if not parts:
+            return self.segments[0].df.iloc[0:0]
+        return pd.concat(parts).sort_values(self.date_col, kind="stable")
+
+    def window(self, city, time_range):
+        """``(start, end)`` of a ``TIME_RANGES`` label for ``city`` (``None`` = unbounded)."""
+        window = TIME_RANGES.get(time_range)
+        end = self.latest(city)
+        if window is None or end is None:
+            return None, None
+        # Half-open window (end - window, end] so "Last 24 Hours" is one daily reading
+        return end - window + pd.Timedelta(1, "ns"), end
+
+    def query_range(self, city, time_range):
+        """Rows for ``city`` within a ``TIME_RANGES`` label, ending at its latest reading."""
+        start, end = self.window(city, time_range)
+        return self.query(city, start=start, end=end)
+
+
+def _is_sorted(codes, dates):
+    if len(codes) < 2:
+        return True
+    dc = np.diff(codes.astype(np.int64))
+    if (dc < 0).any():
+        return False
+    same_city = dc == 0
+    return bool((dates[1:][same_city] >= dates[:-1][same_city]).all())
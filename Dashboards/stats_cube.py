@@ -0,0 +1,426 @@
+"""
+Materialized statistics cube behind Dashboard1's summary, correlation and
+distribution charts.
+
+For every (city, day) the cube keeps mergeable partial aggregates of each
+pollutant:
+
+* count, sum, sum of squares, min and max,
+* per pollutant pair the pairwise-complete count, sums, sums of squares and
+  cross-product, so ``corr()`` is exact with pandas' pairwise semantics,
+* a log-bucketed histogram sketch (stored sparsely) for quantiles and
+  distribution plots.
+
+The same partials are rolled up per (city, month).  A time-range query is
+answered from the months fully inside the range plus the days at its edges,
+so it merges at most ~60 small partials per segment instead of rescanning
+rows.  Ranges are resolved to whole days.
+
+Quantiles come from the sketch: a value's bucket spans a factor of
+``HIST_RATIO``, so an approximate quantile is within ``sqrt(HIST_RATIO) - 1``
+(~1%) relative error of the order statistic at its rank (absolute
+``HIST_MIN`` near zero).
+
+New data is folded in without touching the existing partials: ``update``
+aggregates just the new rows into a new segment, and ``sync`` does that for
+every partition ``ingest.py`` appended since the last call.
+
+``python stats_cube.py`` checks the cube's summaries against the rows
+``StationIndex`` selects, for every city and time range.
+"""
+
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from data_store import build_store, load_partition, read_manifest, resolve_name, to_frame
+
+PERIOD_SHIFT = 32  # key = city_id << 32 | period (days or months since 1970)
+OPEN_END = 1 << 31  # day number standing in for an unbounded range end
+HIST_MIN = 0.01
+HIST_RATIO = 1.02
+HIST_BINS = int(np.ceil(np.log(1e7) / np.log(HIST_RATIO))) + 1  # bin 0 holds [0, HIST_MIN]
+MAX_SEGMENTS = 16
+
+SUMS = ["n", "s", "ss"]
+PAIR_SUMS = ["n", "si", "sj", "sii", "sjj", "sij"]
+
+
+# -------------------------------------------------
+# Histogram sketch
+# -------------------------------------------------
+def hist_bin(values):
+    """Sketch bucket of each value (NaN must be filtered beforehand)."""
+    v = np.maximum(np.asarray(values, dtype="float64"), HIST_MIN)
+    bins = np.floor(np.log(v / HIST_MIN) / np.log(HIST_RATIO)).astype(np.int64) + 1
+    return np.where(v <= HIST_MIN, 0, np.minimum(bins, HIST_BINS - 1))
+
+
+def bin_value(bins):
+    """Representative value (geometric midpoint) of sketch buckets."""
+    bins = np.asarray(bins)
+    mid = HIST_MIN * HIST_RATIO ** (bins - 0.5)
+    return np.where(bins == 0, HIST_MIN / 2, mid)
+
+
+# -------------------------------------------------
+# Partial aggregates
+# -------------------------------------------------
+def _month_of_day(days):
+    return np.asarray(days).astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+
+
+def _first_day(months):
+    return np.asarray(months).astype("datetime64[M]").astype("datetime64[D]").astype(np.int64)
+
+
+class _Partials:
+    """Partial aggregates per sorted int64 key, plus a sparse histogram."""
+
+    def __init__(self, keys, sums, mins, maxs, pairs, hist):
+        self.keys = keys      # (G,)
+        self.sums = sums      # name -> (G, P)
+        self.mins = mins      # (G, P)
+        self.maxs = maxs      # (G, P)
+        self.pairs = pairs    # name -> (G, K)
+        self.hist = hist      # (key, cell, count) sorted by key; cell = pollutant * HIST_BINS + bin
+
+    @classmethod
+    def from_rows(cls, keys, values, pair_index):
+        uniq, inv = np.unique(keys, return_inverse=True)
+        g = len(uniq)
+        present = ~np.isnan(values)
+        filled = np.where(present, values, 0.0)
+
+        def total(w):
+            return np.stack([np.bincount(inv, weights=w[:, k], minlength=g)
+                             for k in range(w.shape[1])], axis=1)
+
+        sums = {"n": total(present.astype("float64")), "s": total(filled), "ss": total(filled ** 2)}
+
+        order = np.argsort(inv, kind="stable")
+        starts = np.searchsorted(inv[order], np.arange(g))
+        with np.errstate(invalid="ignore"):
+            mins = np.fmin.reduceat(values[order], starts, axis=0)
+            maxs = np.fmax.reduceat(values[order], starts, axis=0)
+
+        i, j = pair_index
+        both = present[:, i] & present[:, j]
+        vi, vj = np.where(both, filled[:, i], 0.0), np.where(both, filled[:, j], 0.0)
+        pairs = {"n": total(both.astype("float64")), "si": total(vi), "sj": total(vj),
+                 "sii": total(vi ** 2), "sjj": total(vj ** 2), "sij": total(vi * vj)}
+
+        rows, cols = np.nonzero(present)
+        cells = cols * HIST_BINS + hist_bin(values[rows, cols])
+        hist = _sparse_hist(inv[rows], cells, np.ones(len(rows)), uniq, values.shape[1])
+        return cls(uniq, sums, mins, maxs, pairs, hist)
+
+    @classmethod
+    def concat(cls, parts):
+        return cls(np.concatenate([p.keys for p in parts]),
+                   {k: np.concatenate([p.sums[k] for p in parts]) for k in SUMS},
+                   np.concatenate([p.mins for p in parts]),
+                   np.concatenate([p.maxs for p in parts]),
+                   {k: np.concatenate([p.pairs[k] for p in parts]) for k in PAIR_SUMS},
+                   tuple(np.concatenate([p.hist[n] for p in parts]) for n in range(3)))
+
+    def regroup(self, key_map=None):
+        """Merge partials sharing a key after mapping keys with ``key_map``."""
+        keys = self.keys if key_map is None else key_map(self.keys)
+        order = np.argsort(keys, kind="stable")
+        uniq, starts = np.unique(keys[order], return_index=True)
+        with np.errstate(invalid="ignore"):
+            sums = {k: np.add.reduceat(v[order], starts, axis=0) for k, v in self.sums.items()}
+            pairs = {k: np.add.reduceat(v[order], starts, axis=0) for k, v in self.pairs.items()}
+            mins = np.fmin.reduceat(self.mins[order], starts, axis=0)
+            maxs = np.fmax.reduceat(self.maxs[order], starts, axis=0)
+        hkeys, cells, counts = self.hist
+        if key_map is not None:
+            hkeys = key_map(hkeys)
+        group = np.searchsorted(uniq, hkeys)
+        hist = _sparse_hist(group, cells, counts, uniq, self.mins.shape[1])
+        return _Partials(uniq, sums, mins, maxs, pairs, hist)
+
+    def span(self, lo_key, hi_key):
+        """Row and histogram slices for keys in ``[lo_key, hi_key]``."""
+        rows = slice(int(np.searchsorted(self.keys, lo_key, side="left")),
+                     int(np.searchsorted(self.keys, hi_key, side="right")))
+        hist = slice(int(np.searchsorted(self.hist[0], lo_key, side="left")),
+                     int(np.searchsorted(self.hist[0], hi_key, side="right")))
+        return rows, hist
+
+
+def _sparse_hist(group, cells, counts, keys, n_pollutants):
+    """Sum ``counts`` per (group, cell) and return them sorted by key."""
+    n_cells = n_pollutants * HIST_BINS
+    uniq, inv = np.unique(group.astype(np.int64) * n_cells + cells, return_inverse=True)
+    totals = np.bincount(inv, weights=counts, minlength=len(uniq))
+    return keys[uniq // n_cells], uniq % n_cells, totals
+
+
+class _Segment:
+    """Day and month partials of one batch of rows."""
+
+    def __init__(self, days):
+        self.days = days
+        self.months = days.regroup(_to_months)
+
+
+def _to_months(keys):
+    city = keys >> PERIOD_SHIFT
+    return (city << PERIOD_SHIFT) | _month_of_day(keys & ((1 << PERIOD_SHIFT) - 1))
+
+
+# -------------------------------------------------
+# Query results
+# -------------------------------------------------
+class Summary:
+    """Merged aggregates of one query; every statistic is O(pollutants) to read."""
+
+    def __init__(self, pollutants, pairs, sums, mins, maxs, pair_sums, hist):
+        self.pollutants = pollutants
+        self._pairs = pairs
+        self._sums = sums
+        self._hist = hist.reshape(len(pollutants), HIST_BINS)
+        n = sums["n"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            self.count = pd.Series(n.astype(np.int64), index=pollutants)
+            self.mean = pd.Series(sums["s"] / n, index=pollutants)
+            var = (sums["ss"] - sums["s"] ** 2 / n) / (n - 1)
+            self.std = pd.Series(np.sqrt(np.maximum(var, 0)), index=pollutants)
+        self.min = pd.Series(mins, index=pollutants)
+        self.max = pd.Series(maxs, index=pollutants)
+        self.corr = self._corr(pair_sums)
+
+    def _corr(self, ps):
+        n = ps["n"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = ps["sij"] - ps["si"] * ps["sj"] / n
+            var_i = ps["sii"] - ps["si"] ** 2 / n
+            var_j = ps["sjj"] - ps["sj"] ** 2 / n
+            r = np.clip(cov / np.sqrt(var_i * var_j), -1, 1)
+        p = len(self.pollutants)
+        out = np.eye(p)
+        out[np.diag(self.count.to_numpy() < 2)] = np.nan
+        i, j = self._pairs
+        r = np.where(n >= 2, r, np.nan)
+        out[i, j] = out[j, i] = r
+        return pd.DataFrame(out, index=self.pollutants, columns=self.pollutants)
+
+    def quantile(self, pollutant, q):
+        """Approximate ``q`` quantile(s) of ``pollutant`` from the sketch."""
+        p = self.pollutants.index(pollutant)
+        counts = self._hist[p]
+        n = counts.sum()
+        if n == 0:
+            return np.nan if np.ndim(q) == 0 else np.full(len(q), np.nan)
+        # Same rank convention as the default linear interpolation of pandas
+        ranks = np.asarray(q, dtype="float64") * (n - 1)
+        bins = np.searchsorted(np.cumsum(counts), ranks, side="right")
+        out = np.clip(bin_value(bins), self.min.iat[p], self.max.iat[p])
+        return float(out) if np.ndim(q) == 0 else out
+
+    def median(self, pollutant):
+        return self.quantile(pollutant, 0.5)
+
+    def histogram(self, pollutant, nbins=20):
+        """``nbins`` equal-width bins between min and max, re-binned from the sketch."""
+        p = self.pollutants.index(pollutant)
+        counts = self._hist[p]
+        lo, hi = self.min.iat[p], self.max.iat[p]
+        if not counts.sum() or not np.isfinite(lo):
+            return pd.DataFrame(columns=["Start", "End", "Count"])
+        edges = np.linspace(lo, hi if hi > lo else lo + 1, nbins + 1)
+        values = np.clip(bin_value(np.flatnonzero(counts)), lo, hi)
+        total, _ = np.histogram(values, bins=edges, weights=counts[counts > 0])
+        return pd.DataFrame({"Start": edges[:-1], "End": edges[1:], "Count": total.astype(np.int64)})
+
+    def describe(self, pollutant):
+        """The statistics of Dashboard1's summary table."""
+        return {
+            "Mean": self.mean[pollutant],
+            "Median": self.median(pollutant),
+            "Max": self.max[pollutant],
+            "Min": self.min[pollutant],
+            "Std Dev": self.std[pollutant],
+            "Data Points": int(self.count[pollutant]),
+        }
+
+
+# -------------------------------------------------
+# Cube
+# -------------------------------------------------
+class StatsCube:
+    """
+    Per (city, day) and (city, month) partial aggregates of ``pollutants``.
+    Without a ``city_col`` all rows belong to one city, ``None``.
+    """
+
+    def __init__(self, df=None, pollutants=None, city_col="City", date_col="Date"):
+        self.pollutants = list(pollutants) if pollutants is not None else None
+        self.city_col = city_col
+        self.date_col = date_col
+        self.pairs = None
+        self.cities = {}
+        self.segments = []
+        self._synced = (None, set())  # (base mtime, applied partition paths)
+        self._lock = threading.Lock()
+        if df is not None:
+            self.update(df)
+
+    def _encode(self, df):
+        if self.city_col is None:
+            ids = np.zeros(len(df), dtype=np.int64)
+            self.cities.setdefault(None, 0)
+        else:
+            names = df[self.city_col].astype(str)
+            for city in pd.unique(names):
+                self.cities.setdefault(city, len(self.cities))
+            ids = names.map(self.cities).to_numpy(dtype=np.int64)
+        days = df[self.date_col].to_numpy(dtype="datetime64[D]").astype(np.int64)
+        return (ids << PERIOD_SHIFT) | days
+
+    def update(self, df):
+        """Fold new rows into the cube as one more segment."""
+        if self.pollutants is None:
+            self.pollutants = [c for c in df.columns if pd.api.types.is_float_dtype(df[c])]
+        if self.pairs is None:
+            self.pairs = np.triu_indices(len(self.pollutants), k=1)
+        rows = df[df[self.date_col].notna()]
+        if rows.empty:
+            return
+        values = np.column_stack([
+            rows[p].to_numpy(dtype="float64", na_value=np.nan) if p in rows.columns
+            else np.full(len(rows), np.nan) for p in self.pollutants])
+        days = _Partials.from_rows(self._encode(rows), values, self.pairs)
+        self.segments.append(_Segment(days))
+        if len(self.segments) > MAX_SEGMENTS:
+            merged = _Partials.concat([s.days for s in self.segments]).regroup()
+            self.segments = [_Segment(merged)]
+
+    def sync(self, name=None):
+        """Fold in the partitions ``ingest.py`` appended since the last call."""
+        name = resolve_name(name)
+        base = os.path.getmtime(build_store(name))
+        with self._lock:
+            mtime, applied = self._synced
+            if mtime != base:
+                # Base store rebuilt (or first sync): start over from it
+                self.cities, self.segments, applied = {}, [], set()
+                self.update(to_frame(load_partition(name)))
+            for part in read_manifest(name)["partitions"]:
+                if part["path"] not in applied:
+                    self.update(to_frame(load_partition(name, part["path"])))
+                    applied.add(part["path"])
+            self._synced = (base, applied)
+        return self
+
+    @classmethod
+    def from_store(cls, name=None, pollutants=None):
+        return cls(pollutants=pollutants).sync(name)
+
+    def _pieces(self, cid, start, end):
+        """``(level, lo_key, hi_key)`` pieces covering days ``start..end`` of city ``cid``."""
+        base = cid << PERIOD_SHIFT
+        m0 = _month_of_day(start - 1) + 1  # first month starting on/after start
+        m1 = _month_of_day(end + 1) - 1    # last month ending on/before end
+        if m0 > m1:
+            return [("days", base | start, base | end)]
+        first, after = _first_day(m0), _first_day(m1 + 1)
+        pieces = [("months", base | int(m0), base | int(m1))]
+        if start < first:
+            pieces.append(("days", base | start, base | int(first - 1)))
+        if after <= end:
+            pieces.append(("days", base | int(after), base | end))
+        return pieces
+
+    def query(self, city=None, start=None, end=None):
+        """
+        ``Summary`` of ``city`` for dates ``start`` to ``end`` (inclusive),
+        resolved to the whole days inside the range: a start after midnight
+        begins on the next day, as with ``StationIndex.window``'s half-open
+        windows.
+        """
+        pollutants = self.pollutants or []
+        pairs = self.pairs if self.pairs is not None else np.triu_indices(len(pollutants), k=1)
+        p, k = len(pollutants), len(pairs[0])
+        sums = {n: np.zeros(p) for n in SUMS}
+        pair_sums = {n: np.zeros(k) for n in PAIR_SUMS}
+        mins, maxs = np.full(p, np.nan), np.full(p, np.nan)
+        hist = np.zeros(p * HIST_BINS)
+
+        cid = self.cities.get(None if self.city_col is None else str(city))
+        start = 0 if start is None else _day(pd.Timestamp(start).ceil("D"))
+        end = OPEN_END if end is None else _day(end)
+        for seg in self.segments if cid is not None else []:
+            for level, lo, hi in self._pieces(cid, start, end):
+                part = getattr(seg, level)
+                rows, hrows = part.span(lo, hi)
+                if rows.stop > rows.start:
+                    for n in SUMS:
+                        sums[n] += part.sums[n][rows].sum(axis=0)
+                    for n in PAIR_SUMS:
+                        pair_sums[n] += part.pairs[n][rows].sum(axis=0)
+                    with np.errstate(invalid="ignore"):
+                        mins = np.fmin(mins, np.fmin.reduce(part.mins[rows], axis=0))
+                        maxs = np.fmax(maxs, np.fmax.reduce(part.maxs[rows], axis=0))
+                if hrows.stop > hrows.start:
+                    hist += np.bincount(part.hist[1][hrows], weights=part.hist[2][hrows],
+                                        minlength=p * HIST_BINS)
+        return Summary(pollutants, pairs, sums, mins, maxs, pair_sums, hist)
+
+
+def _day(ts):
+    return int(pd.Timestamp(ts).to_datetime64().astype("datetime64[D]").astype(np.int64))
+
+
+# -------------------------------------------------
+# Consistency check
+# -------------------------------------------------
+def check(df, pollutants, index=None, cube=None):
+    """
+    ``(city, time range, pollutant, statistic, cube, rows)`` for every
+    summary statistic where the cube disagrees with the rows
+    ``StationIndex.window`` selects, over every city and ``TIME_RANGES`` label.
+    """
+    from station_index import StationIndex, TIME_RANGES
+    index = index or StationIndex(df)
+    cube = cube or StatsCube(df, pollutants)
+    mismatches = []
+    for city in index.cities:
+        for time_range in TIME_RANGES:
+            start, end = index.window(city, time_range)
+            rows = index.query(city, start, end)
+            stats = cube.query(city, start, end)
+            for p in pollutants:
+                values = rows[p].dropna()
+                expected = {"Data Points": len(values), "Mean": values.mean(), "Max": values.max(),
+                            "Min": values.min(), "Std Dev": values.std()}
+                got = stats.describe(p)
+                for stat, want in expected.items():
+                    if not np.isclose(got[stat], want, rtol=1e-4, atol=1e-6, equal_nan=True):
+                        mismatches.append((city, time_range, p, stat, got[stat], want))
+    return mismatches
+
+
+def main():
+    import argparse
+    from data_store import load_data
+    parser = argparse.ArgumentParser(description="Check the stats cube against the rows it summarizes.")
+    parser.add_argument("--data", default=None)
+    parser.add_argument("--pollutants", nargs="*", default=["PM2.5", "PM10", "NO2", "CO", "SO2", "O3"])
+    args = parser.parse_args()
+
+    df = load_data(args.data)
+    pollutants = [p for p in args.pollutants if p in df.columns]
+    mismatches = check(df, pollutants)
+    for city, time_range, p, stat, got, want in mismatches:
+        print(f"{city} / {time_range} / {p} {stat}: cube {got}, rows {want}")
+    print(f"{len(mismatches)} mismatches")
+    raise SystemExit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+"""
+Batch training of every city x pollutant x model combination.
+
+Fits are fanned out over a process pool sized to the available cores and
+written to the model registry as they finish, so an interrupted run resumes
+where it stopped: jobs whose data hash is already in the registry are skipped.
+
+    python train_models.py                       # everything
+    python train_models.py --cities Delhi Mumbai --models ARIMA --timeout 300
+    python train_models.py --update --cities Delhi   # online update after new data
+"""
+
+import argparse
+import os
+import signal
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from data_store import load_data
+from station_index import StationIndex
+from forecasting import (MODELS, POLLUTANTS, REGISTRY_DIR, ModelRegistry, city_series, data_hash, train,
+                         update)
+from backends import available
+
+MIN_OBSERVATIONS = 30
+
+
+class JobTimeout(Exception):
+    pass
+
+
+def _on_alarm(signum, frame):
+    raise JobTimeout()
+
+
+def run_job(series, city, pollutant, model, registry_root, timeout):
+    """Train one combination in a worker process and report its outcome."""
+    warnings.filterwarnings("ignore")
+    registry = ModelRegistry(registry_root)
+    row = {"City": city, "Pollutant": pollutant, "Model": model,
+           "Status": "trained", "RMSE": None, "MAE": None, "Seconds": 0.0, "Error": ""}
+    started = time.time()
+
+    if registry.get(city, pollutant, model, data_hash(series)) is not None:
+        row["Status"] = "cached"
+
+    # SIGALRM is POSIX only; elsewhere jobs run without a hard time limit
+    use_alarm = timeout and hasattr(signal, "SIGALRM")
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _on_alarm)
+        signal.alarm(int(timeout))
+    try:
+        entry = train(series, city, pollutant, model, registry=registry)
+        row["RMSE"], row["MAE"] = entry["RMSE"], entry["MAE"]
+    except JobTimeout:
+        row["Status"], row["Error"] = "timeout", f"exceeded {timeout}s"
+    except Exception as exc:
+        row["Status"], row["Error"] = "failed", f"{type(exc).__name__}: {exc}"
+    finally:
+        if use_alarm:
+            signal.alarm(0)
+    row["Seconds"] = round(time.time() - started, 2)
+    return row
+
+
+def build_jobs(df, cities, pollutants, models):
+    index = StationIndex(df)
+    for city in cities or index.cities:
+        for pollutant in pollutants:
+            if pollutant not in df.columns:
+                continue
+            series = city_series(df, city, pollutant, index=index)
+            if len(series) < MIN_OBSERVATIONS:
+                continue
+            for model in models:
+                yield series, city, pollutant, model
+
+
+def train_all(df, cities=None, pollutants=POLLUTANTS, models=MODELS,
+              workers=None, timeout=None, registry_root=REGISTRY_DIR, verbose=True):
+    """Run all jobs over a process pool and return the summary table."""
+    missing = [m for m in models if not available(m)]
+    if missing and verbose:
+        print(f"Skipping {', '.join(missing)}: library not installed", flush=True)
+    models = [m for m in models if m not in missing]
+    jobs = list(build_jobs(df, cities, pollutants, models))
+    workers = workers or os.cpu_count() or 1
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_job, *job, registry_root, timeout) for job in jobs]
+        for done, future in enumerate(as_completed(futures), 1):
+            row = future.result()
+            rows.append(row)
+            if verbose:
+                print(f"[{done}/{len(jobs)}] {row['City']} {row['Pollutant']} {row['Model']}: "
+                      f"{row['Status']} ({row['Seconds']}s)", flush=True)
+    columns = ["City", "Pollutant", "Model", "Status", "RMSE", "MAE", "Seconds", "Error"]
+    return pd.DataFrame(rows, columns=columns).sort_values(["City", "Pollutant", "Model"], ignore_index=True)
+
+
+def update_all(df, cities=None, pollutants=POLLUTANTS, models=MODELS,
+               registry_root=REGISTRY_DIR, verbose=True):
+    """
+    Online-update every trained combination in this process (see
+    ``forecasting.update``); combinations never trained are left alone.
+    """
+    registry = ModelRegistry(registry_root)
+    models = [m for m in models if available(m)]
+    rows = []
+    for series, city, pollutant, model in build_jobs(df, cities, pollutants, models):
+        row = {"City": city, "Pollutant": pollutant, "Model": model, "Status": "untrained",
+               "New": 0, "Drift RMSE": None, "RMSE": None, "Seconds": 0.0, "Error": ""}
+        started = time.time()
+        if registry.get(city, pollutant, model, data_hash(series)) is not None:
+            row["Status"] = "cached"
+        elif registry.latest(city, pollutant, model) is not None:
+            try:
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    entry = update(series, city, pollutant, model, registry)
+            except Exception as exc:
+                row["Status"], row["Error"] = "failed", f"{type(exc).__name__}: {exc}"
+            else:
+                info = entry.get("update", {})
+                row["Status"] = info.get("mode", "refit")
+                row["New"], row["Drift RMSE"], row["RMSE"] = info.get("new_obs", 0), info.get("drift_rmse"), entry["RMSE"]
+        row["Seconds"] = round(time.time() - started, 2)
+        rows.append(row)
+        if verbose and row["Status"] != "untrained":
+            print(f"{city} {pollutant} {model}: {row['Status']} ({row['Seconds']}s)", flush=True)
+    columns = ["City", "Pollutant", "Model", "Status", "New", "Drift RMSE", "RMSE", "Seconds", "Error"]
+    return pd.DataFrame(rows, columns=columns)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train all forecasting models in parallel.")
+    parser.add_argument("--data", default=None, help="CSV to train on (defaults to the cleaned dataset)")
+    parser.add_argument("--cities", nargs="*", default=None)
+    parser.add_argument("--pollutants", nargs="*", default=POLLUTANTS)
+    parser.add_argument("--models", nargs="*", default=MODELS, choices=MODELS)
+    parser.add_argument("--workers", type=int, default=None, help="defaults to the number of cores")
+    parser.add_argument("--timeout", type=float, default=None, help="per-job limit in seconds")
+    parser.add_argument("--registry", default=REGISTRY_DIR)
+    parser.add_argument("--summary", default=None, help="optional CSV path for the summary table")
+    parser.add_argument("--update", action="store_true",
+                        help="update trained models with new observations instead of training")
+    args = parser.parse_args()
+
+    if args.update:
+        summary = update_all(load_data(args.data), args.cities, args.pollutants, args.models, args.registry)
+    else:
+        summary = train_all(load_data(args.data), args.cities, args.pollutants, args.models,
+                            args.workers, args.timeout, args.registry)
+    print()
+    print(summary.drop(columns="Error").to_string(index=False))
+    print()
+    print(summary["Status"].value_counts().to_string())
+    if args.summary:
+        summary.to_csv(args.summary, index=False)
+
+
+if __name__ == "__main__":
+    main()